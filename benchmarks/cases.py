@@ -0,0 +1,305 @@
+"""
+The models measured by the benchmark suite, adapted from the tests in
+tests_dolfin of the same names so that the mesh size n and the number of
+timesteps can be varied.
+
+A case builds its function spaces in setup(n, steps), runs the model from
+the control value in forward(m), and defines the functional of the
+resulting state in functional(u). The forward run is annotated or not
+depending on the annotation state it is called in.
+"""
+from dolfin import *
+from dolfin_adjoint import *
+
+
+class Case(object):
+    #: The name of the case, as used on the command line and in the results
+    name = None
+    #: The (n, steps) pairs it is measured at
+    sizes = []
+    #: Whether the Hessian action is measured
+    hessian = True
+    #: The adjoint parameters the case sets during its measurement
+    parameters = {}
+
+    def setup(self, n, steps):
+        raise NotImplementedError
+
+    def initial_control(self):
+        '''Return a new Function with the initial value of the control.'''
+        raise NotImplementedError
+
+    def forward(self, m):
+        raise NotImplementedError
+
+    def functional(self, u):
+        return Functional(inner(u, u)*dx*dt[FINISH_TIME])
+
+    def control(self, m):
+        return Control(m)
+
+    def extra(self, rf, m):
+        '''Return a dictionary mapping the names of further metrics to
+        functions; the harness times one call of each.'''
+        return {}
+
+
+class Heat(Case):
+    name = "heat"
+    sizes = [(8, 10), (16, 20), (32, 40)]
+
+    def setup(self, n, steps):
+        self.mesh = UnitSquareMesh(n, n)
+        self.V = FunctionSpace(self.mesh, "CG", 1)
+        self.steps = steps
+        self.f = Expression("x[0]*(x[0]-1)*x[1]*(x[1]-1)", degree=4)
+
+    def initial_control(self):
+        return interpolate(Expression("sin(pi*x[0])*sin(pi*x[1])", degree=2), self.V, name="InitialCondition")
+
+    def forward(self, m):
+        u = TrialFunction(self.V)
+        v = TestFunction(self.V)
+        u_0 = m.copy(deepcopy=True, name="Solution")
+
+        timestep = Constant(1.0/self.steps)
+        F = ((u - u_0)/timestep*v + inner(grad(u), grad(v)) + self.f*v)*dx
+        bc = DirichletBC(self.V, 1.0, "on_boundary")
+        (a, L) = (lhs(F), rhs(F))
+
+        for i in range(self.steps):
+            solve(a == L, u_0, bc)
+            adj_inc_timestep()
+        return u_0
+
+
+class BurgersNewton(Case):
+    name = "burgers_newton"
+    sizes = [(30, 6), (60, 12), (120, 24)]
+    parameters = {"cache_factorizations": True}
+
+    def setup(self, n, steps):
+        self.mesh = UnitIntervalMesh(n)
+        self.V = FunctionSpace(self.mesh, "CG", 2)
+        self.steps = steps
+
+    def initial_control(self):
+        return project(Expression("sin(2*pi*x[0])", degree=1), self.V, name="Velocity", annotate=False)
+
+    def forward(self, m):
+        u_ = m.copy(deepcopy=True, name="VelocityState")
+        u = Function(self.V, name="VelocityNext")
+        v = TestFunction(self.V)
+
+        nu = Constant(0.0001)
+        timestep = Constant(0.2/self.steps)
+        F = ((u - u_)/timestep*v + u*u.dx(0)*v + nu*u.dx(0)*v.dx(0))*dx
+        bc = DirichletBC(self.V, 0.0, "on_boundary")
+
+        for i in range(self.steps):
+            solve(F == 0, u, bc)
+            u_.assign(u)
+            adj_inc_timestep()
+        return u_
+
+
+class TaylorHessian(BurgersNewton):
+    '''The Taylor test of the gradient and the Hessian of burgers_newton.'''
+    name = "taylor_hessian"
+    sizes = [(30, 6), (60, 12)]
+
+    def extra(self, rf, m):
+        direction = interpolate(Expression("cos(x[0])", degree=1), self.V)
+        return {"taylor_test": lambda: rf.taylor_test(m, test_hessian=True, seed=1.0e-3,
+                                                      perturbation_direction=direction)}
+
+
+class ShallowWater(Case):
+    '''The linearised rotating shallow water equations with a theta scheme in
+    the P1DG-P2 pair, as in shallow_water.'''
+    name = "shallow_water"
+    sizes = [(6, 2), (12, 4), (24, 8)]
+
+    def setup(self, n, steps):
+        self.mesh = UnitSquareMesh(n, n)
+        ele = MixedElement([VectorElement("DG", triangle, 1), FiniteElement("CG", triangle, 2)])
+        self.W = FunctionSpace(self.mesh, ele)
+        self.steps = steps
+
+    def initial_control(self):
+        ic = Expression(("0.0", "0.0", "0.05*exp(-50*((x[0]-0.5)*(x[0]-0.5) + (x[1]-0.5)*(x[1]-0.5)))"), degree=2)
+        return interpolate(ic, self.W, name="InitialState")
+
+    def forward(self, m):
+        (u, h) = TrialFunctions(self.W)
+        (v, q) = TestFunctions(self.W)
+        state = m.copy(deepcopy=True, name="State")
+        tmpstate = Function(self.W, name="NextState")
+
+        (g, depth, f, theta) = (Constant(10.0), Constant(5.0), Constant(1.0), 0.5)
+        timestep = 0.1
+        M = (inner(v, u) + q*h)*dx
+        G = (f*inner(v, as_vector((-u[1], u[0]))) + g*inner(v, grad(h)) - depth*inner(grad(q), u))*dx
+
+        A = M + theta*timestep*G
+        A_r = M - (1 - theta)*timestep*G
+        for i in range(self.steps):
+            solve(A == action(A_r, state), tmpstate)
+            state.assign(tmpstate)
+            adj_inc_timestep()
+        return state
+
+
+class NavierStokes(Case):
+    '''Chorin's splitting method with preassembled operators, as in
+    navier_stokes.'''
+    name = "navier_stokes"
+    sizes = [(8, 5), (16, 10), (32, 10)]
+
+    def setup(self, n, steps):
+        self.mesh = UnitSquareMesh(n, n)
+        self.V = VectorFunctionSpace(self.mesh, "CG", 2)
+        self.Q = FunctionSpace(self.mesh, "CG", 1)
+        self.steps = steps
+
+    def initial_control(self):
+        return interpolate(Constant((0.0, 0.0)), self.V, name="Velocity")
+
+    def forward(self, m):
+        (V, Q) = (self.V, self.Q)
+        (u, p) = (TrialFunction(V), TrialFunction(Q))
+        (v, q) = (TestFunction(V), TestFunction(Q))
+        (timestep, nu) = (0.01, 0.01)
+
+        p_in = Expression("sin(3.0*t)", t=0.0, degree=1)
+        noslip = DirichletBC(V, (0, 0),
+                             "on_boundary && \
+                              (x[0] < DOLFIN_EPS | x[1] < DOLFIN_EPS | \
+                              (x[0] > 0.5 - DOLFIN_EPS && x[1] > 0.5 - DOLFIN_EPS))")
+        inflow = DirichletBC(Q, p_in, "x[1] > 1.0 - DOLFIN_EPS")
+        outflow = DirichletBC(Q, 0, "x[0] > 1.0 - DOLFIN_EPS")
+        (bcu, bcp) = ([noslip], [inflow, outflow])
+
+        u0 = m.copy(deepcopy=True, name="VelocityState")
+        u1 = Function(V, name="VelocityNext")
+        p1 = Function(Q, name="Pressure")
+
+        k = Constant(timestep)
+        F1 = (1/k)*inner(u - u0, v)*dx + inner(grad(u0)*u0, v)*dx + nu*inner(grad(u), grad(v))*dx
+        (a1, L1) = (lhs(F1), rhs(F1))
+        (a2, L2) = (inner(grad(p), grad(q))*dx, -(1/k)*div(u1)*q*dx)
+        (a3, L3) = (inner(u, v)*dx, inner(u1, v)*dx - k*inner(grad(p1), v)*dx)
+
+        (A1, A2, A3) = (assemble(a1), assemble(a2), assemble(a3))
+        prec = "amg" if has_krylov_solver_preconditioner("amg") else "default"
+
+        t = timestep
+        for i in range(self.steps):
+            p_in.t = t
+
+            b1 = assemble(L1)
+            [bc.apply(A1, b1) for bc in bcu]
+            solve(A1, u1.vector(), b1, "gmres", "default")
+
+            b2 = assemble(L2)
+            [bc.apply(A2, b2) for bc in bcp]
+            solve(A2, p1.vector(), b2, "gmres", prec)
+
+            b3 = assemble(L3)
+            [bc.apply(A3, b3) for bc in bcu]
+            solve(A3, u1.vector(), b3, "gmres", "default")
+
+            u0.assign(u1)
+            t += timestep
+            adj_inc_timestep()
+        return u0
+
+
+class Stokes(Case):
+    '''A stationary Stokes flow driven by the temperature, coupled to a
+    time-dependent advection-diffusion equation, as in stokes.'''
+    name = "stokes"
+    sizes = [(8, 5), (16, 10), (32, 10)]
+
+    def setup(self, n, steps):
+        self.mesh = UnitSquareMesh(n, n)
+        self.X = FunctionSpace(self.mesh, "CG", 1)
+        self.W = FunctionSpace(self.mesh, MixedElement([VectorElement("CG", triangle, 2), FiniteElement("CG", triangle, 1)]))
+        self.steps = steps
+
+    def initial_control(self):
+        T0 = Expression("0.5*(1.0 - x[1]*x[1]) + 0.01*cos(pi*x[0])*sin(pi*x[1])", degree=1)
+        return interpolate(T0, self.X, name="InitialCondition")
+
+    def forward(self, m):
+        (W, X) = (self.W, self.X)
+        flow_bcs = [DirichletBC(W.sub(0), (0.0, 0.0), "near(x[1], 0.0)"),
+                    DirichletBC(W.sub(0), (0.0, 0.0), "near(x[1], 1.0)"),
+                    DirichletBC(W.sub(0).sub(0), 0.0, "near(x[0], 0.0)"),
+                    DirichletBC(W.sub(0).sub(0), 0.0, "near(x[0], 1.0)")]
+        temp_bcs = [DirichletBC(X, 0.0, "near(x[1], 1.0)")]
+
+        T_ = m.copy(deepcopy=True, name="T_")
+        T = m.copy(deepcopy=True, name="T")
+        w = Function(W, name="Flow")
+        (u, p) = split(w)
+
+        (Ra, nu, kappa, timestep) = (Constant(1.e4), Constant(1.0), Constant(1.0), 0.1)
+
+        (uu, pp) = TrialFunctions(W)
+        (v, q) = TestFunctions(W)
+        flow_a = (nu*inner(grad(uu), grad(v)) + pp*div(v) + q*div(uu))*dx
+        flow_L = inner(as_vector((Ra*T_, 0)), v)*dx
+
+        t = TrialFunction(X)
+        s = TestFunction(X)
+        F = ((t - T_)/timestep*s + inner(kappa*grad(t), grad(s)) + dot(u, grad(t))*s)*dx - s*dx
+        (temp_a, temp_L) = system(F)
+
+        for i in range(self.steps):
+            solve(flow_a == flow_L, w, flow_bcs)
+            solve(temp_a == temp_L, T, temp_bcs)
+            T_.assign(T)
+            adj_inc_timestep()
+        return T_
+
+
+class OptimalControlBFGS(Case):
+    '''The stationary distributed control of the Poisson equation of
+    optimal_control_bfgs, on a unit square; steps is the number of L-BFGS-B
+    iterations.'''
+    name = "optimal_control_bfgs"
+    sizes = [(16, 5), (32, 5), (64, 5)]
+    hessian = False
+
+    def setup(self, n, steps):
+        self.mesh = UnitSquareMesh(n, n)
+        self.V = FunctionSpace(self.mesh, "CG", 1)
+        self.steps = steps
+
+    def initial_control(self):
+        return interpolate(Constant(-5), self.V, name="Control")
+
+    def forward(self, m):
+        u = Function(self.V, name="State")
+        v = TestFunction(self.V)
+        F = (inner(grad(u), grad(v)) - m*v)*dx
+        bc = DirichletBC(self.V, 0.0, "on_boundary")
+        solve(F == 0, u, bc)
+        return u
+
+    def functional(self, u):
+        x = SpatialCoordinate(self.mesh)
+        u_desired = x[0]*(1 - x[0])*x[1]*(1 - x[1])
+        return Functional(0.5*inner(u - u_desired, u - u_desired)*dx*dt[FINISH_TIME])
+
+    def control(self, m):
+        return Control(m, value=m)
+
+    def extra(self, rf, m):
+        return {"optimisation": lambda: minimize(rf, method="L-BFGS-B", bounds=(-1.0, 0.5),
+                                                 options={"disp": False, "maxiter": self.steps})}
+
+
+cases = [Heat(), BurgersNewton(), ShallowWater(), NavierStokes(), Stokes(),
+         OptimalControlBFGS(), TaylorHessian()]
@@ -0,0 +1,195 @@
+"""
+Measures the cost of the annotation, the replay, the gradient and the
+Hessian action of the cases in cases.py, and compares them against stored
+baselines.
+
+For every case and (n, steps) pair, the following metrics are recorded:
+
+  forward            the best wall time of the forward run without annotation
+  annotated_forward  the best wall time of the annotated forward run
+  annotation_overhead  annotated_forward/forward
+  replay             the best wall time of a full replay in ReducedFunctional
+  gradient           the best wall time of ReducedFunctional.derivative
+  gradient_ratio     gradient/forward
+  hessian            the best wall time of a Hessian action
+  peak_memory        the memory high-water mark of a gradient (bytes)
+  *_hit_rate         the hit rates of the annotation and factorisation caches
+                     and of the kept forward operators
+
+plus the metrics defined by the case itself (see Case.extra).
+
+Usage:
+
+  python run_benchmarks.py                        # all cases and sizes
+  python run_benchmarks.py heat stokes --quick    # the smallest size only
+  python run_benchmarks.py --save baselines/machine.json
+  python run_benchmarks.py --compare baselines/machine.json
+
+With --compare, the exit status is 1 if a time or the memory grew beyond
+the tolerance (--tolerance, a factor; default 1.25) or a hit rate dropped
+by more than 0.05. Baselines are only meaningful on the machine they were
+recorded on.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import dolfin
+from dolfin_adjoint import *
+from dolfin_adjoint import caching
+
+from cases import cases
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+def best_time(fn, repeat):
+    '''The best wall time of repeat calls of fn.'''
+    times = []
+    for i in range(repeat):
+        start = clock()
+        fn()
+        times.append(clock() - start)
+    return min(times)
+
+
+def hit_rate(stats):
+    lookups = stats["hits"] + stats["misses"]
+    return float(stats["hits"])/lookups if lookups > 0 else None
+
+
+def measure(case, n, steps, repeat):
+    '''Return the metrics of case at size (n, steps).'''
+    adj_reset()
+    saved = dict((key, parameters["adjoint"][key]) for key in case.parameters)
+    parameters["adjoint"].update(case.parameters)
+    try:
+        case.setup(n, steps)
+        m = case.initial_control()
+        metrics = {}
+
+        with annotations(False):
+            metrics["forward"] = best_time(lambda: case.forward(m), repeat)
+
+        caching.annotations.reset_statistics()
+        times = []
+        for i in range(repeat):
+            adj_reset()
+            m = case.initial_control()
+            start = clock()
+            u = case.forward(m)
+            times.append(clock() - start)
+        metrics["annotated_forward"] = min(times)
+        metrics["annotation_overhead"] = metrics["annotated_forward"]/metrics["forward"]
+        metrics["annotation_cache_hit_rate"] = hit_rate(caching.annotations.statistics())
+
+        rf = ReducedFunctional(case.functional(u), case.control(m))
+        rf(m)
+
+        # Measure a full replay, not the selective one of an unchanged control
+        selective = parameters["adjoint"]["selective_replay"]
+        parameters["adjoint"]["selective_replay"] = False
+        try:
+            metrics["replay"] = best_time(lambda: rf(m), repeat)
+        finally:
+            parameters["adjoint"]["selective_replay"] = selective
+
+        caching.factorisations.reset_statistics()
+        caching.forward_operators.reset_statistics()
+        metrics["gradient"] = best_time(lambda: rf.derivative(forget=False), repeat)
+        metrics["gradient_ratio"] = metrics["gradient"]/metrics["forward"]
+        metrics["factorisation_cache_hit_rate"] = hit_rate(caching.factorisations.statistics())
+        metrics["forward_operator_hit_rate"] = hit_rate(caching.forward_operators.statistics())
+
+        # Sampling the memory slows the sweep down, so it is not timed
+        with adj_memory_high_water() as mark:
+            rf.derivative(forget=False)
+        metrics["peak_memory"] = mark.peak
+
+        if case.hessian:
+            direction = case.initial_control()
+            metrics["hessian"] = best_time(lambda: rf.hessian(direction), repeat)
+
+        for (name, fn) in case.extra(rf, m).items():
+            metrics[name] = best_time(fn, 1)
+    finally:
+        parameters["adjoint"].update(saved)
+        adj_reset()
+
+    return metrics
+
+
+def key(case, n, steps):
+    return "%s/n=%d/steps=%d" % (case.name, n, steps)
+
+
+def compare(results, baseline, tolerance):
+    '''Return the list of the regressions of results with respect to baseline.'''
+    regressions = []
+    for (name, metrics) in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for (metric, value) in sorted(metrics.items()):
+            old = baseline[name].get(metric)
+            if old is None or value is None:
+                continue
+            if metric.endswith("hit_rate"):
+                if value < old - 0.05:
+                    regressions.append("%s %s: %.3f -> %.3f" % (name, metric, old, value))
+            elif old > 0 and value > tolerance*old:
+                regressions.append("%s %s: %.4g -> %.4g (x%.2f)" % (name, metric, old, value, value/old))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks of the dolfin-adjoint annotation, replay, gradient and Hessian costs.")
+    parser.add_argument("cases", nargs="*", help="the cases to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="only run the smallest size of each case")
+    parser.add_argument("--repeat", type=int, default=3, help="the number of repetitions of each timing")
+    parser.add_argument("--save", help="write the results to this JSON file, for use as a baseline")
+    parser.add_argument("--compare", help="compare the results with this baseline file")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="the factor by which a cost may grow")
+    args = parser.parse_args(argv)
+
+    selected = [case for case in cases if not args.cases or case.name in args.cases]
+    unknown = set(args.cases) - set(case.name for case in cases)
+    if unknown:
+        parser.error("unknown cases: %s" % ", ".join(sorted(unknown)))
+
+    results = {}
+    for case in selected:
+        for (n, steps) in (case.sizes[:1] if args.quick else case.sizes):
+            name = key(case, n, steps)
+            print("Running %s" % name)
+            results[name] = measure(case, n, steps, args.repeat)
+            for (metric, value) in sorted(results[name].items()):
+                print("  %-30s %s" % (metric, value))
+
+    output = {"machine": platform.node(),
+              "platform": platform.platform(),
+              "dolfin": dolfin.__version__,
+              "results": results}
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(output, f, indent=1, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != output["machine"]:
+            print("Warning: the baseline was recorded on %s" % baseline.get("machine"))
+
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("Regression: %s" % regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,101 @@
+"""
+Measures the vector operations that dolfin-adjoint applies to every dof of
+the controls and the adjoint vectors, on a control of about n^2 dofs
+(a million for the default n = 1000):
+
+  set_random   adjlinalg.Vector.set_random
+  set_values   adjlinalg.Vector.set_values
+  get_values   adjlinalg.Vector.get_values
+  axpy         adjlinalg.Vector.axpy into an empty Vector (its first add)
+  get_global   reduced_functional_numpy.get_global of the control
+  set_local    reduced_functional_numpy.set_local of the control
+
+Usage:
+
+  python vector_operations.py                    # n = 1000
+  python vector_operations.py --n 500 --repeat 10
+  python vector_operations.py --save baselines/machine-vectors.json
+  python vector_operations.py --compare baselines/machine-vectors.json
+
+The baselines are compared as in run_benchmarks.py.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import platform
+import sys
+
+import numpy
+import dolfin
+from dolfin_adjoint import *
+from dolfin_adjoint import adjlinalg
+from dolfin_adjoint.reduced_functional_numpy import get_global, set_local
+
+from run_benchmarks import best_time, compare
+
+
+def measure(n, repeat):
+    '''Return the metrics of the vector operations on a CG1 control on an
+    n x n mesh.'''
+    mesh = UnitSquareMesh(n, n)
+    V = FunctionSpace(mesh, "CG", 1)
+    m = Function(V, name="Control")
+    x = adjlinalg.Vector(Function(V))
+    x.set_random()
+    array = numpy.empty(x.size())
+    global_array = numpy.random.random(V.dim())
+
+    def axpy():
+        y = adjlinalg.Vector(None)
+        y.axpy(0.5, x)
+
+    metrics = {}
+    metrics["dofs"] = V.dim()
+    metrics["set_random"] = best_time(x.set_random, repeat)
+    metrics["set_values"] = best_time(lambda: x.set_values(array), repeat)
+    metrics["get_values"] = best_time(lambda: x.get_values(array), repeat)
+    metrics["axpy"] = best_time(axpy, repeat)
+    metrics["get_global"] = best_time(lambda: get_global(m), repeat)
+    metrics["set_local"] = best_time(lambda: set_local(m, global_array), repeat)
+    return metrics
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the dolfin-adjoint vector operations.")
+    parser.add_argument("--n", type=int, default=1000, help="the number of cells in each direction of the mesh")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of repetitions of each timing")
+    parser.add_argument("--save", help="write the results to this JSON file, for use as a baseline")
+    parser.add_argument("--compare", help="compare the results with this baseline file")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="the factor by which a cost may grow")
+    args = parser.parse_args(argv)
+
+    name = "vector_operations/n=%d" % args.n
+    results = {name: measure(args.n, args.repeat)}
+    for (metric, value) in sorted(results[name].items()):
+        print("  %-30s %s" % (metric, value))
+
+    output = {"machine": platform.node(),
+              "platform": platform.platform(),
+              "dolfin": dolfin.__version__,
+              "results": results}
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(output, f, indent=1, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != output["machine"]:
+            print("Warning: the baseline was recorded on %s" % baseline.get("machine"))
+
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("Regression: %s" % regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,16 +1,51 @@
 from . import coeffstore
 from . import expressions
+from . import constant
 from . import caching
+from . import storage
+from . import diskio
+from . import memory
 import libadjoint
 from dolfin_adjoint import backend
 
+class Adjointer(libadjoint.Adjointer):
+    '''The libadjoint Adjointer, which additionally records the forward
+    variables each adjoint equation depends on, so that their values can be
+    read back from disk ahead of the adjoint sweep, and the variables each
+    forward equation depends on, so that a change of the controls only
+    invalidates the cached data downstream of them. The values recorded are
+    tracked for adj_memory_report.'''
+
+    def register_equation(self, equation, *args, **kwargs):
+        global tape_value
+        tape_value = None
+        if tape_loading is not None:
+            tape_loading.check(equation)
+
+        storage.record_dependencies(equation)
+        caching.record_inputs(equation)
+        return libadjoint.Adjointer.register_equation(self, equation, *args, **kwargs)
+
+    def record_variable(self, var, storage):
+        memory.record(var, storage)
+        return libadjoint.Adjointer.record_variable(self, var, storage)
+
 # Create the adjointer, the central object that records the forward solve
 # as it happens.
-adjointer = libadjoint.Adjointer()
+adjointer = Adjointer()
 
 mem_checkpoints = set()
 disk_checkpoints = set()
 
+# The checkpointing scheduler driven by dolfin-adjoint itself (see adj_checkpointing)
+checkpointer = None
+
+# The saved tape that is being rebuilt (see tape_files.adj_load_tape)
+tape_loading = None
+# The variable of the last equation annotated while loading a saved tape,
+# and its saved value
+tape_value = None
+
 adj_variables = coeffstore.CoeffStore()
 
 def adj_start_timestep(time=0.0):
@@ -46,6 +81,9 @@ def adj_inc_timestep(time=None, finished=False):
         if time is not None:
             adjointer.time.next(time)
 
+        if checkpointer is not None:
+            checkpointer.end_forward_timestep()
+
         if finished:
             adjointer.time.finish()
 
@@ -57,26 +95,29 @@ function_names = set()
 def adj_check_checkpoints():
     adjointer.check_checkpoints()
 
-def adj_reset_cache():
+def adj_reset_cache(controls=None):
+    '''Discard the cached operators, factorisations and solvers that depend
+    on the values of controls, a list of the controls whose values have
+    changed. By default, all of them are discarded, except for the
+    factorisations in caching.factorisations, which are keyed by the values
+    they depend on.'''
     if backend.parameters["adjoint"]["debug_cache"]:
         backend.info_blue("Resetting solver cache")
 
-    caching.assembled_fwd_forms.clear()
-    caching.assembled_adj_forms.clear()
-    caching.lu_solvers.clear()
-    caching.localsolvers.clear()
+    changes = caching.Changes(controls)
+    caching.invalidate(changes)
 
-    caching.pis_fwd_to_tlm.clear()
-    caching.pis_fwd_to_adj.clear()
+    # The factorisations are keyed by the values they depend on, so they
+    # remain valid; only drop those the last evaluation did not use
+    caching.factorisations.end_evaluation()
 
     if backend.__name__ == "dolfin":
         from .petsc_krylov_solver import reset_petsc_krylov_solvers
         from .krylov_solver import reset_krylov_solvers
-        from . import lusolver
-        lusolver.lu_solvers = [None] * len(lusolver.lu_solvers)
-        lusolver.adj_lu_solvers = [None] * len(lusolver.adj_lu_solvers)
-        reset_petsc_krylov_solvers()
-        reset_krylov_solvers()
+        from .lusolver import reset_lu_solvers
+        reset_lu_solvers(changes)
+        reset_petsc_krylov_solvers(changes)
+        reset_krylov_solvers(changes)
 
 def adj_html(*args, **kwargs):
     '''This routine dumps the current state of the adjglobals.adjointer to a HTML visualisation.
@@ -89,8 +130,19 @@ def adj_html(*args, **kwargs):
 
 def adj_reset():
     '''Forget all annotation, and reset the entire dolfin-adjoint state.'''
+    global checkpointer, tape_loading, tape_value
     adjointer.reset()
-    expressions.expression_attrs.clear()
+    checkpointer = None
+    tape_loading = None
+    tape_value = None
+    storage.dependencies.clear()
+    caching.equation_inputs.clear()
+    del caching.equation_dependencies[:]
+    memory.recorded.clear()
+    caching.annotations.clear()
+    diskio.pool.wait_all()
+    expressions.reset()
+    constant.log.compact()
     adj_variables.__init__()
     function_names.__init__()
     adj_reset_cache()
@@ -1,13 +1,19 @@
 from __future__ import print_function
 import libadjoint
 import backend
+import numpy
 import ufl
 from . import adjglobals
+from . import buffers
 import os
 import os.path
 from . import misc
 from . import caching
 from . import compatibility
+from . import checkpoint_files
+from . import diskio
+from . import profiling
+from . import recycling
 from . import utils
 
 class Vector(libadjoint.Vector):
@@ -18,6 +24,8 @@ class Vector(libadjoint.Vector):
 
     def __init__(self, data, zero=False, fn_space=None):
 
+        # The storage.ForwardStore that owns this vector, if any
+        self._store = None
         self.data = data
         if not (self.data is None or isinstance(self.data, backend.Function) or
                 isinstance(self.data, ufl.Form) or isinstance(self.data,
@@ -33,6 +41,17 @@ class Vector(libadjoint.Vector):
         if fn_space is not None:
             self.fn_space = fn_space
 
+    @property
+    def data(self):
+        # Forward values recorded on the tape may have been spilled to disk
+        if self._store is not None:
+            self._store.touch(self)
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
     def duplicate(self):
 
         if isinstance(self.data, ufl.form.Form):
@@ -75,9 +94,15 @@ class Vector(libadjoint.Vector):
         if (self.data is None):
             # self is an empty form.
             if isinstance(x.data, backend.Function):
-                self.data = x.data.copy(deepcopy=True)
-                self.data.vector()._scale(alpha)
-            if isinstance(x.data, backend.MultiMeshFunction):
+                V = x.data.function_space()
+                if V.dim() == x.data.vector().size():
+                    self.data = backend.Function(V)
+                    self.data.vector().axpy(alpha, x.data.vector())
+                else:
+                    # A subfunction: copy its values out of the parent's
+                    self.data = x.data.copy(deepcopy=True)
+                    self.data.vector()._scale(alpha)
+            elif isinstance(x.data, backend.MultiMeshFunction):
                 self.data = backend.MultiMeshFunction(x.data.function_space(),
                         x.data.vector())
                 self.data.vector()._scale(alpha)
@@ -174,9 +199,8 @@ class Vector(libadjoint.Vector):
         if self.data is None:
             self.data = backend.Function(self.fn_space)
 
-        vec = self.data.vector()
-        for i in range(len(vec)):
-            vec[i] = random.random()
+        with buffers.local_array(self.data.vector()) as array:
+            array[:] = numpy.random.random(array.shape)
 
         self.zero = False
 
@@ -195,72 +219,78 @@ class Vector(libadjoint.Vector):
     def set_values(self, array):
         if isinstance(self.data, backend.MultiMeshFunction):
             raise NotImplementedError
-        if isinstance(self.data, backend.Function):
-            vec = self.data.vector()
-            vec.set_local(array)
-            vec.apply("insert")
+        if isinstance(self.data, backend.Function) or (self.data is None and hasattr(self, 'fn_space')):
+            if self.data is None:
+                self.data = backend.Function(self.fn_space)
+            with buffers.local_array(self.data.vector()) as values:
+                values[:] = array
 
-            self.zero = False
-        elif self.data is None and hasattr(self, 'fn_space'):
-            self.data = backend.Function(self.fn_space)
-            vec = self.data.vector()
-            vec.set_local(array)
             self.zero = False
         else:
             raise libadjoint.exceptions.LibadjointErrorNotImplemented("Don't know how to set values.")
 
     def get_values(self, array):
         if isinstance(self.data, backend.Function):
-            vec = self.data.vector()
-            try:
-                vec.get_local(array)
-            except NotImplementedError:
-                array[:] = vec.get_local()
+            with buffers.local_array(self.data.vector(), write=False) as values:
+                array[:] = values
 
         else:
             raise libadjoint.exceptions.LibadjointErrorNotImplemented("Don't know how to get values.")
 
     def write(self, var):
         filename = str(var)
-        suffix = "h5"
 
         # Change naming scheme for compatibility with HDF5File routines
         filename = filename.replace(":","-")
 
-        #if not os.path.isfile(filename+".%s" % suffix):
-        #  backend.info_red("Warning: Overwriting checkpoint file "+filename+"."+suffix)
-        file = backend.HDF5File(backend.comm_world, filename+".%s" % suffix, "w")
-        file.write(self.data, filename)
-        file.close()
-
         # Save the function space into adjglobals.checkpoint_fs. It will be needed when reading the variable back in.
         adjglobals.checkpoint_fs[filename] = self.data.function_space()
 
+        files = checkpoint_files.get()
+        if files.threaded:
+            # The I/O threads only get a copy of the local values, so the
+            # caller is free to change its data once we return
+            diskio.pool.write(filename, files.write_array, filename, self.data.vector().get_local())
+        else:
+            diskio.pool.write(filename, files.write, filename, self.data, background=False)
+
     @staticmethod
     def read(var):
         filename = str(var)
         filename = filename.replace(":","-")
-        suffix = "h5"
 
         V = adjglobals.checkpoint_fs[filename]
-        v = backend.Function(V)
-        file = backend.HDF5File(backend.comm_world, filename+".%s" % suffix, "r")
-        file.read(v, filename)
-        file.close()
+        files = checkpoint_files.get()
+        if files.threaded:
+            # A prefetch only reads the raw local values; the Function is
+            # built on the main thread
+            v = checkpoint_files.function_from_array(diskio.pool.read(filename, files.read_array, filename), V)
+        else:
+            v = diskio.pool.read(filename, files.read, filename, V)
 
         return Vector(v)
 
+    @staticmethod
+    def prefetch(var):
+        '''Start reading the value of var from disk in the background, if it
+        has been written there. Return whether it is being read in the
+        background. See :py:mod:`dolfin_adjoint.diskio`.'''
+        filename = str(var)
+        filename = filename.replace(":","-")
+
+        V = adjglobals.checkpoint_fs.get(filename)
+        files = checkpoint_files.get()
+        if not files.threaded or V is None or not (filename in diskio.pool.pending or files.contains(filename)):
+            return False
+        return diskio.pool.prefetch(filename, files.read_array, filename)
+
     @staticmethod
     def delete(var):
-        try:
-            filename = str(var)
-            filename = filename.replace(":","-")
-            suffix = "h5"
+        filename = str(var)
+        filename = filename.replace(":","-")
 
-            import os
-            os.remove(filename+".%s" % suffix)
-        except OSError:
-            pass
+        diskio.pool.forget(filename)
+        checkpoint_files.get().delete(filename)
 
 class Matrix(libadjoint.Matrix):
     '''This class implements the libadjoint.Matrix abstract base class for the Dolfin adjoint.
@@ -284,6 +314,14 @@ class Matrix(libadjoint.Matrix):
 
         self.cache = cache
 
+        # The form and boundary conditions of the forward equation this is
+        # the operator of, if known; see assemble_operator
+        self.forward_form = None
+        self.forward_bcs = None
+        # Whether the operator is known to be its own adjoint; see
+        # caching.is_self_adjoint
+        self.self_adjoint = False
+
     def assemble_data(self):
         assert not isinstance(self.data, IdentityMatrix)
         if backend.__name__ == "firedrake":
@@ -297,20 +335,71 @@ class Matrix(libadjoint.Matrix):
             else:
                 assemble = backend.assemble
         if not self.cache:
-            return assemble(self.data)
+            with profiling.region("operator", "assembly"):
+                return assemble(self.data)
         else:
             if self.data in caching.assembled_adj_forms:
                 if backend.parameters["adjoint"]["debug_cache"]:
                     backend.info_green("Got an assembly cache hit")
+                profiling.count("assembly cache hits")
                 return caching.assembled_adj_forms[self.data]
             else:
                 if backend.parameters["adjoint"]["debug_cache"]:
                     backend.info_red("Got an assembly cache miss")
+                profiling.count("assembly cache misses")
 
-                M = assemble(self.data)
+                with profiling.region("operator", "assembly"):
+                    M = assemble(self.data)
                 caching.assembled_adj_forms[self.data] = M
                 return M
 
+    def stores_forward_operator(self):
+        '''Whether the operators of the forward solves of this matrix are kept
+        in caching.forward_operators.'''
+        return backend.parameters["adjoint"]["transpose_forward_operators"] \
+            and backend.__name__ == "dolfin" \
+            and isinstance(self.data, ufl.Form) \
+            and not hasattr(self.data.arguments()[0], "_V_multi") \
+            and all(isinstance(bc, backend.DirichletBC) for bc in self.bcs)
+
+    def assemble_operator(self, var, bcs):
+        '''Return the operator for the solve of var, with bcs applied.
+
+        The operators of the adjoint and second-order adjoint equations are
+        the transposes of the operators of the forward solves of the last
+        replay, and those of the tangent linear equations are the forward
+        operators themselves (see caching.OperatorStore); they are only
+        assembled if the forward operator is not kept.'''
+        assembled_lhs = None
+        forward_form = getattr(self, "forward_form", None)
+        cached = self.cache and self.data in caching.assembled_adj_forms
+        if var.type != "ADJ_FORWARD" and forward_form is not None and not cached \
+                and backend.parameters["adjoint"]["transpose_forward_operators"]:
+            forward_lhs = caching.forward_operators.lookup(forward_form, self.forward_bcs)
+            if forward_lhs is None:
+                profiling.count("forward operator misses")
+            elif var.type == "ADJ_TLM":
+                profiling.count("forward operator hits")
+                assembled_lhs = forward_lhs
+            else:
+                with profiling.region("operator transpose", "assembly"):
+                    assembled_lhs = compatibility.transpose_matrix(forward_lhs)
+                if assembled_lhs is not None:
+                    profiling.count("forward operator hits")
+                    if self.cache:
+                        caching.assembled_adj_forms[self.data] = assembled_lhs
+
+        if assembled_lhs is None:
+            assembled_lhs = self.assemble_data()
+
+        with profiling.region("operator", "bcs"):
+            [bc.apply(assembled_lhs) for bc in bcs]
+
+        if var.type == "ADJ_FORWARD" and forward_form is not None and self.stores_forward_operator():
+            caching.forward_operators.store(forward_form, self.forward_bcs, assembled_lhs)
+
+        return assembled_lhs
+
     def basic_solve(self, var, b):
         if isinstance(self.data, IdentityMatrix):
             x=b.duplicate()
@@ -342,12 +431,11 @@ class Matrix(libadjoint.Matrix):
                 backend.warning("Warning: got zero RHS for the solve associated with variable %s" % var)
             elif isinstance(b.data, backend.Function):
 
-                assembled_lhs = self.assemble_data()
-                [bc.apply(assembled_lhs) for bc in bcs]
                 assembled_rhs = compatibility.assembled_rhs(b)
-                [bc.apply(assembled_rhs) for bc in bcs]
+                with profiling.region("rhs", "bcs"):
+                    [bc.apply(assembled_rhs) for bc in bcs]
 
-                wrap_solve(assembled_lhs, x.data, assembled_rhs, self.solver_parameters)
+                self.assembled_solve(var, bcs, x, assembled_rhs)
             else:
                 if hasattr(b, 'nonlinear_form'): # was a nonlinear solve
                     x = compatibility.assign_function_to_vector(x, b.nonlinear_u, function_space = test.function_space())
@@ -359,15 +447,69 @@ class Matrix(libadjoint.Matrix):
                         x.data.vector()[:] = float("nan")
 
                 else:
-                    assembled_lhs = self.assemble_data()
-                    [bc.apply(assembled_lhs) for bc in bcs]
-                    assembled_rhs = wrap_assemble(b.data, test)
-                    [bc.apply(assembled_rhs) for bc in bcs]
+                    with profiling.region("rhs", "assembly"):
+                        assembled_rhs = wrap_assemble(b.data, test)
+                    with profiling.region("rhs", "bcs"):
+                        [bc.apply(assembled_rhs) for bc in bcs]
 
-                    wrap_solve(assembled_lhs, x.data, assembled_rhs, self.solver_parameters)
+                    self.assembled_solve(var, bcs, x, assembled_rhs)
 
         return x
 
+    def assembled_solve(self, var, bcs, x, assembled_rhs):
+        '''Assemble the operator, apply the boundary conditions and solve for x.
+        During a block Hessian action, the assembled operators of the tangent
+        linear and (second-order) adjoint equations, and the factorisations
+        of direct solvers, are shared by all directions.'''
+        if var.type == "ADJ_FORWARD" and self.shares_factorisation(bcs):
+            # The forward solves of a self-adjoint operator use the
+            # factorisation of its adjoint solves
+            method = factorisation_method()
+            key = self.factorisation_key(bcs, method, False)
+            if key is not None:
+                factorise = lambda: self.factorise(var, bcs, method)
+                self.factorised_solve(var, key, factorise, x.data.vector(), assembled_rhs)
+                return
+
+        shared = caching.block_operators is not None and var.type in ['ADJ_TLM', 'ADJ_ADJOINT', 'ADJ_SOA']
+        if shared:
+            key = caching.block_canonicalisation(var)
+
+        if shared and key in caching.block_operators:
+            (assembled_lhs, solver) = caching.block_operators[key]
+            profiling.count("block operator hits")
+            if solver is not None:
+                profiling.count("block factorisation hits")
+        else:
+            assembled_lhs = self.assemble_operator(var, bcs)
+
+            solver = None
+            (method, pc) = solver_method(self.solver_parameters)
+            if shared and backend.__name__ == "dolfin" and (method in lu_methods or method == "default"):
+                solver = compatibility.LUSolver(assembled_lhs, "default" if method == "lu" else method)
+                if "lu_solver" in self.solver_parameters:
+                    solver.parameters.update(self.solver_parameters["lu_solver"])
+                solver.parameters["reuse_factorization"] = True
+
+            if shared:
+                caching.block_operators[key] = (assembled_lhs, solver)
+
+        # The Krylov solves of a sweep can start from the solutions of the
+        # previous timesteps
+        (method, pc) = solver_method(self.solver_parameters)
+        iterative = solver is None and backend.__name__ == "dolfin" and not (method in lu_methods or method == "default")
+        nonzero_initial_guess = iterative and recycling.initial_guess(var, x.data.vector(), assembled_lhs, assembled_rhs)
+
+        with profiling.region(str(var), "solve"):
+            if solver is not None:
+                solver.solve(x.data.vector(), assembled_rhs)
+            else:
+                iterations = wrap_solve(assembled_lhs, x.data, assembled_rhs, self.solver_parameters,
+                                        nonzero_initial_guess=nonzero_initial_guess)
+
+        if iterative:
+            recycling.record(var, x.data.vector(), iterations)
+
     def caching_solve(self, var, b):
         if isinstance(self.data, IdentityMatrix):
             output = b.duplicate()
@@ -384,42 +526,103 @@ class Matrix(libadjoint.Matrix):
 
             output = Vector(backend.Function(self.test_function().function_space()))
             #print "b.data is a %s in the solution of %s" % (b.data.__class__, var)
-            if backend.parameters["adjoint"]["symmetric_bcs"] and backend.__version__ > '1.2.0':
-                assembler = backend.SystemAssembler(self.data, b.data, bcs)
-                assembled_rhs = backend.Vector()
-                assembler.assemble(assembled_rhs)
-            elif isinstance(b.data, ufl.Form):
-                assembled_rhs = wrap_assemble(b.data, self.test_function())
-            else:
-                if backend.__name__ == "dolfin":
-                    assembled_rhs = b.data.vector()
+            symmetric_bcs = backend.parameters["adjoint"]["symmetric_bcs"] and backend.__version__ > '1.2.0'
+            with profiling.region("rhs", "assembly"):
+                if symmetric_bcs:
+                    assembler = backend.SystemAssembler(self.data, b.data, bcs)
+                    assembled_rhs = backend.Vector()
+                    assembler.assemble(assembled_rhs)
+                elif isinstance(b.data, ufl.Form):
+                    assembled_rhs = wrap_assemble(b.data, self.test_function())
                 else:
-                    assembled_rhs = b.data
-            [bc.apply(assembled_rhs) for bc in bcs]
-
-            if not var in caching.lu_solvers:
-                if backend.parameters["adjoint"]["debug_cache"]:
-                    backend.info_red("Got a cache miss for %s" % var)
+                    if backend.__name__ == "dolfin":
+                        assembled_rhs = b.data.vector()
+                    else:
+                        assembled_rhs = b.data
+            with profiling.region("rhs", "bcs"):
+                [bc.apply(assembled_rhs) for bc in bcs]
 
-                if backend.parameters["adjoint"]["symmetric_bcs"] and backend.__version__ > '1.2.0':
-                    assembled_lhs = backend.Matrix()
-                    assembler.assemble(assembled_lhs)
-                else:
-                    assembled_lhs = self.assemble_data()
-                    [bc.apply(assembled_lhs) for bc in bcs]
+            solver_method = factorisation_method()
+            factorise = lambda: self.factorise(var, bcs, solver_method, assembler if symmetric_bcs else None)
 
-                solver_method = "mumps" if "mumps" in backend.lu_solver_methods().keys() else "default"
-                caching.lu_solvers[var] = compatibility.LUSolver(assembled_lhs,
-                        solver_method)
-                caching.lu_solvers[var].parameters["reuse_factorization"] = True
+            key = self.factorisation_key(bcs, solver_method, symmetric_bcs)
+            if key is not None:
+                self.factorised_solve(var, key, factorise, output.data.vector(), assembled_rhs)
             else:
-                if backend.parameters["adjoint"]["debug_cache"]:
-                    backend.info_green("Got a cache hit for %s" % var)
+                # The operator depends on something we cannot hash: keep its
+                # factorisation for the current evaluation only
+                hit = var in caching.lu_solvers
+                if not hit:
+                    if backend.parameters["adjoint"]["debug_cache"]:
+                        backend.info_red("Got a cache miss for %s" % var)
+                    caching.lu_solvers[var] = factorise()[0]
+                    caching.record_entry("lu_solvers", caching.lu_canonicalisation(var), [self.data])
+                else:
+                    if backend.parameters["adjoint"]["debug_cache"]:
+                        backend.info_green("Got a cache hit for %s" % var)
+                profiling.count("factorisation cache hits" if hit else "factorisation cache misses")
 
-            caching.lu_solvers[var].solve(output.data.vector(), assembled_rhs)
+                with profiling.region(str(var), "solve" if hit else "factorisation"):
+                    caching.lu_solvers[var].solve(output.data.vector(), assembled_rhs)
 
         return output
 
+    def factorise(self, var, bcs, method, assembler=None):
+        '''Assemble the operator for the solve of var (with the
+        SystemAssembler assembler, if given) and return its LU solver and
+        its size in bytes.'''
+        if assembler is not None:
+            assembled_lhs = backend.Matrix()
+            with profiling.region("operator", "assembly"):
+                assembler.assemble(assembled_lhs)
+        else:
+            assembled_lhs = self.assemble_operator(var, bcs)
+
+        solver = compatibility.LUSolver(assembled_lhs, method)
+        solver.parameters["reuse_factorization"] = True
+        return (solver, caching.matrix_nbytes(assembled_lhs, compatibility.form_comm(self.data)))
+
+    def factorisation_key(self, bcs, method, symmetric_bcs):
+        '''The key of the factorisation of the operator with bcs in
+        caching.factorisations. A self-adjoint operator is keyed by its
+        forward form, so that its forward, tangent linear, adjoint and
+        second-order adjoint solves share one factorisation: with the
+        boundary conditions applied, their operators are the same matrix.'''
+        form = self.data
+        if self.self_adjoint and self.forward_form is not None:
+            form = self.forward_form
+        return caching.factorisation_key(form, bcs, {"method": method, "symmetric_bcs": symmetric_bcs})
+
+    def shares_factorisation(self, bcs):
+        '''Whether the forward solves of this matrix use the factorisations
+        of its adjoint solves.'''
+        (method, pc) = solver_method(self.solver_parameters)
+        return self.self_adjoint and self.forward_form is not None \
+            and backend.parameters["adjoint"]["cache_factorizations"] \
+            and backend.__name__ == "dolfin" \
+            and (method in lu_methods or method == "default") \
+            and all(isinstance(bc, backend.DirichletBC) for bc in bcs)
+
+    def factorised_solve(self, var, key, factorise, x, assembled_rhs):
+        '''Solve for the vector x with the factorisation in
+        caching.factorisations under key. On a miss, factorise() is called
+        and must return the solver and its size in bytes.'''
+        hit = key in caching.factorisations
+        if backend.parameters["adjoint"]["debug_cache"]:
+            if hit:
+                backend.info_green("Got a cache hit for %s" % var)
+            else:
+                backend.info_red("Got a cache miss for %s" % var)
+        profiling.count("factorisation cache hits" if hit else "factorisation cache misses")
+
+        # The first solve with a new solver includes the factorisation
+        solver = caching.factorisations.acquire(key, factorise)
+        try:
+            with profiling.region(str(var), "solve" if hit else "factorisation"):
+                solver.solve(x, assembled_rhs)
+        finally:
+            caching.factorisations.release(key)
+
     def solve(self, var, b):
         if backend.parameters["adjoint"]["cache_factorizations"] and var.type != "ADJ_FORWARD":
             x = self.caching_solve(var, b)
@@ -458,6 +661,8 @@ class Matrix(libadjoint.Matrix):
         self.data+=alpha*x_form
         self.bcs += x.bcs # Err, I hope they are compatible ...
         self.bcs = misc.uniq(self.bcs)
+        self.forward_form = None
+        self.self_adjoint = False
 
     def test_function(self):
         '''test_function(self)
@@ -470,32 +675,45 @@ class IdentityMatrix(object):
     '''Placeholder object for identity matrices'''
     pass
 
-def wrap_solve(A, x, b, solver_parameters):
-    '''Make my own solve, since solve(A, x, b) can't handle other solver_parameters
-    like linear solver tolerances'''
+# Comment. Why does list_lu_solver_methods() not return, a, uhm, list?
+lu_methods = ["lu", "mumps", "umfpack", "spooles", "superlu", "superlu_dist", "pastix", "petsc"]
 
-    # Comment. Why does list_lu_solver_methods() not return, a, uhm, list?
-    lu_solvers = ["lu", "mumps", "umfpack", "spooles", "superlu", "superlu_dist", "pastix", "petsc"]
+def factorisation_method():
+    '''The LU method of the factorisations in caching.factorisations.'''
+    return "mumps" if "mumps" in backend.lu_solver_methods().keys() else "default"
 
-    if backend.__name__ == "dolfin":
-        # dolfin's API for expressing linear_solvers and preconditioners has changed in 1.4. Here I try
-        # to support both.
-        method = solver_parameters.get("linear_solver", "default")
-        pc = solver_parameters.get("preconditioner", "default")
+def solver_method(solver_parameters):
+    '''Return the linear solver and preconditioner named in solver_parameters.'''
+
+    # dolfin's API for expressing linear_solvers and preconditioners has changed in 1.4. Here I try
+    # to support both.
+    method = solver_parameters.get("linear_solver", "default")
+    pc = solver_parameters.get("preconditioner", "default")
 
-        if "nonlinear_solver" in solver_parameters or "newton_solver" in solver_parameters:
-            nonlinear_solver = solver_parameters.get("nonlinear_solver", "newton")
-            sub_options = nonlinear_solver + "_solver"
+    if "nonlinear_solver" in solver_parameters or "newton_solver" in solver_parameters:
+        nonlinear_solver = solver_parameters.get("nonlinear_solver", "newton")
+        sub_options = nonlinear_solver + "_solver"
 
-            if sub_options in solver_parameters:
-                newton_options = solver_parameters[sub_options]
+        if sub_options in solver_parameters:
+            newton_options = solver_parameters[sub_options]
 
-                method = newton_options.get("linear_solver", method)
-                pc = newton_options.get("preconditioner", pc)
+            method = newton_options.get("linear_solver", method)
+            pc = newton_options.get("preconditioner", pc)
+
+    return (method, pc)
+
+def wrap_solve(A, x, b, solver_parameters, nonzero_initial_guess=False):
+    '''Make my own solve, since solve(A, x, b) can't handle other solver_parameters
+    like linear solver tolerances. With nonzero_initial_guess, a Krylov solve
+    starts from the value of x. Returns the number of Krylov iterations, if
+    known.'''
+
+    if backend.__name__ == "dolfin":
+        (method, pc) = solver_method(solver_parameters)
 
         # We get passed in a Function, turn it into a Vector
         x = x.vector()
-        if method in lu_solvers or method == "default":
+        if method in lu_methods or method == "default":
             if method == "lu": method = "default"
             solver = backend.LUSolver(method)
 
@@ -509,9 +727,10 @@ def wrap_solve(A, x, b, solver_parameters):
 
             if "krylov_solver" in solver_parameters:
                 solver.parameters.update(solver_parameters["krylov_solver"])
+            if nonzero_initial_guess:
+                solver.parameters["nonzero_initial_guess"] = True
 
-            solver.solve(A, x, b)
-            return
+            return solver.solve(A, x, b)
     else:
         backend.solve(A, x, b, solver_parameters=solver_parameters)
         return
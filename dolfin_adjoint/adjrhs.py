@@ -4,6 +4,7 @@ import ufl
 import ufl.algorithms
 from . import adjglobals
 from . import adjlinalg
+from . import caching
 from . import utils
 
 def find_previous_variable(var):
@@ -19,7 +20,7 @@ def find_previous_variable(var):
     raise libadjoint.exceptions.LibadjointErrorInvalidInputs('No previous variable found')
 
 def _extract_function_coeffs(form):
-    for c in ufl.algorithms.extract_coefficients(form):
+    for c in caching.form_coefficients(form):
         if isinstance(c, (backend.Function, backend.MultiMeshFunction)):
             yield c
 
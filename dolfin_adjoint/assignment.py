@@ -5,6 +5,7 @@ import libadjoint
 from . import adjlinalg
 from . import adjglobals
 from . import utils
+from . import storage
 
 def register_assign(new, old, op=None):
 
@@ -16,7 +17,7 @@ def register_assign(new, old, op=None):
     dep = adjglobals.adj_variables.next(new)
 
     if backend.parameters["adjoint"]["record_all"] and isinstance(old, backend.Function):
-        adjglobals.adjointer.record_variable(dep, libadjoint.MemoryStorage(adjlinalg.Vector(old)))
+        adjglobals.adjointer.record_variable(dep, storage.forward_storage(adjlinalg.Vector(old), dep))
 
     rhs = IdentityRHS(old, fn_space, op)
     register_initial_conditions(zip(rhs.coefficients(),rhs.dependencies()), linear=True)
@@ -0,0 +1,69 @@
+"""
+NumPy arrays of the local values of backend vectors.
+
+:py:func:`local_array` hands out the values this process owns of a dolfin
+GenericVector, or of a firedrake Function or Vector, as a NumPy array.
+Where the backend allows it, the array is a view of the storage of the
+vector, so reading and writing the values does not copy them: the
+PETSc vectors of dolfin are accessed through petsc4py, and firedrake
+exposes the data of its Functions directly. Other vectors (e.g. the
+Eigen backend of dolfin) get a copy, which is written back when the
+context exits.
+
+The vectorised operations on the controls and on the adjoint vectors use
+these arrays instead of looping over the dofs in Python.
+"""
+import contextlib
+
+import backend
+
+try:
+    from petsc4py import PETSc
+except ImportError:
+    PETSc = None
+
+
+def petsc_vec(vec):
+    '''Return the petsc4py Vec of a dolfin vector, or None.'''
+    if PETSc is None or backend.__name__ != "dolfin":
+        return None
+    try:
+        return backend.as_backend_type(vec).vec()
+    except (AttributeError, TypeError, RuntimeError):
+        return None
+
+
+@contextlib.contextmanager
+def local_array(vec, write=True):
+    '''Yield the values this process owns of vec (a dolfin GenericVector or a
+    firedrake Function or Vector) as a one-dimensional NumPy array. It is a
+    view of the storage of vec where the backend allows it, and a copy
+    otherwise. With write=True, the changes made to the array are in vec when
+    the context exits (and, for dolfin, its ghost values are updated); with
+    write=False, the array must not be modified.'''
+    if backend.__name__ != "dolfin":
+        if write:
+            yield vec.dat.data.reshape(-1)
+        else:
+            yield vec.dat.data_ro.reshape(-1)
+        return
+
+    petsc = petsc_vec(vec)
+    if petsc is not None:
+        with petsc as array:
+            yield array
+    else:
+        array = vec.get_local()
+        yield array
+        if write:
+            vec.set_local(array)
+
+    if write:
+        vec.apply("insert")
+
+
+def local_size(vec):
+    '''The number of values this process owns of vec.'''
+    if backend.__name__ != "dolfin":
+        return vec.dat.data_ro.size
+    return vec.local_size()
@@ -1,7 +1,17 @@
+import collections
+import hashlib
+import numbers
 import re
+import six
+import weakref
+import numpy
 import ufl.algorithms
 from ufl import Form
-from backend import Constant
+import backend
+from backend import Constant, Function
+from . import compatibility
+from . import expressions
+from . import profiling
 
 ### A general dictionary that applies a key function before lookup
 class KeyedDict(dict):
@@ -28,20 +38,24 @@ class KeyedDict(dict):
             This is crucial for MPI runs where destroying objects in different
             orders might result in MPI deadlocks.
         """
-        def _comparable(key):
-            # Form may be None when this is called during process cleanup
-            if Form and isinstance(key, Form):
-                return form.signature()
-            return key
         try:
-            keys = self.keys()
-            for k in sorted(keys, key=_comparable):
-                dict.__delitem__(self, k)
+            self.discard(self.keys())
         except TypeError:
             # Something went wrong in the deallocation phase - try to exit
             # gracefully
             pass
 
+    def discard(self, keys):
+        """ Delete the items with the given (already transformed) keys, in
+            the same order as clear. """
+        def _comparable(key):
+            # Form may be None when this is called during process cleanup
+            if Form and isinstance(key, Form):
+                return key.signature()
+            return key
+        for k in sorted(keys, key=_comparable):
+            dict.__delitem__(self, k)
+
     def __del__(self):
         self.clear()
 
@@ -66,10 +80,335 @@ def lu_canonicalisation(var):
 
 lu_solvers = KeyedDict(keyfunc=lu_canonicalisation)
 
+# The operators shared by the directions of a block Hessian action (see
+# BasicHessian.apply_block) or by the functionals of compute_gradients,
+# indexed by block_canonicalisation. None outside of these.
+block_operators = None
+
+def block_canonicalisation(var):
+    # The tangent linear operators do not depend on the direction, the
+    # adjoint operators do not depend on the functional, and the
+    # second-order adjoint operators are the adjoint ones.
+    kind = "ADJ_ADJOINT" if var.type == "ADJ_SOA" else var.type
+    return (kind, var.name, var.timestep, var.iteration)
+
+### Stuff for caching factorisations across functional evaluations
+
+def bc_key(bc):
+    # Homogenised Dirichlet conditions only touch the rows of their dofs,
+    # so the dofs identify their effect on the operator.
+    if not isinstance(bc, backend.DirichletBC):
+        raise TypeError("Don't know how to take a hash of %s" % bc)
+    if backend.__name__ == "dolfin":
+        dofs = sorted(bc.get_boundary_values().keys())
+    else:
+        dofs = bc.nodes
+    return numpy.asarray(dofs, dtype=numpy.float64)
+
+def factorisation_key(form, bcs, solver_parameters):
+    '''Return a key that identifies the assembled operator of form with the
+    boundary conditions bcs applied, factorised with solver_parameters: the
+    form signature, the meshes, the values of the coefficients, the boundary
+    dofs and the solver parameters. Returns None if the form depends on
+    something whose value cannot be hashed.'''
+    h = ContentHash()
+    h.update_str(form.signature())
+    h.update_str(repr(sorted(solver_parameters.items())))
+    try:
+        for domain in form.ufl_domains():
+            h.update(domain.ufl_id())
+        for coeff in form.coefficients():
+            h.update(coeff)
+        for bc in bcs:
+            h.update(bc_key(bc))
+    except TypeError:
+        return None
+
+    # The boundary dofs are distributed, even if no coefficient is
+    h.comm = compatibility.form_comm(form)
+    return h.hexdigest()
+
+def matrix_nbytes(A, comm):
+    # The factors are charged by the size of the assembled matrix (values
+    # and column indices): their fill-in is not known in advance. The
+    # global size divided by the number of processes is used, so that all
+    # processes make the same eviction decisions.
+    try:
+        nnz = A.nnz()
+    except AttributeError:
+        return 0
+    return sum(compatibility.allgather(comm, nnz))*12 // compatibility.size(comm)
+
+class FactorisationCache(object):
+    '''The LU factorisations of the adjoint, tangent linear and second-order
+    adjoint operators, keyed by factorisation_key. Since the key covers
+    everything the operator depends on, an entry stays valid across
+    functional evaluations, and equations with identical operators (e.g. all
+    the timesteps of a linear problem with a constant timestep) share one
+    factorisation.
+
+    An entry is in use between acquire and release and is never evicted
+    then. Unused entries are evicted, least recently used first, once their
+    size exceeds parameters["adjoint"]["factorisation_cache_mb"] (0 means
+    unbounded), and at the end of each functional evaluation if they were
+    not used during it.'''
+
+    def __init__(self):
+        # key -> [solver, nbytes, refcount, used]; least recently used first
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def statistics(self):
+        '''Return a dictionary with the number of hits, misses and evictions,
+        the hit rate, and the number and size of the cached factorisations.'''
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = float(stats["hits"])/lookups if lookups > 0 else 0.0
+        stats["entries"] = len(self.entries)
+        stats["bytes"] = self.nbytes
+        return stats
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def acquire(self, key, factorise):
+        '''Return the solver for key. On a miss, factorise() is called and
+        must return the solver and its size in bytes.'''
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.stats["misses"] += 1
+            (solver, nbytes) = factorise()
+            entry = [solver, nbytes, 0, True]
+            self.nbytes += nbytes
+        else:
+            self.stats["hits"] += 1
+            entry[3] = True
+
+        entry[2] += 1
+        self.entries[key] = entry
+        self.enforce()
+        return entry[0]
+
+    def release(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry[2] -= 1
+        self.enforce()
+
+    def enforce(self):
+        max_bytes = backend.parameters["adjoint"]["factorisation_cache_mb"]*1024*1024
+        if max_bytes <= 0:
+            return
+
+        for key in list(self.entries.keys()):
+            if self.nbytes <= max_bytes:
+                break
+            if self.entries[key][2] == 0:
+                self.discard(key)
+                self.stats["evictions"] += 1
+
+    def end_evaluation(self):
+        '''Evict the unused entries that were not used since the last call.'''
+        for key in list(self.entries.keys()):
+            entry = self.entries[key]
+            if entry[2] == 0 and not entry[3]:
+                self.discard(key)
+                self.stats["evictions"] += 1
+            else:
+                entry[3] = False
+
+    def discard(self, key):
+        entry = self.entries.pop(key)
+        self.nbytes -= entry[1]
+
+    def clear(self):
+        # The keys are inserted in the same order on all processes, so the
+        # solvers are destroyed in the same order, too.
+        for key in list(self.entries.keys()):
+            self.discard(key)
+
+factorisations = FactorisationCache()
+
+### Content hashes
+
+class ContentHash(object):
+    '''A sha256 digest of the values of Constants, Functions, Expressions
+    and plain numbers. The digest is the same on all processes: if any of
+    the values is distributed, the local digests are combined with a single
+    collective call.'''
+
+    def __init__(self):
+        self.local = hashlib.sha256()
+        self.comm = None
+
+    def update_str(self, s):
+        self.local.update(s.encode('utf8'))
+
+    def update_array(self, array):
+        self.local.update(numpy.ascontiguousarray(array, dtype=numpy.float64).tobytes())
+
+    def update(self, value):
+        if isinstance(value, (list, tuple)):
+            self.update_str("[")
+            for x in value:
+                self.update(x)
+            self.update_str("]")
+        elif isinstance(value, Constant):
+            self.update_str("Constant")
+            self.update_array(value.values())
+        elif isinstance(value, Function):
+            V = value.function_space()
+            self.update_str("Function:%s:%d" % (V.ufl_element(), V.dim()))
+            self.update_array(value.vector().get_local())
+            self.comm = compatibility.function_comm(value)
+        elif hasattr(backend, "Expression") and isinstance(value, backend.Expression):
+            # An Expression is identified by the object itself and the
+            # current values of the parameters set on it, including those of
+            # the Constants and Functions it was given as parameters
+            self.update_str("Expression:%d" % value.count())
+            for attr in sorted(expressions.expression_attrs.get(value, ())):
+                try:
+                    member = getattr(value, attr)
+                except Exception:
+                    raise TypeError("Don't know how to take a hash of the parameter %s of %s" % (attr, value))
+                self.update_str(attr)
+                self.update(member)
+        elif isinstance(value, numpy.ndarray):
+            self.update_array(value)
+        elif isinstance(value, numbers.Number):
+            self.update_str(repr(value))
+        else:
+            raise TypeError("Don't know how to take a hash of %s" % value)
+
+    def hexdigest(self):
+        digest = self.local.hexdigest()
+        if self.comm is not None and compatibility.size(self.comm) > 1:
+            digest = hashlib.sha256("".join(compatibility.allgather(self.comm, digest)).encode('utf8')).hexdigest()
+        return digest
+
+def value_hash(value):
+    """ Return a content hash of a Constant, a Function or a (nested) list of
+    these, for use as a cache key. The hash covers the exact dof values and
+    the function spaces, and is the same on all processes: the local digests
+    are combined with a single collective call. """
+    h = ContentHash()
+    h.update(value)
+    return h.hexdigest()
+
+### Stuff for caching the annotation of repeated solves
+
+def form_coefficients(form):
+    '''The coefficients of form, sorted by count. A Form caches them, so
+    unlike extract_coefficients this does not traverse the form every time.'''
+    if isinstance(form, Form):
+        return form.coefficients()
+    return ufl.algorithms.extract_coefficients(form)
+
+def parameters_key(parameters):
+    '''A comparable copy of the solver parameters. Raises a TypeError if
+    they contain values that cannot be compared.'''
+    if hasattr(parameters, "to_dict"):
+        parameters = parameters.to_dict()
+    if isinstance(parameters, dict):
+        return tuple((k, parameters_key(parameters[k])) for k in sorted(parameters.keys()))
+    elif isinstance(parameters, (list, tuple)):
+        return tuple(parameters_key(x) for x in parameters)
+    elif parameters is None or isinstance(parameters, (numbers.Number,) + six.string_types):
+        return parameters
+    raise TypeError("Cannot compare solver parameter %s" % parameters)
+
+class Annotation(object):
+    '''What solving.annotate derives from the arguments of a solve: the forms
+    of the equation, the coefficients the left-hand side depends on and,
+    once built, the name and callbacks of the block on the diagonal.'''
+
+    def __init__(self, eq_lhs, eq_rhs, J=None):
+        self.eq_lhs = eq_lhs
+        self.eq_rhs = eq_rhs
+        self.J = J
+        self.diag_coeffs = [coeff for coeff in form_coefficients(eq_lhs) if isinstance(coeff, compatibility.function_type)]
+
+        # Whether eq_lhs is self-adjoint; only decided for linear solves
+        self.self_adjoint = None
+
+        self.diag_name = None
+        self.callbacks = None
+        self.solver_parameters = None
+        self.parameters_key = None
+        self.frozen_expressions = None
+        self.frozen_constants = None
+
+def is_self_adjoint(form):
+    '''Return whether the bilinear form is its own adjoint, i.e. whether
+    swapping its test and trial functions leaves it unchanged. May return
+    false negatives.'''
+    if not isinstance(form, Form):
+        return False
+    args = ufl.algorithms.extract_arguments(form)
+    if len(args) != 2:
+        return False
+    (test, trial) = sorted(args, key=lambda arg: arg.number())
+    if test.function_space() != trial.function_space():
+        return False
+
+    expand = lambda form: ufl.algorithms.expand_indices(ufl.algorithms.expand_compounds(ufl.algorithms.expand_derivatives(form)))
+    swapped = ufl.algorithms.replace(form, {test: trial, trial: test})
+    # Form.__eq__ builds an Equation; compare the forms themselves
+    return expand(form).equals(expand(swapped))
+
+class AnnotationCache(object):
+    '''The Annotations of the solves annotated so far, keyed by the identity
+    of the objects passed to the solve, so that the solves of a time loop
+    only derive their forms and callbacks once. An entry holds on to the
+    objects it is keyed by, so their ids are not reused while it lives.
+    At most max_entries entries are kept; the least recently used ones are
+    evicted first.'''
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        # key -> (objects, annotation); least recently used first
+        self.entries = collections.OrderedDict()
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.stats = {"hits": 0, "misses": 0, "reused_callbacks": 0}
+
+    def statistics(self):
+        '''Return a dictionary with the number of hits and misses, and the
+        number of solves whose block callbacks were reused.'''
+        return dict(self.stats)
+
+    def lookup(self, objects):
+        key = tuple(id(x) for x in objects)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.stats["misses"] += 1
+            profiling.count("annotation cache misses")
+            return None
+
+        self.stats["hits"] += 1
+        profiling.count("annotation cache hits")
+        self.entries[key] = entry
+        return entry[1]
+
+    def insert(self, objects, annotation):
+        self.entries[tuple(id(x) for x in objects)] = (objects, annotation)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+annotations = AnnotationCache()
+
 ### Stuff for preassembly caching
 
 def form_constants(form):
-    constants = tuple([float(x) for x in ufl.algorithms.extract_coefficients(form) if isinstance(x, Constant)])
+    constants = tuple([float(x) for x in form_coefficients(form) if isinstance(x, Constant)])
     return constants
 
 def form_key(form):
@@ -79,9 +418,359 @@ def form_key(form):
 assembled_fwd_forms = set()
 assembled_adj_forms = KeyedDict(keyfunc=form_key)
 
+class OperatorStore(object):
+    '''The assembled operators of the forward equations solved during the
+    replays, with their boundary conditions applied. The adjoint operator of
+    an equation is the transpose of its forward operator, and its tangent
+    linear operator is the forward operator itself, so neither needs to be
+    assembled again while the forward operator is kept. (The boundary
+    conditions of the forward operator only differ from the homogenised
+    ones of the adjoint operator in the columns of the boundary dofs, which
+    multiply the zero boundary values of the adjoint solution.)
+
+    The operators are keyed by the signatures of their forms, the counts of
+    the coefficients, the values of the Constants and the parameters of the
+    Expressions, and the boundary conditions of the forward equation. Neither the forms nor the Functions
+    of the tape they refer to are kept: once such a Function is freed (e.g.
+    because libadjoint forgot its value), the operator is discarded the
+    next time the store is used. The least recently used ones are evicted once their
+    size exceeds parameters["adjoint"]["forward_operator_cache_mb"] (0
+    means unbounded).'''
+
+    def __init__(self):
+        # key -> (matrix, nbytes, form_dependencies); least recently used first
+        self.entries = collections.OrderedDict()
+        # key -> weak references to the Functions of the form
+        self.refs = {}
+        # The keys whose Functions have been freed
+        self.freed = []
+        self.nbytes = 0
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def statistics(self):
+        '''Return a dictionary with the number of hits, misses and
+        evictions, the hit rate, and the number and size of the kept
+        operators.'''
+        self.purge()
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = float(stats["hits"])/lookups if lookups > 0 else 0.0
+        stats["entries"] = len(self.entries)
+        stats["bytes"] = self.nbytes
+        return stats
+
+    def key(self, form, bcs):
+        '''The key of the operator of form with bcs, or None if the parameters
+        of its Expressions cannot be hashed.'''
+        coefficients = tuple(coeff.count() for coeff in form_coefficients(form))
+
+        # The Expressions may change between timesteps without changing the form
+        h = ContentHash()
+        try:
+            for coeff in form_coefficients(form):
+                if hasattr(backend, "Expression") and isinstance(coeff, backend.Expression):
+                    h.update(coeff)
+        except TypeError:
+            return None
+
+        return (form.signature(), coefficients, form_constants(form), h.hexdigest(), tuple(id(bc) for bc in bcs))
+
+    def store(self, form, bcs, A):
+        self.purge()
+        key = self.key(form, bcs)
+        if key is None:
+            return
+        if key in self.entries:
+            self.discard([key])
+        nbytes = matrix_nbytes(A, compatibility.form_comm(form))
+        self.entries[key] = (A, nbytes, form_dependencies([form]))
+        self.refs[key] = [weakref.ref(coeff, lambda ref, key=key: self.freed.append(key))
+                          for coeff in form_coefficients(form) if isinstance(coeff, Function)]
+        self.nbytes += nbytes
+        self.enforce()
+
+    def lookup(self, form, bcs):
+        '''Return the forward operator of form with bcs, or None.'''
+        self.purge()
+        key = self.key(form, bcs)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.entries[key] = entry
+        return entry[0]
+
+    def enforce(self):
+        max_bytes = backend.parameters["adjoint"]["forward_operator_cache_mb"]*1024*1024
+        if max_bytes <= 0:
+            return
+
+        for key in list(self.entries.keys()):
+            if self.nbytes <= max_bytes:
+                break
+            self.discard([key])
+            self.stats["evictions"] += 1
+
+    def discard(self, keys):
+        for key in keys:
+            self.refs.pop(key, None)
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[1]
+
+    def purge(self):
+        '''Discard the operators whose Functions have been freed.'''
+        (freed, self.freed) = (self.freed, [])
+        self.discard(freed)
+
+    def clear(self):
+        # The keys are inserted in the same order on all processes, so the
+        # matrices are destroyed in the same order, too.
+        self.discard(list(self.entries.keys()))
+
+forward_operators = OperatorStore()
+
 ### Stuff for PointIntegralSolver caching
 pis_fwd_to_tlm = {}
 pis_fwd_to_adj = {}
 
 # LocalSolver Cache
 localsolvers = {}
+
+### Stuff for invalidating only the cached data that depends on changed controls
+
+# variable name -> the names of the variables its equations depend on
+equation_inputs = collections.defaultdict(set)
+
+def record_inputs(equation):
+    '''Called when equation is registered with the adjointer.'''
+    blocks = getattr(equation, "blocks", None) or []
+    targets = getattr(equation, "targets", None) or []
+    rhs = getattr(equation, "rhs", None)
+    var = getattr(equation, "var", None)
+
+    deps = list(rhs.dependencies()) if hasattr(rhs, "dependencies") else []
+    for block in blocks:
+        deps += getattr(block, "dependencies", None) or []
+
+    inputs = set(dep.name for dep in deps)
+    if var is None:
+        outputs = [target.name for target in targets]
+    else:
+        outputs = [var.name]
+        inputs.update(target.name for target in targets)
+        deps += [target for target in targets if str(target) != str(var)]
+
+    for name in outputs:
+        equation_inputs[name].update(inputs)
+
+    equation_dependencies.append((str(var), frozenset(str(dep) for dep in deps)))
+
+# For each equation on the tape, in order: the variable it solves for and
+# the variables it depends on
+equation_dependencies = []
+
+def downstream_equations(adjointer, controls):
+    '''Return the set of the numbers of the equations whose solutions depend
+    on the values of controls, or None if that is not known: the uses of
+    Constants are not recorded on the tape.'''
+    if len(equation_dependencies) != adjointer.equation_count:
+        return None
+
+    seeds = set()
+    for control in controls:
+        if hasattr(control, "controls"):
+            equations = downstream_equations(adjointer, control.controls)
+            if equations is None:
+                return None
+            seeds.update(equations)
+            continue
+
+        var = getattr(control, "var", None)
+        if var is None:
+            return None
+        seeds.add(var.equation_nb(adjointer))
+
+    changed = set()
+    equations = set()
+    for (i, (var, deps)) in enumerate(equation_dependencies):
+        if i in seeds or not changed.isdisjoint(deps):
+            equations.add(i)
+            changed.add(var)
+    return equations
+
+def reaching_equations(adjointer, functional):
+    '''Return the set of the numbers of the equations whose solutions the
+    functional depends on, directly or through the solutions of later
+    equations, or None if that is not known. The adjoint solutions of all
+    other equations are zero.'''
+    if len(equation_dependencies) != adjointer.equation_count:
+        return None
+
+    reached = set()
+    for timestep in range(adjointer.timestep_count):
+        reached.update(str(dep) for dep in functional.dependencies(adjointer, timestep))
+
+    equations = set()
+    for i in range(len(equation_dependencies))[::-1]:
+        (var, deps) = equation_dependencies[i]
+        if var in reached:
+            equations.add(i)
+            reached.update(deps)
+    return equations
+
+# The number of equations solved and skipped by the replays in
+# ReducedFunctional, by compute_tlm and by the adjoint drivers, since the
+# last reset
+replay_statistics = {"forward_solves": 0, "forward_skipped": 0,
+                     "tlm_solves": 0, "tlm_skipped": 0,
+                     "adjoint_solves": 0, "adjoint_skipped": 0}
+
+def reset_replay_statistics():
+    for key in replay_statistics:
+        replay_statistics[key] = 0
+
+# ufl count of a forward value handed to an assembly callback -> its variable name
+value_names = {}
+
+def record_values(dependencies, values):
+    '''Remember which variables the values handed to an assembly callback
+    belong to, so that the forms built from them can be traced back to the
+    tape.'''
+    for (dep, value) in zip(dependencies, values):
+        if hasattr(value.data, "count"):
+            value_names[value.data.count()] = dep.name
+
+def form_dependencies(forms, functions=True):
+    '''Return the set of things the cached data computed from forms depends
+    on: the Constants, and the variables of the Functions (or, for Functions
+    that are not on the tape, their names), including those given to the
+    Expressions as parameters. The other parameters of Expressions are not
+    affected by the controls. With functions=False, only the Constants are
+    considered.'''
+    deps = set()
+
+    def add(coeff):
+        if isinstance(coeff, Constant):
+            deps.add(("Constant", coeff.count()))
+        elif hasattr(backend, "Expression") and isinstance(coeff, backend.Expression):
+            for attr in expressions.expression_attrs.get(coeff, ()):
+                try:
+                    member = getattr(coeff, attr)
+                except Exception:
+                    # A parameter that cannot be read may be anything; a
+                    # name that is not on the tape is always affected
+                    if functions:
+                        deps.add(("Function", "Expression:%d:%s" % (coeff.count(), attr)))
+                    continue
+                if isinstance(member, (Constant, Function)) or \
+                        (isinstance(member, backend.Expression) and member is not coeff):
+                    add(member)
+        elif functions:
+            deps.add(("Function", value_names.get(coeff.count(), str(coeff))))
+
+    for form in forms:
+        if form is None:
+            continue
+        for coeff in ufl.algorithms.extract_coefficients(form):
+            add(coeff)
+    return frozenset(deps)
+
+# (cache name, key) -> the form_dependencies of the cached entry, for the
+# caches whose keys do not determine them
+entry_dependencies = {}
+
+def record_entry(cache, key, forms, functions=True):
+    entry_dependencies[(cache, key)] = form_dependencies(forms, functions=functions)
+
+# The ReducedFunctional that evaluated the tape last
+last_evaluation = None
+
+class Changes(object):
+    '''What a change of the values of some controls affects. The variables
+    downstream of a Function control on the tape are affected; since the
+    tape does not record which equations use a Constant, all variables are
+    considered affected by a Constant control. With controls=None,
+    everything is affected.'''
+
+    def __init__(self, controls=None):
+        self.everything = controls is None
+        self.all_variables = False
+        self.constants = set()
+        self.names = set()
+
+        for control in controls or []:
+            if hasattr(control, "var"):
+                self.names.add(control.var.name)
+                continue
+
+            data = control.data()
+            data = data if isinstance(data, (list, tuple)) else [data]
+            if all(isinstance(x, Constant) for x in data):
+                self.constants.update(x.count() for x in data)
+                self.all_variables = True
+            else:
+                self.everything = True
+
+        # Every variable computed from a changed one is changed, too
+        dependents = collections.defaultdict(set)
+        for (name, inputs) in equation_inputs.items():
+            for dep in inputs:
+                dependents[dep].add(name)
+        self.known = set(equation_inputs.keys()).union(dependents.keys())
+
+        stack = list(self.names)
+        while len(stack) > 0:
+            for name in dependents[stack.pop()]:
+                if name not in self.names:
+                    self.names.add(name)
+                    stack.append(name)
+
+    def affects(self, deps):
+        if self.everything:
+            return True
+        for (kind, x) in deps:
+            if kind == "Constant" and x in self.constants:
+                return True
+            # Functions that cannot be traced back to the tape are assumed to change
+            if kind == "Function" and (self.all_variables or x in self.names or x not in self.known):
+                return True
+        return False
+
+def invalidate(changes):
+    '''Discard the cached data that depends on something affected by changes.
+    Entries whose dependencies were not recorded are always discarded.'''
+    def stale(keys, deps):
+        return [key for key in keys if deps(key) is None or changes.affects(deps(key))]
+
+    def recorded(cache):
+        return lambda key: entry_dependencies.get((cache, key))
+
+    for form in stale(list(assembled_fwd_forms), lambda form: form_dependencies([form])):
+        assembled_fwd_forms.discard(form)
+    assembled_adj_forms.discard(stale(list(dict.keys(assembled_adj_forms)), lambda key: form_dependencies([key[0]])))
+    forward_operators.discard(stale(list(forward_operators.entries.keys()), lambda key: forward_operators.entries[key][2]))
+    lu_solvers.discard(stale(list(dict.keys(lu_solvers)), recorded("lu_solvers")))
+    for key in stale(list(localsolvers.keys()), recorded("localsolvers")):
+        del localsolvers[key]
+
+    # The Functions of the tangent linear and adjoint schemes are assigned
+    # before every step, so only the Constants matter
+    for pis in (pis_fwd_to_tlm, pis_fwd_to_adj):
+        for solver in stale(list(pis.keys()), lambda solver: form_dependencies([solver.scheme().rhs_form()], functions=False)):
+            del pis[solver]
+
+    for (cache, key) in list(entry_dependencies.keys()):
+        if not dict.__contains__({"lu_solvers": lu_solvers, "localsolvers": localsolvers}[cache], key):
+            del entry_dependencies[(cache, key)]
+
+    # The values handed to the assembly callbacks are replaced by the next replay
+    value_names.clear()
+
+    global last_evaluation
+    if changes.everything:
+        last_evaluation = None
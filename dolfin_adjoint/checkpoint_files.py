@@ -0,0 +1,322 @@
+"""
+The files in which adjlinalg.Vector.write stores forward values on disk.
+
+By default every variable is written collectively to its own HDF5 file in
+the current directory. If parameters["adjoint"]["checkpoint_container"] is
+set to a path prefix, the values are instead appended as chunked (and,
+with parameters["adjoint"]["checkpoint_compression"] > 0, gzip-compressed)
+datasets to a few container files per process, with an index keyed by the
+libadjoint variable. A new container is started once the current one
+exceeds parameters["adjoint"]["checkpoint_container_mb"], and a container
+is removed as soon as none of its values are needed any more. Each process
+stores its own part of the values, so no collective HDF5 calls are issued,
+and only the containers are read and written by the I/O threads of
+dolfin_adjoint.diskio.
+
+The index and the function spaces of the stored variables
+(adjglobals.checkpoint_fs) can be saved with :py:func:`adj_save_checkpoints`
+and the checkpoint set reopened by a later process with
+:py:func:`adj_open_checkpoints`.
+"""
+import json
+import os
+import os.path
+
+import numpy
+import backend
+import libadjoint
+from . import adjglobals
+from . import compatibility
+from . import diskio
+
+
+def space_key(V):
+    '''A string that identifies the function space V across processes.'''
+    return "%s/%d" % (V.ufl_element(), V.dim())
+
+
+def function_from_array(array, V):
+    '''Return a new Function on V with the local values array. apply is
+    collective, so this must be called on the main thread.'''
+    v = backend.Function(V)
+    vec = v.vector()
+    vec.set_local(array)
+    vec.apply("insert")
+    return v
+
+
+class VariableFiles(object):
+    '''One HDF5 file per variable, named after the variable.'''
+
+    # HDF5File is collective, so the I/O threads must not touch these files
+    threaded = False
+
+    def path(self, name):
+        return name + ".h5"
+
+    def write(self, name, data):
+        with diskio.hdf5_lock:
+            file = backend.HDF5File(backend.comm_world, self.path(name), "w")
+            file.write(data, name)
+            file.close()
+
+    def read(self, name, V):
+        v = backend.Function(V)
+        with diskio.hdf5_lock:
+            file = backend.HDF5File(backend.comm_world, self.path(name), "r")
+            file.read(v, name)
+            file.close()
+        return v
+
+    def contains(self, name):
+        return os.path.isfile(self.path(name))
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except OSError:
+            pass
+
+
+class CheckpointContainer(object):
+    '''Appends the values of all variables to a few chunked HDF5 containers
+    per process. Requires h5py.'''
+
+    # The I/O threads may read and write the raw local values
+    threaded = True
+
+    def __init__(self, prefix, max_size_mb=1024, compression=0):
+        try:
+            import h5py
+        except ImportError:
+            print("You need to install h5py to use checkpoint containers. Try `pip install h5py`")
+            raise
+        self.h5py = h5py
+
+        self.prefix = prefix
+        self.max_size = max_size_mb*1024*1024
+        self.compression = compression
+        self.rank = compatibility.rank(backend.comm_world)
+
+        # name -> (container number, dataset)
+        self.index = {}
+        # container number -> number of values in it that are still needed
+        self.live = {}
+        # container number -> open h5py.File
+        self.files = {}
+        self.current = 0
+        self.counter = 0
+        # The container numbers whose files this container has created (or
+        # taken over with load); the others may be left over from an earlier
+        # run and are truncated when first opened
+        self.created = set()
+
+    def __del__(self):
+        try:
+            self.close_all()
+        except Exception:
+            pass
+
+    def path(self, number):
+        return "%s.%d.p%d.h5" % (self.prefix, number, self.rank)
+
+    def index_path(self):
+        return "%s.p%d.json" % (self.prefix, self.rank)
+
+    def file(self, number):
+        if number not in self.files:
+            if number != self.current:
+                mode = "r"
+            elif number in self.created:
+                mode = "a"
+            else:
+                mode = "w"
+            self.files[number] = self.h5py.File(self.path(number), mode)
+            self.created.add(number)
+        return self.files[number]
+
+    def write(self, name, data):
+        self.write_array(name, numpy.asarray(data.vector().get_local()))
+
+    def write_array(self, name, array):
+        '''Store the local values array under name.'''
+        with diskio.hdf5_lock:
+            self.delete(name)
+            self.rotate()
+
+            kwargs = {"chunks": True}
+            if self.compression > 0:
+                kwargs["compression"] = "gzip"
+                kwargs["compression_opts"] = self.compression
+
+            dataset = str(self.counter)
+            self.counter += 1
+            self.file(self.current).create_dataset(dataset, data=array, **kwargs)
+
+            self.index[name] = (self.current, dataset)
+            self.live[self.current] = self.live.get(self.current, 0) + 1
+
+    def rotate(self):
+        '''Start a new container once the current one is full.'''
+        if self.current not in self.files:
+            return
+        if self.files[self.current].id.get_filesize() < self.max_size:
+            return
+
+        self.files[self.current].flush()
+        self.close(self.current)
+        if self.live.get(self.current, 0) == 0:
+            self.remove(self.current)
+        self.current += 1
+
+    def read(self, name, V):
+        return function_from_array(self.read_array(name), V)
+
+    def read_array(self, name):
+        '''Return the local values stored under name.'''
+        with diskio.hdf5_lock:
+            (number, dataset) = self.index[name]
+            return self.file(number)[dataset][...]
+
+    def contains(self, name):
+        return name in self.index
+
+    def delete(self, name):
+        with diskio.hdf5_lock:
+            entry = self.index.pop(name, None)
+            if entry is None:
+                return
+
+            number = entry[0]
+            self.live[number] -= 1
+            if self.live[number] == 0 and number != self.current:
+                self.close(number)
+                self.remove(number)
+
+    def close(self, number):
+        f = self.files.pop(number, None)
+        if f is not None:
+            f.close()
+
+    def close_all(self):
+        '''Close the containers, and remove those (the current one included)
+        that hold no more values.'''
+        with diskio.hdf5_lock:
+            for number in list(self.files.keys()):
+                self.close(number)
+            for number in list(self.created):
+                if self.live.get(number, 0) == 0:
+                    self.remove(number)
+                    self.created.discard(number)
+
+    def remove(self, number):
+        self.live.pop(number, None)
+        try:
+            os.remove(self.path(number))
+        except OSError:
+            pass
+
+    def save(self):
+        '''Write the index and the function spaces of the stored variables
+        next to the containers.'''
+        with diskio.hdf5_lock:
+            if self.current in self.files:
+                self.files[self.current].flush()
+
+            fs = dict((name, V) for (name, V) in adjglobals.checkpoint_fs.items() if name in self.index)
+            spaces = dict((name, space_key(V)) for (name, V) in fs.items())
+            # The containers hold the local values of this process, which
+            # can only be read back with the same partitioning
+            ranges = dict((space_key(V), list(V.dofmap().ownership_range())) for V in fs.values())
+            index = {"index": self.index,
+                     "live": dict((str(number), live) for (number, live) in self.live.items()),
+                     "current": self.current,
+                     "counter": self.counter,
+                     "spaces": spaces,
+                     "nprocs": compatibility.size(backend.comm_world),
+                     "ownership_ranges": ranges}
+
+        with open(self.index_path(), "w") as f:
+            json.dump(index, f)
+
+    def load(self, spaces):
+        '''Read back an index written by save. spaces is a list of the
+        function spaces of the stored variables. The spaces must be
+        partitioned as when the index was saved.'''
+        nprocs = compatibility.size(backend.comm_world)
+        by_key = dict((space_key(V), V) for V in spaces)
+
+        # Check on all processes before any of them gives up, so that the
+        # others are not left waiting in the next collective call
+        error = None
+        try:
+            with open(self.index_path(), "r") as f:
+                index = json.load(f)
+        except IOError:
+            error = "Cannot read the checkpoint index %s. Were the checkpoints saved with %d processes?" % (self.index_path(), nprocs)
+
+        if error is None and index.get("nprocs") != nprocs:
+            error = "The checkpoints under %s were saved with %s processes, but this run has %d." % (self.prefix, index.get("nprocs"), nprocs)
+
+        if error is None:
+            for (name, key) in index["spaces"].items():
+                if key not in by_key:
+                    error = "No function space matching %s was given for %s." % (key, name)
+
+        if error is None:
+            for (key, saved) in index["ownership_ranges"].items():
+                if key in by_key and list(by_key[key].dofmap().ownership_range()) != saved:
+                    error = "The function space %s is partitioned differently than when the checkpoints under %s were saved." % (key, self.prefix)
+
+        errors = [e for e in compatibility.allgather(backend.comm_world, error) if e is not None]
+        if len(errors) > 0:
+            raise libadjoint.exceptions.LibadjointErrorInvalidInputs(errors[0])
+
+        for number in list(self.files.keys()):
+            self.close(number)
+
+        self.index = dict((name, tuple(entry)) for (name, entry) in index["index"].items())
+        self.live = dict((int(number), live) for (number, live) in index["live"].items())
+        self.current = index["current"]
+        self.counter = index["counter"]
+        self.created = set(self.live.keys()) | set([self.current])
+
+        for (name, key) in index["spaces"].items():
+            adjglobals.checkpoint_fs[name] = by_key[key]
+
+
+variable_files = VariableFiles()
+containers = {}
+
+
+def get():
+    '''Return the store selected by parameters["adjoint"]["checkpoint_container"].'''
+    prefix = backend.parameters["adjoint"]["checkpoint_container"]
+    if prefix == "":
+        return variable_files
+
+    if prefix not in containers:
+        containers[prefix] = CheckpointContainer(prefix,
+                                                 max_size_mb=backend.parameters["adjoint"]["checkpoint_container_mb"],
+                                                 compression=backend.parameters["adjoint"]["checkpoint_compression"])
+    return containers[prefix]
+
+
+def adj_save_checkpoints():
+    '''Save the index of the checkpoint container selected by
+    parameters["adjoint"]["checkpoint_container"], so that the values
+    written to it can be read back by a later process.'''
+    store = get()
+    if not isinstance(store, CheckpointContainer):
+        raise libadjoint.exceptions.LibadjointErrorInvalidInputs("Set parameters['adjoint']['checkpoint_container'] to save the checkpoints.")
+
+    diskio.pool.wait_all()
+    store.save()
+
+
+def adj_open_checkpoints(prefix, spaces):
+    '''Reopen the checkpoint container saved with :py:func:`adj_save_checkpoints`
+    under prefix, and select it for subsequent checkpoints. spaces is a list of
+    the function spaces of the stored variables.'''
+    backend.parameters["adjoint"]["checkpoint_container"] = prefix
+    get().load(spaces)
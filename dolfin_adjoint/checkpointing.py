@@ -0,0 +1,333 @@
+"""
+Binomial (revolve-style) checkpointing driven from Python.
+
+The schedule works on timesteps, as delimited by
+:py:func:`dolfin_adjoint.adj_inc_timestep`. The forward run stores a small
+number of snapshots of the model state; during the adjoint sweep the
+missing forward values are recomputed from the nearest snapshot. The
+placement of the snapshots follows the binomial rule of Griewank and
+Walther, which minimises the number of recomputed timesteps for a given
+number of snapshot slots.
+
+The schedule is a list of actions:
+
+  - ("advance", a, m): restore the snapshot at timestep a and replay
+    timesteps a, ..., m-1, forgetting their values as we go;
+  - ("takeshot", m): store a snapshot of the state at the start of timestep m;
+  - ("turn", t): replay timestep t, keeping its values for the adjoint;
+  - ("free", m): delete the snapshot at timestep m.
+"""
+import libadjoint
+import backend
+from . import adjglobals
+from . import adjlinalg
+from . import storage
+
+
+def beta(s, t):
+    '''The binomial coefficient (s + t)! / (s! t!).'''
+    b = 1
+    for i in range(1, min(s, t) + 1):
+        b = b * (max(s, t) + i) // i
+    return b
+
+
+def repetition_number(steps, snaps):
+    '''The smallest t such that beta(snaps + 1, t) >= steps.'''
+    t = 0
+    while beta(snaps + 1, t) < steps:
+        t += 1
+    return t
+
+
+def reverse_cost(steps, snaps):
+    '''The minimal number of timesteps that need to be computed to reverse
+    steps timesteps with a snapshot at the first one and snaps free snapshot
+    slots (the final recomputation of each timestep included).'''
+    if steps == 1:
+        return 1
+    t = repetition_number(steps, snaps)
+    return (t + 1)*steps - beta(snaps + 2, t - 1)
+
+
+def optimal_split(steps, snaps):
+    '''Return the number of timesteps to advance before taking the next
+    snapshot so that the total cost of reversing steps timesteps is minimal.
+
+    The cost is piecewise linear in the split, so it suffices to check the
+    breakpoints of the two subproblems.'''
+    assert steps > 1 and snaps > 0
+
+    t = repetition_number(steps, snaps)
+    candidates = set([1, steps - 1])
+    for k in range(t + 2):
+        for d in (beta(snaps + 1, k), steps - beta(snaps, k)):
+            if 1 <= d <= steps - 1:
+                candidates.add(d)
+
+    cost = lambda d: d + reverse_cost(d, snaps) + reverse_cost(steps - d, snaps - 1)
+    return min(sorted(candidates, reverse=True), key=cost)
+
+
+def binomial_schedule(steps, snaps):
+    '''Return the list of actions that reverses steps timesteps using at most
+    snaps snapshots in addition to the (free) one of the initial state.'''
+
+    actions = []
+
+    def reverse(a, b, snaps):
+        if b - a == 1:
+            actions.append(("advance", a, a))
+            actions.append(("turn", a))
+        elif snaps == 0:
+            for j in range(b - 1, a - 1, -1):
+                actions.append(("advance", a, j))
+                actions.append(("turn", j))
+        else:
+            m = a + optimal_split(b - a, snaps)
+            actions.append(("advance", a, m))
+            actions.append(("takeshot", m))
+            reverse(m, b, snaps - 1)
+            actions.append(("free", m))
+            reverse(a, m, snaps)
+
+    reverse(0, steps, snaps)
+    return actions
+
+
+def _nbytes(function):
+    try:
+        return function.vector().local_size()*8
+    except AttributeError:
+        return 0
+
+
+class BinomialCheckpointer(object):
+    '''Drives the binomial checkpointing schedule for the annotation, the
+    replay in :py:class:`ReducedFunctional` and the adjoint sweeps in
+    :py:func:`compute_gradient` and :py:func:`compute_adjoint`.
+
+    The oldest (longest-living) snaps_on_disk snapshots are written to disk,
+    the remaining snaps_in_ram ones are kept in memory.'''
+
+    def __init__(self, steps, snaps_on_disk, snaps_in_ram, verbose=False):
+        if steps < 1:
+            raise libadjoint.exceptions.LibadjointErrorInvalidInputs("The number of timesteps must be positive.")
+
+        self.steps = steps
+        self.snaps_on_disk = snaps_on_disk
+        self.snaps_in_ram = snaps_in_ram
+        self.verbose = verbose
+
+        self.actions = binomial_schedule(steps, snaps_on_disk + snaps_in_ram)
+
+        # The takeshots before the first turn are performed by the forward run itself
+        first_turn = [a[0] for a in self.actions].index("turn")
+        forward = [a for a in self.actions[:first_turn] if a[0] == "takeshot"]
+        self.forward_snapshots = set(a[1] for a in forward)
+        if len(forward) > 0:
+            self.first_reverse = self.actions.index(forward[-1]) + 1
+        else:
+            self.first_reverse = 0
+
+        # The state variables at the start of each timestep, recorded on the forward run
+        self.state_vars = {0: []}
+
+        self.snapshots = {0: ("ram", [])}
+        self.reset_statistics()
+        self.reset()
+
+    def reset(self):
+        '''Rewind the schedule. Unless a forward run stores the forward
+        snapshots again, the next adjoint sweep starts from the initial state.'''
+        for timestep in list(self.snapshots.keys()):
+            if timestep != 0:
+                self.free(timestep)
+        self.position = 0
+        self.current = None
+
+    def reset_statistics(self):
+        self.stats = {"recomputed_equations": 0,
+                      "recomputed_timesteps": 0,
+                      "snapshots_taken": 0,
+                      "peak_snapshots_in_ram": 0,
+                      "peak_snapshots_on_disk": 0,
+                      "peak_snapshot_bytes_in_ram": 0}
+
+    def statistics(self):
+        '''Return a dictionary with the recomputation counts and the peak
+        snapshot usage since the last call to reset_statistics.'''
+        return dict(self.stats)
+
+    def log(self, msg):
+        if self.verbose:
+            backend.info("Binomial: " + msg)
+
+    # Hooks for the forward run
+
+    def end_forward_timestep(self):
+        '''Called by adj_inc_timestep during the annotation. Records which
+        variables define the state at the start of the new timestep, takes
+        a snapshot of the live values if the schedule requests it, and
+        forgets the values the adjoint sweep will recompute.'''
+        timestep = adjglobals.adj_variables.libadjoint_timestep
+
+        state = []
+        for coeff in adjglobals.adj_variables.keys():
+            var = adjglobals.adj_variables[coeff]
+            if adjglobals.adjointer.variable_known(var):
+                state.append((var, coeff))
+        self.state_vars[timestep] = [var for (var, coeff) in state]
+
+        if timestep in self.forward_snapshots:
+            self.log("Checkpoint timestep %d on the forward run." % timestep)
+            self.store(timestep, state)
+            self.position = self.first_reverse
+
+        # As in end_replay_timestep, keep the values of the timestep just
+        # finished around, since the functional may need them; the snapshots
+        # hold copies of the values they need.
+        finished = timestep - 1
+        if finished > 0:
+            adjglobals.adjointer.forget_forward_equation(adjglobals.adjointer.timestep_end_equation(finished - 1))
+
+    def start_replay(self):
+        '''Called before a replay of the forward run.'''
+        self.reset()
+
+    def end_replay_timestep(self, timestep):
+        '''Called by the replay after the last equation of timestep has been solved.'''
+        if timestep + 1 in self.forward_snapshots:
+            self.log("Checkpoint timestep %d on the forward run." % (timestep + 1))
+            self.takeshot(timestep + 1)
+            self.position = self.first_reverse
+
+        # Keep the values of the previous timestep around, since the
+        # functional may need them.
+        if timestep > 0:
+            adjglobals.adjointer.forget_forward_equation(adjglobals.adjointer.timestep_end_equation(timestep - 1))
+
+    # Hooks for the adjoint sweep
+
+    def prepare_adjoint(self, timestep):
+        '''Make sure that the forward values of timestep are available on the tape.'''
+        if self.current == timestep:
+            return
+
+        if adjglobals.adjointer.timestep_count != self.steps:
+            raise libadjoint.exceptions.LibadjointErrorInvalidInputs("The binomial checkpointing schedule was set up for %d timesteps, but %d were annotated." % (self.steps, adjglobals.adjointer.timestep_count))
+
+        while self.current != timestep:
+            action = self.actions[self.position]
+            self.position += 1
+            getattr(self, action[0])(*action[1:])
+
+        self.prefetch()
+
+    def prefetch(self):
+        '''Start reading the next snapshot to be restored, if it is on disk,
+        while the adjoint of the current timestep is solved.'''
+        for action in self.actions[self.position:]:
+            if action[0] == "advance":
+                (where, values) = self.snapshots.get(action[1], ("ram", []))
+                if where == "disk":
+                    for var in values:
+                        adjlinalg.Vector.prefetch(var)
+                break
+
+    def finish_adjoint(self):
+        '''Called after the adjoint sweep. All snapshots but the initial
+        one have been freed, so the next sweep has to start from scratch.'''
+        self.log("Adjoint sweep finished: %s" % self.stats)
+        self.reset()
+
+    # The actions
+
+    def advance(self, start, end):
+        self.log("Advance from timestep %d to timestep %d." % (start, end))
+        self.restore(start)
+        for timestep in range(start, end):
+            self.replay_timestep(timestep)
+            if timestep > start:
+                adjglobals.adjointer.forget_forward_equation(adjglobals.adjointer.timestep_end_equation(timestep - 1))
+
+    def turn(self, timestep):
+        self.log("Solve timestep %d." % timestep)
+        self.replay_timestep(timestep)
+        self.current = timestep
+
+    def takeshot(self, timestep):
+        state = []
+        for var in self.state_vars[timestep]:
+            try:
+                value = adjglobals.adjointer.get_variable_value(var).data
+            except libadjoint.exceptions.LibadjointErrorNeedValue:
+                continue
+            state.append((var, value))
+        self.store(timestep, state)
+
+    def store(self, timestep, state):
+        on_disk = sum(1 for (where, values) in self.snapshots.values() if where == "disk")
+        if on_disk < self.snaps_on_disk:
+            where = "disk"
+            for (var, value) in state:
+                adjlinalg.Vector(value).write(var)
+            values = [var for (var, value) in state]
+        else:
+            where = "ram"
+            values = []
+            for (var, value) in state:
+                vec = adjlinalg.Vector(value).duplicate()
+                vec.axpy(1.0, adjlinalg.Vector(value))
+                values.append((var, vec))
+
+        self.log("Checkpoint timestep %d %s." % (timestep, "on disk" if where == "disk" else "in memory"))
+        self.snapshots[timestep] = (where, values)
+        self.update_statistics()
+
+    def restore(self, timestep):
+        (where, values) = self.snapshots[timestep]
+        for value in values:
+            if where == "disk":
+                var = value
+                vec = adjlinalg.Vector.read(var)
+            else:
+                (var, vec) = value
+
+            vec_storage = storage.forward_storage(vec, var)
+            vec_storage.set_overwrite(True)
+            adjglobals.adjointer.record_variable(var, vec_storage)
+
+    def free(self, timestep):
+        (where, values) = self.snapshots.pop(timestep)
+        if where == "disk":
+            for var in values:
+                adjlinalg.Vector.delete(var)
+        self.log("Delete checkpoint timestep %d." % timestep)
+
+    def replay_timestep(self, timestep):
+        if timestep == 0:
+            start = 0
+        else:
+            start = adjglobals.adjointer.timestep_end_equation(timestep - 1) + 1
+        end = adjglobals.adjointer.timestep_end_equation(timestep)
+
+        for i in range(start, end + 1):
+            (fwd_var, output) = adjglobals.adjointer.get_forward_solution(i)
+            vec_storage = storage.forward_storage(output, fwd_var)
+            vec_storage.set_overwrite(True)
+            adjglobals.adjointer.record_variable(fwd_var, vec_storage)
+
+        self.stats["recomputed_equations"] += end - start + 1
+        self.stats["recomputed_timesteps"] += 1
+
+    def update_statistics(self):
+        self.stats["snapshots_taken"] += 1
+
+        in_ram = [values for (where, values) in self.snapshots.values() if where == "ram"]
+        on_disk = [values for (where, values) in self.snapshots.values() if where == "disk"]
+        ram_bytes = sum(_nbytes(vec.data) for values in in_ram for (var, vec) in values)
+
+        self.stats["peak_snapshots_in_ram"] = max(self.stats["peak_snapshots_in_ram"], len(in_ram) - 1)
+        self.stats["peak_snapshots_on_disk"] = max(self.stats["peak_snapshots_on_disk"], len(on_disk))
+        self.stats["peak_snapshot_bytes_in_ram"] = max(self.stats["peak_snapshot_bytes_in_ram"], ram_bytes)
@@ -171,6 +171,30 @@ def rank(comm):
         return comm.rank
 
 
+def size(comm):
+    if backend.__name__ == "dolfin":
+        return backend.MPI.size(comm)
+    else:
+        return comm.size
+
+
+def allgather(comm, value):
+    """Return the list of the values of all processes of comm, in rank order."""
+    if size(comm) == 1:
+        return [value]
+    if hasattr(comm, "tompi4py"):
+        comm = comm.tompi4py()
+    return comm.allgather(value)
+
+
+def function_comm(function):
+    """Return the communicator associated with a function."""
+    if backend.__name__ == "dolfin":
+        return function.function_space().mesh().mpi_comm()
+    else:
+        return function.comm
+
+
 def form_comm(form):
     """Return the communicator associated with a form."""
     if backend.__name__ == "dolfin":
@@ -187,3 +211,15 @@ def petsc_vec_as_function(fs, petsc_vec):
         with f.dat.vec as v:
             petsc_vec.copy(v)
         return f
+
+
+def transpose_matrix(A):
+    """Return the transpose of the assembled matrix A, or None if the backend
+    cannot transpose it."""
+    if backend.__name__ != "dolfin":
+        return None
+    try:
+        mat = backend.as_backend_type(A).mat()
+    except (AttributeError, RuntimeError, TypeError):
+        return None
+    return backend.PETScMatrix(mat.transpose())
@@ -1,10 +1,24 @@
 import backend
-import copy
+from . import snapshots
 
 constant_values = {}
 constant_objects = {}
 scalar_parameters = []
 
+# The values of the Constants as they are set (see snapshots.py)
+def _apply(constant, value):
+    name = constant.adj_name
+    backend.Constant.assign(constant_objects[name], backend.Constant(value))
+    constant_values[name] = value
+
+def _read(constant):
+    return constant_values[constant.adj_name]
+
+def _skip(constant):
+    return constant.adj_name in scalar_parameters
+
+log = snapshots.ParameterLog(_apply, _read, _skip)
+
 class Constant(backend.Constant):
     '''The Constant class is overloaded so that you can give :py:class:`Constants` *names*. For example,
 
@@ -29,10 +43,12 @@ class Constant(backend.Constant):
 
         constant_values[name] = value
         constant_objects[name] = self
+        log.record(self, value)
 
     def assign(self, value):
         backend.Constant.assign(self, value)
         constant_values[self.adj_name] = value
+        log.record(self, value)
 
 def get_constant(a):
     if isinstance(a, Constant):
@@ -41,14 +57,10 @@ def get_constant(a):
         return constant_objects[a]
 
 def freeze_dict():
-    new_dict = {}
-    for name in constant_objects:
-        new_dict[constant_objects[name]] = copy.copy(constant_values[name])
-
-    return new_dict
+    '''Return a snapshot of the values of all Constants.'''
+    return log.freeze()
 
-def update_constants(d):
-    for constant in d:
-        name = constant.adj_name
-        if name not in scalar_parameters:
-            backend.Constant.assign(constant_objects[name], backend.Constant(d[constant]))
+def update_constants(version):
+    '''Restore the values of the Constants, except those of the scalar
+    parameters, to the snapshot returned by freeze_dict.'''
+    log.restore(version)
@@ -515,6 +515,19 @@ class ListControl(DolfinAdjointControl):
     def __getitem__(self, i):
         return self.controls[i]
 
+class DirectionControl(ListControl):
+    '''A perturbed ListControl that is one of several directions swept
+    together, as by BasicHessian.apply_block. The tangent linear and
+    second-order adjoint variables are named after the parameter, so each
+    direction carries its index in its name; otherwise the directions would
+    overwrite each other's values on the tape.'''
+    def __init__(self, control, index):
+        ListControl.__init__(self, control.controls)
+        self.index = index
+
+    def __str__(self):
+        return "%s:Direction%d" % (":".join(str(p) for p in self.controls), self.index)
+
 def _add(x, y):
     if x is None:
         return y
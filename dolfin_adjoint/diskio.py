@@ -0,0 +1,189 @@
+"""
+Background I/O for the forward values that are written to disk.
+
+If parameters["adjoint"]["io_threads"] is positive and the values are
+stored in checkpoint containers (see dolfin_adjoint.checkpoint_files),
+adjlinalg.Vector.write hands a copy of the local values to a pool of worker
+threads and returns immediately, and the adjoint sweep asks the pool to read
+the values needed by the next parameters["adjoint"]["prefetch_depth"]
+adjoint equations ahead of time. Requests on the same file are executed in
+the order in which they were submitted; a read of a value that is still
+being written waits for the write to finish.
+
+The worker threads only move raw arrays in and out of the per-process h5py
+containers. Everything that involves dolfin (creating the Function,
+set_local and the collective apply, and the collective HDF5File of the
+per-variable files) happens on the main thread, since dolfin does not
+initialise MPI with MPI_THREAD_MULTIPLE. In parallel all I/O stays
+synchronous.
+"""
+import atexit
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import six
+
+import backend
+from . import compatibility
+
+# HDF5 is not necessarily built thread-safe, so the library calls themselves
+# are serialised. The worker threads still overlap them with the solves.
+hdf5_lock = threading.RLock()
+
+
+class Request(object):
+    '''A unit of work for the I/O threads.'''
+
+    def __init__(self, fn, args, after=None, check=True):
+        self.fn = fn
+        self.args = args
+        self.after = after
+        # Whether a failure is reported to whoever waits for the file
+        self.check = check
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            # The previous request on the same file was queued before this one
+            if self.after is not None:
+                self.after.done.wait()
+                if self.after.check and self.after.error is not None:
+                    self.error = self.after.error
+                    return
+            self.value = self.fn(*self.args)
+        except Exception:
+            self.error = sys.exc_info()
+        finally:
+            # Do not hold on to the data that was written
+            self.args = None
+            self.after = None
+            self.done.set()
+
+
+class IOPool(object):
+    '''A pool of threads that performs the reads and writes of the values
+    stored on disk. Requests are keyed by the file they work on.'''
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+        # file -> the last request submitted on it
+        self.pending = {}
+        # file -> an outstanding read
+        self.prefetched = {}
+
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.stats = {"writes": 0,
+                      "reads": 0,
+                      "prefetches": 0,
+                      "prefetch_hits": 0}
+
+    def statistics(self):
+        '''Return a dictionary with the number of asynchronous writes,
+        synchronous reads, prefetches issued and prefetches used.'''
+        return dict(self.stats)
+
+    def nthreads(self):
+        if compatibility.size(backend.comm_world) > 1:
+            return 0
+        return backend.parameters["adjoint"]["io_threads"]
+
+    def active(self):
+        return self.nthreads() > 0
+
+    def start(self):
+        while len(self.threads) < self.nthreads():
+            thread = threading.Thread(target=self.work, name="dolfin-adjoint I/O")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        while True:
+            request = self.queue.get()
+            request.run()
+            self.queue.task_done()
+
+    def submit(self, key, fn, *args, **kwargs):
+        '''Run fn(*args) after all the requests previously submitted on key.
+        Without I/O threads, or with background=False, the request is
+        executed immediately.'''
+        with self.lock:
+            request = Request(fn, args, after=self.pending.get(key), check=kwargs.get("check", True))
+            self.pending[key] = request
+
+        if self.active() and kwargs.get("background", True):
+            self.start()
+            self.queue.put(request)
+        else:
+            request.run()
+            if request.check and request.error is not None:
+                self.wait(key)
+        return request
+
+    def write(self, key, fn, *args, **kwargs):
+        '''Run fn(*args) to write key, in the background unless
+        background=False.'''
+        self.prefetched.pop(key, None)
+        self.stats["writes"] += 1
+        return self.submit(key, fn, *args, background=kwargs.get("background", True))
+
+    def prefetch(self, key, fn, *args):
+        '''Start reading key in the background, unless a read is already under
+        way. Return whether key is being read in the background.'''
+        if not self.active():
+            return False
+        if key not in self.prefetched:
+            self.prefetched[key] = self.submit(key, fn, *args, check=False)
+            self.stats["prefetches"] += 1
+        return True
+
+    def read(self, key, fn, *args):
+        '''Return the result of a prefetched read of key, or read it now.'''
+        request = self.prefetched.pop(key, None)
+        if request is not None:
+            request.done.wait()
+            # If the prefetch failed, read again to report the error
+            if request.error is None:
+                self.stats["prefetch_hits"] += 1
+                return request.value
+
+        self.wait(key)
+        self.stats["reads"] += 1
+        return fn(*args)
+
+    def wait(self, key):
+        '''Wait for all the requests on key to finish.'''
+        with self.lock:
+            request = self.pending.pop(key, None)
+        if request is not None:
+            request.done.wait()
+            if request.check and request.error is not None:
+                # Keep the traceback of the worker thread
+                six.reraise(*request.error)
+
+    def forget(self, key):
+        '''Wait for the requests on key and drop any prefetched value.'''
+        self.prefetched.pop(key, None)
+        self.wait(key)
+
+    def wait_all(self):
+        '''Wait for all outstanding requests, e.g. before the files are removed.'''
+        for key in list(self.pending.keys()):
+            self.wait(key)
+        self.prefetched.clear()
+
+
+pool = IOPool()
+atexit.register(pool.wait_all)
@@ -11,6 +11,11 @@ from .enlisting import enlist, delist
 from numpy import ndarray
 from .functional import Functional
 from . import misc
+from . import caching
+from . import storage as tape_storage
+from . import profiling
+from . import memory
+from . import recycling
 
 def replay_dolfin(forget=False, tol=0.0, stop=False):
 
@@ -21,7 +26,7 @@ def replay_dolfin(forget=False, tol=0.0, stop=False):
         success = True
         for i in range(adjglobals.adjointer.equation_count):
             (fwd_var, output) = adjglobals.adjointer.get_forward_solution(i)
-            storage = libadjoint.MemoryStorage(output)
+            storage = tape_storage.forward_storage(output, fwd_var)
             storage.set_compare(tol=tol)
             storage.set_overwrite(True)
             out = adjglobals.adjointer.record_variable(fwd_var, storage)
@@ -49,13 +54,20 @@ def compute_adjoint(functional, forget=True, ignore=[]):
     for i in range(adjglobals.adjointer.timestep_count):
         adjglobals.adjointer.set_functional_dependencies(functional, i)
 
+    if backend.parameters["adjoint"]["prune_adjoint"]:
+        nonzero = caching.reaching_equations(adjglobals.adjointer, functional)
+    else:
+        nonzero = None
+
+    recycling.start_sweep("adjoint")
     for i in range(adjglobals.adjointer.equation_count)[::-1]:
         fwd_var = adjglobals.adjointer.get_forward_variable(i)
         if fwd_var in ignorelist:
             info("Ignoring the adjoint equation for %s" % fwd_var)
             continue
 
-        (adj_var, output) = adjglobals.adjointer.get_adjoint_solution(i, functional)
+        prepare_adjoint(i, fwd_var)
+        (adj_var, output) = solve_adjoint(i, functional, nonzero)
         if output.data:
             if backend.__name__ == "dolfin":
                 output.data.rename(str(adj_var) , "a Function from dolfin-adjoint")
@@ -65,6 +77,7 @@ def compute_adjoint(functional, forget=True, ignore=[]):
         storage = libadjoint.MemoryStorage(output)
         storage.set_overwrite(True)
         adjglobals.adjointer.record_variable(adj_var, storage)
+        memory.sample(fwd_var.timestep)
 
         # forget is None: forget *nothing*.
         # forget is True: forget everything we can, forward and adjoint
@@ -78,19 +91,68 @@ def compute_adjoint(functional, forget=True, ignore=[]):
 
         yield (output.data, adj_var)
 
+    if adjglobals.checkpointer is not None:
+        adjglobals.checkpointer.finish_adjoint()
+
+def solve_adjoint(i, J, nonzero):
+    '''Return the adjoint solution of equation i for J. Where nonzero (the
+    set of equations whose adjoint solutions can be nonzero, or None) rules it
+    out, a zero Function is returned instead of solving.'''
+    if nonzero is not None and i not in nonzero:
+        fwd_var = adjglobals.adjointer.get_forward_variable(i)
+        if adjglobals.adjointer.variable_known(fwd_var):
+            fwd_value = adjglobals.adjointer.get_variable_value(fwd_var).data
+            caching.replay_statistics["adjoint_skipped"] += 1
+            return (fwd_var.to_adjoint(J), adjlinalg.Vector(backend.Function(fwd_value.function_space())))
+
+    caching.replay_statistics["adjoint_solves"] += 1
+    with profiling.region(str(adjglobals.adjointer.get_forward_variable(i)), "adjoint", i):
+        return adjglobals.adjointer.get_adjoint_solution(i, J)
+
+def prepare_adjoint(i, fwd_var, prefetch=True):
+    '''Make the forward values needed by the adjoint equation i available.'''
+    if adjglobals.checkpointer is not None:
+        with profiling.region("prepare_adjoint", "checkpointing", i):
+            adjglobals.checkpointer.prepare_adjoint(fwd_var.timestep)
+    if prefetch:
+        with profiling.region("prefetch", "storage", i):
+            tape_storage.prefetch(adjglobals.adjointer, i)
+
 def compute_tlm(parameter, forget=False):
 
     if isinstance(parameter, (list, tuple)):
         parameter = ListControl(parameter)
 
+    # The tangent linear solutions of the equations that do not depend on
+    # the parameter are zero
+    if backend.parameters["adjoint"]["selective_replay"]:
+        downstream = caching.downstream_equations(adjglobals.adjointer, [parameter])
+    else:
+        downstream = None
+
+    recycling.start_sweep("tlm")
     for i in range(adjglobals.adjointer.equation_count):
-        (tlm_var, output) = adjglobals.adjointer.get_tlm_solution(i, parameter)
+        output = None
+        if downstream is not None and i not in downstream:
+            fwd_var = adjglobals.adjointer.get_forward_variable(i)
+            if adjglobals.adjointer.variable_known(fwd_var):
+                fwd_value = adjglobals.adjointer.get_variable_value(fwd_var).data
+                tlm_var = fwd_var.to_tlm(parameter)
+                output = adjlinalg.Vector(backend.Function(fwd_value.function_space()))
+                caching.replay_statistics["tlm_skipped"] += 1
+
+        if output is None:
+            with profiling.region(str(adjglobals.adjointer.get_forward_variable(i)), "tlm", i):
+                (tlm_var, output) = adjglobals.adjointer.get_tlm_solution(i, parameter)
+            caching.replay_statistics["tlm_solves"] += 1
+
         if output.data:
             output.data.rename(str(tlm_var), "a Function from dolfin-adjoint")
 
         storage = libadjoint.MemoryStorage(output)
         storage.set_overwrite(True)
         adjglobals.adjointer.record_variable(tlm_var, storage)
+        memory.sample(tlm_var.timestep)
 
         yield (output.data, tlm_var)
 
@@ -109,24 +171,39 @@ def compute_gradient(J, param, forget=True, ignore=[], callback=lambda var, outp
     if not isinstance(J, Functional):
         raise ValueError("J must be of type dolfin_adjoint.Functional.")
 
+    return compute_gradients([J], param, forget=forget, ignore=ignore, callback=callback, project=project)[0]
+
+def compute_gradients(Js, param, forget=True, ignore=[], callback=lambda var, output: None, project=False):
+    '''Compute the gradients of the functionals Js with respect to the same
+    controls in a single reverse sweep, and return them as a list.
+
+    For each equation, the adjoint equations of all functionals are solved
+    one after the other, so that the assembled adjoint operator (and the
+    factorisation of direct solvers) is shared by all of them.'''
+    for J in Js:
+        if not isinstance(J, Functional):
+            raise ValueError("J must be of type dolfin_adjoint.Functional.")
+
     flag = misc.pause_annotation()
 
     enlisted_controls = enlist(param)
     param = ListControl(enlisted_controls)
 
-    if backend.parameters["adjoint"]["allow_zero_derivatives"]:
-        dJ_init = []
-        for c in enlisted_controls:
-            if isinstance(c.data(), backend.Constant):
-                dJ_init.append(backend.Constant(0))
-            elif isinstance(c.data(), backend.Function):
-                space = c.data().function_space()
-                dJ_init.append(backend.Function(space))
+    dJdparams = []
+    for J in Js:
+        if backend.parameters["adjoint"]["allow_zero_derivatives"]:
+            dJ_init = []
+            for c in enlisted_controls:
+                if isinstance(c.data(), backend.Constant):
+                    dJ_init.append(backend.Constant(0))
+                elif isinstance(c.data(), backend.Function):
+                    space = c.data().function_space()
+                    dJ_init.append(backend.Function(space))
 
-    else:
-        dJ_init = [None] * len(enlisted_controls)
+        else:
+            dJ_init = [None] * len(enlisted_controls)
 
-    dJdparam = enlisted_controls.__class__(dJ_init)
+        dJdparams.append(enlisted_controls.__class__(dJ_init))
 
     last_timestep = adjglobals.adjointer.timestep_count
 
@@ -139,46 +216,83 @@ def compute_gradient(J, param, forget=True, ignore=[], callback=lambda var, outp
         else:
             ignorelist.append(fn)
 
-    for i in range(adjglobals.adjointer.timestep_count):
-        adjglobals.adjointer.set_functional_dependencies(J, i)
-
-    for i in range(adjglobals.adjointer.equation_count)[::-1]:
-        fwd_var = adjglobals.adjointer.get_forward_variable(i)
-        if fwd_var in ignorelist:
-            info("Ignoring the adjoint equation for %s" % fwd_var)
-            continue
-
-        (adj_var, output) = adjglobals.adjointer.get_adjoint_solution(i, J)
-
-        callback(adj_var, output.data)
-
-        storage = libadjoint.MemoryStorage(output)
-        storage.set_overwrite(True)
-        adjglobals.adjointer.record_variable(adj_var, storage)
-        fwd_var = libadjoint.Variable(adj_var.name, adj_var.timestep, adj_var.iteration)
+    for J in Js:
+        for i in range(adjglobals.adjointer.timestep_count):
+            adjglobals.adjointer.set_functional_dependencies(J, i)
 
-        out = param.equation_partial_derivative(adjglobals.adjointer, output.data, i, fwd_var)
-        dJdparam = _add(dJdparam, out)
+    # The adjoint solutions of the equations that cannot reach a functional
+    # are zero, and those of the equations that do not depend on the
+    # controls do not contribute to the derivatives
+    if backend.parameters["adjoint"]["prune_adjoint"]:
+        nonzero = [caching.reaching_equations(adjglobals.adjointer, J) for J in Js]
+        downstream = caching.downstream_equations(adjglobals.adjointer, enlisted_controls)
+    else:
+        nonzero = [None] * len(Js)
+        downstream = None
 
-        if last_timestep > adj_var.timestep:
-            # We have hit a new timestep, and need to compute this timesteps' \partial J/\partial m contribution
-            out = param.functional_partial_derivative(adjglobals.adjointer, J, adj_var.timestep)
-            dJdparam = _add(dJdparam, out)
+    shared_operators = caching.block_operators
+    if len(Js) > 1:
+        caching.block_operators = {}
 
-        last_timestep = adj_var.timestep
+    recycling.start_sweep("adjoint")
+    try:
+        for i in range(adjglobals.adjointer.equation_count)[::-1]:
+            fwd_var = adjglobals.adjointer.get_forward_variable(i)
+            if fwd_var in ignorelist:
+                info("Ignoring the adjoint equation for %s" % fwd_var)
+                continue
+
+            unused = downstream is not None and i not in downstream
+            prepare_adjoint(i, fwd_var, prefetch=not unused)
+            if unused:
+                caching.replay_statistics["adjoint_skipped"] += len(Js)
+
+            for (n, J) in enumerate(Js):
+                if not unused:
+                    (adj_var, output) = solve_adjoint(i, J, nonzero[n])
+
+                    callback(adj_var, output.data)
+
+                    storage = libadjoint.MemoryStorage(output)
+                    storage.set_overwrite(True)
+                    adjglobals.adjointer.record_variable(adj_var, storage)
+
+                    with profiling.region("equation_partial_derivative", "derivative", i):
+                        out = param.equation_partial_derivative(adjglobals.adjointer, output.data, i, fwd_var)
+                    dJdparams[n] = _add(dJdparams[n], out)
+
+                if last_timestep > fwd_var.timestep:
+                    # We have hit a new timestep, and need to compute this timesteps' \partial J/\partial m contribution
+                    with profiling.region("functional_partial_derivative", "derivative", i):
+                        out = param.functional_partial_derivative(adjglobals.adjointer, J, fwd_var.timestep)
+                    dJdparams[n] = _add(dJdparams[n], out)
+
+            last_timestep = fwd_var.timestep
+            memory.sample(fwd_var.timestep)
+
+            if caching.block_operators is not None:
+                caching.block_operators.clear()
+
+            # The pruned equations are not solved, but the values they no
+            # longer need are forgotten all the same
+            if forget is None:
+                pass
+            elif forget:
+                adjglobals.adjointer.forget_adjoint_equation(i)
+            else:
+                adjglobals.adjointer.forget_adjoint_values(i)
+    finally:
+        caching.block_operators = shared_operators
 
-        if forget is None:
-            pass
-        elif forget:
-            adjglobals.adjointer.forget_adjoint_equation(i)
-        else:
-            adjglobals.adjointer.forget_adjoint_values(i)
+    if adjglobals.checkpointer is not None:
+        adjglobals.checkpointer.finish_adjoint()
 
-    rename(J, dJdparam, param)
+    for (J, dJdparam) in zip(Js, dJdparams):
+        rename(J, dJdparam, param)
 
     misc.continue_annotation(flag)
 
-    return postprocess(dJdparam, project, list_type=enlisted_controls)
+    return [postprocess(dJdparam, project, list_type=enlisted_controls) for dJdparam in dJdparams]
 
 def rename(J, dJdparam, param):
     if isinstance(dJdparam, list):
@@ -210,107 +324,173 @@ def postprocess(dJdparam, project, list_type):
 
     return dJdparam
 
-def hessian(J, m, warn=True):
+def hessian(J, m, warn=True, pin_adjoint=False):
     '''Choose which Hessian the user wants.'''
     with misc.annotations(False):
-        H = BasicHessian(J, m, warn=warn)
+        H = BasicHessian(J, m, warn=warn, pin_adjoint=pin_adjoint)
     return H
 
 class BasicHessian(libadjoint.Matrix):
     '''A basic implementation of the Hessian class that recomputes the tangent linear, adjoint and second-order adjoint
-    equations on each action. Should be the slowest, but safest, with the lowest memory requirements.'''
-    def __init__(self, J, m, warn=True):
+    equations on each action. Should be the slowest, but safest, with the lowest memory requirements.
+
+    With pin_adjoint=True, the first-order adjoint solutions are kept in memory
+    for as long as the control values do not change, instead of being
+    recomputed whenever they have been forgotten from the tape.'''
+    def __init__(self, J, m, warn=True, pin_adjoint=False):
         self.J = J
 
         self.enlisted_controls = enlist(m)
         self.m = ListControl(self.enlisted_controls)
 
+        self.pin_adjoint = pin_adjoint
+        self.release()
+
         if warn:
             backend.info_red("Warning: Hessian computation is still experimental and is known to not work for some problems. Please Taylor test thoroughly.")
 
+    def release(self):
+        '''Forget the pinned adjoint solutions.'''
+        self.pinned = {}
+        self.pinned_hash = None
+
     def __call__(self, m_dot, project=False):
+        return self.apply_block([m_dot], project=project, share_operators=False)[0]
+
+    def apply_block(self, m_dots, project=False, share_operators=True):
+        '''Return the list of the Hessian actions in the directions m_dots.
+        The tangent linear and second-order adjoint equations are swept once
+        for all directions: the equations of all directions are solved one
+        after the other, so that each assembled operator (and its
+        factorisation, for direct solvers) is shared by all of them. With
+        share_operators=False, each solve assembles its own operator, as the
+        Hessian action in a single direction does.'''
         flag = misc.pause_annotation()
         hess_action_timer = backend.Timer("Hessian action")
 
-        m_p = self.m.set_perturbation(m_dot)
+        m_ps = [DirectionControl(self.m.set_perturbation(m_dot), k) for (k, m_dot) in enumerate(m_dots)]
         last_timestep = adjglobals.adjointer.timestep_count
 
-        m_dot = enlist(m_dot)
-        Hm = []
-        for m_dot_cmp in m_dot:
-            if hasattr(m_dot_cmp, 'function_space'):
-                Hm.append(backend.Function(m_dot_cmp.function_space()))
-            elif isinstance(m_dot_cmp, float):
-                Hm.append(0.0)
-            else:
-                raise NotImplementedError("Sorry, don't know how to handle this")
-
-        tlm_timer = backend.Timer("Hessian action (TLM)")
-        # run the tangent linear model
-        for (tlm, tlm_var) in compute_tlm(m_p, forget=None):
-            pass
+        m_dots = [enlist(m_dot) for m_dot in m_dots]
+        Hms = []
+        for m_dot in m_dots:
+            Hm = []
+            for m_dot_cmp in m_dot:
+                if hasattr(m_dot_cmp, 'function_space'):
+                    Hm.append(backend.Function(m_dot_cmp.function_space()))
+                elif isinstance(m_dot_cmp, float):
+                    Hm.append(0.0)
+                else:
+                    raise NotImplementedError("Sorry, don't know how to handle this")
+            Hms.append(Hm)
+
+        if self.pin_adjoint:
+            control_hash = caching.value_hash(self.m.data())
+            if control_hash != self.pinned_hash:
+                self.release()
+                self.pinned_hash = control_hash
+
+        shared_operators = caching.block_operators
+        caching.block_operators = {} if share_operators else None
+        try:
+            tlm_timer = backend.Timer("Hessian action (TLM)")
+            # run the tangent linear models
+            recycling.start_sweep("tlm")
+            for i in range(adjglobals.adjointer.equation_count):
+                for m_p in m_ps:
+                    with profiling.region("Hessian action (TLM)", "hessian", i):
+                        (tlm_var, output) = adjglobals.adjointer.get_tlm_solution(i, m_p)
+                    if output.data:
+                        output.data.rename(str(tlm_var), "a Function from dolfin-adjoint")
+
+                    storage = libadjoint.MemoryStorage(output)
+                    storage.set_overwrite(True)
+                    adjglobals.adjointer.record_variable(tlm_var, storage)
+                memory.sample(tlm_var.timestep)
+                if caching.block_operators is not None:
+                    caching.block_operators.clear()
+
+            tlm_timer.stop()
+
+            # run the adjoint and second-order adjoint equations.
+            recycling.start_sweep("soa")
+            for i in range(adjglobals.adjointer.equation_count)[::-1]:
+                adj_var = adjglobals.adjointer.get_forward_variable(i).to_adjoint(self.J)
+                adj = self.adjoint(i, adj_var)
+
+                new_timestep = last_timestep > adj_var.timestep
+                if new_timestep:
+                    last_timestep = adj_var.timestep
+
+                for (m_p, m_dot, Hm) in zip(m_ps, m_dots, Hms):
+                    soa_timer = backend.Timer("Hessian action (SOA)")
+                    with profiling.region("Hessian action (SOA)", "hessian", i):
+                        (soa_var, soa_vec) = adjglobals.adjointer.get_soa_solution(i, self.J, m_p)
+                    soa_timer.stop()
+                    soa = soa_vec.data
+
+                    func_timer = backend.Timer("Hessian action (derivative formula)")
+                    with profiling.region("Hessian action (derivative formula)", "derivative", i):
+                        # now implement the Hessian action formula.
+                        out = self.m.equation_partial_derivative(adjglobals.adjointer, soa, i, soa_var.to_forward())
+                        hess_inner(Hm, out)
+
+                        out = self.m.equation_partial_second_derivative(adjglobals.adjointer, adj, i, soa_var.to_forward(), m_dot)
+                        hess_inner(Hm, out)
+
+                        if new_timestep:
+                            # We have hit a new timestep, and need to compute this timesteps' \partial^2 J/\partial m^2 contribution
+                            out = self.m.functional_partial_second_derivative(adjglobals.adjointer, self.J, adj_var.timestep, m_dot)
+                            hess_inner(Hm, out)
+
+                    func_timer.stop()
+
+                    storage = libadjoint.MemoryStorage(soa_vec)
+                    storage.set_overwrite(True)
+                    adjglobals.adjointer.record_variable(soa_var, storage)
+                memory.sample(adj_var.timestep)
+                if caching.block_operators is not None:
+                    caching.block_operators.clear()
+        finally:
+            caching.block_operators = shared_operators
+
+        for Hm in Hms:
+            for Hm_cmp in Hm:
+                if isinstance(Hm_cmp, backend.Function):
+                    Hm_cmp.rename("d^2(%s)/d(%s)^2" % (str(self.J), str(self.m)), "a Function from dolfin-adjoint")
 
-        tlm_timer.stop()
+        misc.continue_annotation(flag)
+        return [postprocess(Hm, project, list_type=self.enlisted_controls) for Hm in Hms]
 
-        # run the adjoint and second-order adjoint equations.
-        for i in range(adjglobals.adjointer.equation_count)[::-1]:
-            adj_var = adjglobals.adjointer.get_forward_variable(i).to_adjoint(self.J)
-            # Only recompute the adjoint variable if we do not have it yet
+    def adjoint(self, i, adj_var):
+        '''Return the value of the first-order adjoint variable of equation i.'''
+        if self.pin_adjoint and str(adj_var) in self.pinned:
+            adj = self.pinned[str(adj_var)]
             try:
-                adj = adjglobals.adjointer.get_variable_value(adj_var)
+                adjglobals.adjointer.get_variable_value(adj_var)
             except (libadjoint.exceptions.LibadjointErrorHashFailed, libadjoint.exceptions.LibadjointErrorNeedValue):
-                adj_timer = backend.Timer("Hessian action (ADM)")
-                adj = adjglobals.adjointer.get_adjoint_solution(i, self.J)[1]
-                adj_timer.stop()
-
+                # The SOA equations need it on the tape
                 storage = libadjoint.MemoryStorage(adj)
                 adjglobals.adjointer.record_variable(adj_var, storage)
+            profiling.count("pinned adjoint hits")
+            return adj.data
+
+        # Only recompute the adjoint variable if we do not have it yet
+        try:
+            adj = adjglobals.adjointer.get_variable_value(adj_var)
+        except (libadjoint.exceptions.LibadjointErrorHashFailed, libadjoint.exceptions.LibadjointErrorNeedValue):
+            adj_timer = backend.Timer("Hessian action (ADM)")
+            with profiling.region("Hessian action (ADM)", "hessian", i):
+                adj = adjglobals.adjointer.get_adjoint_solution(i, self.J)[1]
+            adj_timer.stop()
 
-            adj = adj.data
-
-            soa_timer = backend.Timer("Hessian action (SOA)")
-            (soa_var, soa_vec) = adjglobals.adjointer.get_soa_solution(i, self.J, m_p)
-            soa_timer.stop()
-            soa = soa_vec.data
-
-            def hess_inner(Hm, out):
-                assert len(out) == len(Hm)
-                for i in range(len(out)):
-                    if out[i] is not None:
-                        if isinstance(Hm[i], backend.Function):
-                            Hm[i].vector().axpy(1.0, out[i].vector())
-                        elif isinstance(Hm[i], float):
-                            Hm[i] += out[i]
-                        else:
-                            raise ValueError("Do not know what to do with this")
-                return Hm
-
-            func_timer = backend.Timer("Hessian action (derivative formula)")
-            # now implement the Hessian action formula.
-            out = self.m.equation_partial_derivative(adjglobals.adjointer, soa, i, soa_var.to_forward())
-            Hm = hess_inner(Hm, out)
-
-            out = self.m.equation_partial_second_derivative(adjglobals.adjointer, adj, i, soa_var.to_forward(), m_dot)
-            Hm = hess_inner(Hm, out)
-
-            if last_timestep > adj_var.timestep:
-                # We have hit a new timestep, and need to compute this timesteps' \partial^2 J/\partial m^2 contribution
-                last_timestep = adj_var.timestep
-                out = self.m.functional_partial_second_derivative(adjglobals.adjointer, self.J, adj_var.timestep, m_dot)
-                Hm = hess_inner(Hm, out)
-
-            func_timer.stop()
-
-            storage = libadjoint.MemoryStorage(soa_vec)
-            storage.set_overwrite(True)
-            adjglobals.adjointer.record_variable(soa_var, storage)
+            storage = libadjoint.MemoryStorage(adj)
+            adjglobals.adjointer.record_variable(adj_var, storage)
 
-        for Hm_cmp in Hm:
-            if isinstance(Hm_cmp, backend.Function):
-                Hm_cmp.rename("d^2(%s)/d(%s)^2" % (str(self.J), str(self.m)), "a Function from dolfin-adjoint")
+        if self.pin_adjoint:
+            self.pinned[str(adj_var)] = adj
 
-        misc.continue_annotation(flag)
-        return postprocess(Hm, project, list_type=self.enlisted_controls)
+        return adj.data
 
     def action(self, x, y):
         assert isinstance(x.data, backend.Function)
@@ -362,6 +542,19 @@ class BasicHessian(libadjoint.Matrix):
 
         return retval
 
+def hess_inner(Hm, out):
+    # Accumulate the contribution out into the Hessian action Hm.
+    assert len(out) == len(Hm)
+    for i in range(len(out)):
+        if out[i] is not None:
+            if isinstance(Hm[i], backend.Function):
+                Hm[i].vector().axpy(1.0, out[i].vector())
+            elif isinstance(Hm[i], float):
+                Hm[i] += out[i]
+            else:
+                raise ValueError("Do not know what to do with this")
+    return Hm
+
 def _add(value, increment):
     # Add increment to value correctly taking into account None.
 
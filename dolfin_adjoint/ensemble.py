@@ -0,0 +1,206 @@
+"""
+Reduced functionals that sum independent scenarios over groups of processes.
+
+An :py:class:`Ensemble` splits the world communicator into groups of M
+processes. Every group builds its meshes on its own communicator
+(:py:attr:`Ensemble.comm`), annotates the scenarios it was given, and
+keeps its own tape; the groups only talk to each other when the values,
+gradients and Hessian actions of their parts of the functional are summed
+over :py:attr:`Ensemble.ensemble_comm`, which connects the processes with
+the same rank in every group.
+
+For the sums to be meaningful, every group must discretise the controls in
+the same way: the same mesh, built with the same number of processes, so
+that the local parts of the control vectors line up.
+"""
+import libadjoint
+import numpy
+import backend
+from backend import Function, Constant
+from .reduced_functional import ReducedFunctional
+from .controls import FunctionControl
+from .compatibility import randomise
+from .utils import constant_to_array
+
+
+class Ensemble(object):
+    '''Split comm (by default the world communicator) into groups of M
+    processes each.
+
+    .. code-block:: python
+
+        ensemble = Ensemble(M=4)
+        mesh = UnitSquareMesh(ensemble.comm, 64, 64)
+        for i in ensemble.scenarios(32):
+            ...
+    '''
+
+    def __init__(self, comm=None, M=1):
+        try:
+            from mpi4py import MPI
+        except ImportError:
+            print("Ensembles need mpi4py. Try `pip install mpi4py`")
+            raise
+
+        if comm is None:
+            comm = backend.comm_world
+        #: The communicator that was split.
+        self.global_comm = comm
+        if hasattr(comm, "tompi4py"):
+            comm = comm.tompi4py()
+
+        if M < 1 or comm.size % M != 0:
+            raise libadjoint.exceptions.LibadjointErrorInvalidInputs("Cannot split %d processes into groups of %d." % (comm.size, M))
+
+        #: The number of the group of this process, and the number of groups.
+        self.group = comm.rank // M
+        self.groups = comm.size // M
+
+        #: The communicator of the group, on which the meshes are built.
+        self.comm = comm.Split(color=self.group, key=comm.rank)
+        #: The communicator of the processes with the same rank in every group.
+        self.ensemble_comm = comm.Split(color=comm.rank % M, key=comm.rank)
+
+        self.MPI = MPI
+
+    def scenarios(self, n):
+        '''Return the numbers of the scenarios, out of n, this group runs.'''
+        return range(self.group, n, self.groups)
+
+    def allreduce(self, value):
+        '''Return the sum of value over the groups. value may be a float, a
+        Function, a Constant or a list of those; it is not modified.'''
+        if isinstance(value, (list, tuple)):
+            return [self.allreduce(v) for v in value]
+        elif isinstance(value, Function):
+            local = self.local_array(value)
+            self.check_sizes(len(local))
+            total = numpy.empty_like(local)
+            self.ensemble_comm.Allreduce(local, total, op=self.MPI.SUM)
+
+            out = Function(value.function_space())
+            if backend.__name__ == "dolfin":
+                out.vector().set_local(total)
+                out.vector().apply("insert")
+            else:
+                out.dat.data[...] = total
+            return out
+        elif isinstance(value, Constant):
+            local = numpy.array(constant_to_array(value), dtype=float)
+            total = numpy.empty_like(local)
+            self.ensemble_comm.Allreduce(local, total, op=self.MPI.SUM)
+            return Constant(total if total.shape else float(total))
+        elif value is None:
+            return None
+        else:
+            return self.ensemble_comm.allreduce(value, op=self.MPI.SUM)
+
+    def bcast(self, function):
+        '''Set the values of the Function function to those it has on the
+        first group.'''
+        local = self.local_array(function)
+        self.check_sizes(len(local))
+        self.ensemble_comm.Bcast(local, root=0)
+
+        if backend.__name__ == "dolfin":
+            function.vector().set_local(local)
+            function.vector().apply("insert")
+        else:
+            function.dat.data[...] = local.reshape(function.dat.data.shape)
+        return function
+
+    def local_array(self, function):
+        if backend.__name__ == "dolfin":
+            return numpy.array(function.vector().get_local(), dtype=float)
+        else:
+            return numpy.array(function.dat.data_ro, dtype=float).reshape(-1)
+
+    def check_sizes(self, size):
+        sizes = self.ensemble_comm.allgather(size)
+        if min(sizes) != max(sizes):
+            raise libadjoint.exceptions.LibadjointErrorInvalidInputs("The groups of the ensemble partition the controls differently (local sizes %s)." % sizes)
+
+
+class EnsembleHessian(object):
+    '''The Hessian action of a ReducedFunctional, summed over the ensemble.'''
+
+    def __init__(self, H, ensemble):
+        self.local = H
+        self.ensemble = ensemble
+
+    def __getattr__(self, name):
+        return getattr(self.local, name)
+
+    def __call__(self, m_dot, project=False):
+        return self.ensemble.allreduce(self.local(m_dot, project=project))
+
+
+class EnsembleReducedFunctional(ReducedFunctional):
+    ''' A ReducedFunctional whose value is the sum of the functionals of all
+    the groups of an :py:class:`Ensemble`.
+
+    Every group annotates its own scenarios (see
+    :py:meth:`Ensemble.scenarios`) and passes the sum of their functionals,
+    and the controls on its own meshes, to EnsembleReducedFunctional. The
+    forward and adjoint runs of the groups proceed concurrently, and the
+    functional values, gradients and Hessian actions are then summed over
+    the groups, so that every process sees the reduced functional of all the
+    scenarios and the optimisers can be used as usual:
+
+    .. code-block:: python
+
+        ensemble = Ensemble(M=4)
+        mesh = UnitSquareMesh(ensemble.comm, 64, 64)
+        ...
+        j = 0
+        for i in ensemble.scenarios(32):
+            u = forward(m, forcing[i])
+            j += misfit(u, observations[i])*dx
+
+        rf = EnsembleReducedFunctional(Functional(j*dt[FINISH_TIME]), Control(m), ensemble)
+        m_opt = minimize(rf)
+
+    Every group must run at least one scenario. The keyword arguments are
+    those of :py:class:`ReducedFunctional`; note that the callbacks and the
+    cache see the values of this group only.'''
+
+    def __init__(self, functional, controls, ensemble, **kwargs):
+        super(EnsembleReducedFunctional, self).__init__(functional, controls, **kwargs)
+
+        #: The :py:class:`Ensemble` the functional is summed over.
+        self.ensemble = ensemble
+
+        if hasattr(self, "H"):
+            self.H = EnsembleHessian(self.H, ensemble)
+
+    def __call__(self, value):
+        local = super(EnsembleReducedFunctional, self).__call__(value)
+        return self.ensemble.allreduce(local)
+
+    def derivative(self, forget=True, project=False):
+        local = super(EnsembleReducedFunctional, self).derivative(forget=forget, project=project)
+        return self.ensemble.allreduce(local)
+
+    def taylor_test(self, value=None, test_hessian=False, seed=None, perturbation_direction=None, size=None, processes=None):
+        """ Run the Taylor test of :py:meth:`ReducedFunctional.taylor_test`
+        on the sum over the groups. The random directions of the Function
+        controls are drawn on the first group and broadcast to the others,
+        so that every group perturbs its scenarios in the same direction."""
+        if perturbation_direction is None:
+            perturbation_direction = [self._random_direction(c) for c in self.controls]
+
+        return super(EnsembleReducedFunctional, self).taylor_test(value=value, test_hessian=test_hessian, seed=seed,
+                                                                   perturbation_direction=perturbation_direction,
+                                                                   size=size, processes=processes)
+
+    def _random_direction(self, control):
+        # The other controls have deterministic default directions
+        if not isinstance(control, FunctionControl):
+            return None
+        direction = Function(control.data().function_space())
+        randomise(direction)
+        return self.ensemble.bcast(direction)
+
+    def mpi_comm(self):
+        """ Return the communicator of all the groups."""
+        return self.ensemble.global_comm
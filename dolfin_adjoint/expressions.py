@@ -1,14 +1,28 @@
 import backend
 import collections
-import copy
+from . import snapshots
 
 # Our equation may depend on Expressions, and those Expressions may have parameters
 # (e.g. for time-dependent boundary conditions).
 # In order to successfully replay the forward solve, we need to keep those parameters around.
-# Here, we overload the Expression class to record all of the parameters
+# Here, we overload the Expression class to record all of the parameters, and
+# log their values as they are set (see snapshots.py).
 
 expression_attrs = collections.defaultdict(set)
 
+# The keyword arguments of the Expression constructor that are not parameters
+constructor_kwargs = ("degree", "element", "cell", "domain", "name", "label", "mpi_comm")
+
+def _apply(key, value):
+    (expression, attr) = key
+    expression_setattr(expression, attr, value)
+
+def _read(key):
+    (expression, attr) = key
+    return getattr(expression, attr)
+
+log = snapshots.ParameterLog(_apply, _read)
+
 if backend.__name__ == "dolfin":
     # A rant:
     # This had to be one of the most ridiculously difficult things in the whole
@@ -23,32 +37,36 @@ if backend.__name__ == "dolfin":
     def __init__(self, *args, **kwargs):
         expression_init(self, *args, **kwargs)
         attr_list = expression_attrs[self]
-        attr_list.union(list(kwargs.keys()))
+        attr_list.update(k for k in kwargs.keys() if k not in constructor_kwargs)
 
     backend.Expression.__init__ = __init__
 
     expression_setattr = backend.Expression.__setattr__
     def __setattr__(self, k, v):
-        expression_setattr(self, k, v)
         if k not in ["_ufl_element", "_ufl_shape", "_ufl_function_space", "_count", "_countedclass", "_repr", 
                      "_element", "this", "_value_shape", "user_parameters", "_hash"]: # <-- you may need to add more here as dolfin changes
+            if not log.known((self, k)):
+                try:
+                    log.baseline((self, k), getattr(self, k))
+                except Exception:
+                    # Not every attribute can be read before it is set
+                    pass
+            expression_setattr(self, k, v)
+            log.record((self, k), v)
             attr_list = expression_attrs[self]
             attr_list.add(k)
+        else:
+            expression_setattr(self, k, v)
     backend.Expression.__setattr__ = __setattr__
 
-def update_expressions(d):
-    for expression in d:
-        expr_dict = d[expression]
-        for k in expr_dict:
-            backend.Expression.__setattr__(expression, k, expr_dict[k])
+def update_expressions(version):
+    '''Restore the parameters of the Expressions to the snapshot returned by freeze_dict.'''
+    log.restore(version)
 
 def freeze_dict():
-    new_dict = {}
-    for expression in expression_attrs:
-        attr_list = expression_attrs[expression]
-        new_dict[expression] = {}
-
-        for attr in attr_list:
-            new_dict[expression][attr] = copy.copy(getattr(expression, attr))
+    '''Return a snapshot of the parameters of all Expressions.'''
+    return log.freeze()
 
-    return new_dict
+def reset():
+    expression_attrs.clear()
+    log.clear()
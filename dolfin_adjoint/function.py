@@ -10,6 +10,7 @@ from . import adjglobals
 from . import utils
 from . import misc
 from . import compatibility
+from . import storage
 
 dolfin_assign = misc.noannotations(backend.Function.assign)
 dolfin_split  = misc.noannotations(backend.Function.split)
@@ -77,7 +78,7 @@ def dolfin_adjoint_assign(self, other, annotate=None, *args, **kwargs):
     dep = adjglobals.adj_variables.next(self)
 
     if backend.parameters["adjoint"]["record_all"]:
-        adjglobals.adjointer.record_variable(dep, libadjoint.MemoryStorage(adjlinalg.Vector(self)))
+        adjglobals.adjointer.record_variable(dep, storage.forward_storage(adjlinalg.Vector(self), dep))
 
     rhs = LinComRHS(functions, weights, fn_space)
     register_initial_conditions(zip(rhs.coefficients(),rhs.dependencies()), linear=True)
@@ -109,7 +110,7 @@ def dolfin_adjoint_interpolate(self, other, annotate=None):
     out = dolfin_interpolate(self, other)
     if annotate is True:
         assignment.register_assign(self, other, op=backend.interpolate)
-        adjglobals.adjointer.record_variable(adjglobals.adj_variables[self], libadjoint.MemoryStorage(adjlinalg.Vector(self)))
+        adjglobals.adjointer.record_variable(adjglobals.adj_variables[self], storage.forward_storage(adjlinalg.Vector(self), adjglobals.adj_variables[self]))
 
     return out
 
@@ -4,6 +4,7 @@ from . import adjglobals
 from . import solving
 import libadjoint
 from . import adjlinalg
+from . import storage
 
 if hasattr(backend, 'FunctionAssigner'):
     class FunctionAssigner(backend.FunctionAssigner):
@@ -34,7 +35,7 @@ if hasattr(backend, 'FunctionAssigner'):
 
                 solving.register_initial_conditions(zip(rhs.coefficients(),rhs.dependencies()), linear=True)
                 if backend.parameters["adjoint"]["record_all"]:
-                    adjglobals.adjointer.record_variable(receiving_dep, libadjoint.MemoryStorage(adjlinalg.Vector(receiving_super)))
+                    adjglobals.adjointer.record_variable(receiving_dep, storage.forward_storage(adjlinalg.Vector(receiving_super), receiving_dep))
 
                 eq = libadjoint.Equation(receiving_dep, blocks=[receiving_identity], targets=[receiving_dep], rhs=rhs)
                 cs = adjglobals.adjointer.register_equation(eq)
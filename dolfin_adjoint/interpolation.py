@@ -5,6 +5,7 @@ import ufl
 from . import adjglobals
 from . import adjlinalg
 from . import utils
+from . import storage
 
 def interpolate(v, V, annotate=None, name=None):
     '''The interpolate call changes Function data, and so it too must be annotated so that the
@@ -34,7 +35,7 @@ def interpolate(v, V, annotate=None, name=None):
                 dep = adjglobals.adj_variables.next(out)
 
                 if backend.parameters["adjoint"]["record_all"]:
-                    adjglobals.adjointer.record_variable(dep, libadjoint.MemoryStorage(adjlinalg.Vector(out)))
+                    adjglobals.adjointer.record_variable(dep, storage.forward_storage(adjlinalg.Vector(out), dep))
 
                 initial_eq = libadjoint.Equation(dep, blocks=[identity_block], targets=[dep], rhs=rhs)
                 cs = adjglobals.adjointer.register_equation(initial_eq)
@@ -7,6 +7,8 @@ from . import adjlinalg
 from . import adjglobals
 from . import misc
 from . import utils
+from . import storage
+from . import tape_files
 
 class LinearSolver(dolfin.LinearSolver):
     '''This object is overloaded so that solves using this class are automatically annotated,
@@ -176,10 +178,13 @@ class LinearSolver(dolfin.LinearSolver):
             nonzero_initial_guess = parameters['nonzero_initial_guess'] if 'nonzero_initial_guess' in parameters else False
             solving.annotate(A == b, u, bcs, matrix_class=LinearSolverMatrix, initial_guess=nonzero_initial_guess, replace_map=True)
 
-        out = dolfin.LinearSolver.solve(self, *args, **kwargs)
+        if to_annotate and tape_files.load_solution(u):
+            out = 0
+        else:
+            out = dolfin.LinearSolver.solve(self, *args, **kwargs)
 
         if to_annotate and dolfin.parameters["adjoint"]["record_all"]:
-            adjglobals.adjointer.record_variable(adjglobals.adj_variables[u], libadjoint.MemoryStorage(adjlinalg.Vector(u)))
+            adjglobals.adjointer.record_variable(adjglobals.adj_variables[u], storage.forward_storage(adjlinalg.Vector(u), adjglobals.adj_variables[u]))
 
         return out
 
@@ -1,12 +1,13 @@
 import dolfin
 from . import solving
 from . import assembly
-import libadjoint
 from . import adjglobals
 from . import adjlinalg
 from . import misc
 from . import utils
 from . import caching
+from . import storage
+from . import tape_files
 
 class LocalSolverMatrix(adjlinalg.Matrix):
     def solve(self, var, b):
@@ -34,6 +35,7 @@ class LocalSolverMatrix(adjlinalg.Matrix):
             newsolver = dolfin.LocalSolver(a, None, solver_type=self.solver_parameters["solver_type"])
             if self.solver_parameters["factorize"] : newsolver.factorize()
             caching.localsolvers[idx] = newsolver
+            caching.record_entry("localsolvers", idx, [a])
         else:
             if dolfin.parameters["adjoint"]["debug_cache"]:
                 dolfin.info_green("Reusing LocalSolver")
@@ -67,14 +69,17 @@ class LocalSolver(dolfin.LocalSolver):
                             solver_parameters={"solver_type": self.solver_type, "factorize" : self.adjoint_factorize}, \
                             matrix_class=LocalSolverMatrix)
 
-        # Use standard local solver
-        out = dolfin.LocalSolver.solve_local(self, x_vec, b_vec, b_dofmap)
+        if to_annotate and tape_files.load_solution(x):
+            out = None
+        else:
+            # Use standard local solver
+            out = dolfin.LocalSolver.solve_local(self, x_vec, b_vec, b_dofmap)
 
         if to_annotate:
             # checkpointing
             if dolfin.parameters["adjoint"]["record_all"]:
-                adjglobals.adjointer.record_variable(adjglobals.adj_variables[x],
-                           libadjoint.MemoryStorage(adjlinalg.Vector(x)))
+                var = adjglobals.adj_variables[x]
+                adjglobals.adjointer.record_variable(var, storage.forward_storage(adjlinalg.Vector(x), var))
 
         return out
 
@@ -6,9 +6,23 @@ from . import adjglobals
 from . import adjlinalg
 from . import misc
 from . import utils
+from . import caching
+from . import storage
+from . import tape_files
 
 lu_solvers = []
 adj_lu_solvers = []
+# The caching.form_dependencies of the operator of each solver
+lu_solver_dependencies = []
+
+def reset_lu_solvers(changes=None):
+    # Forget the factorisations of the operators that depend on something
+    # affected by changes (by default, all of them). This is needed for
+    # example when the tape is re-evaluated at a new control value.
+    for idx in range(len(lu_solvers)):
+        if changes is None or changes.affects(lu_solver_dependencies[idx]):
+            lu_solvers[idx] = None
+            adj_lu_solvers[idx] = None
 
 def make_LUSolverMatrix(idx, reuse_factorization):
     class LUSolverMatrix(adjlinalg.Matrix):
@@ -136,13 +150,21 @@ class LUSolver(dolfin.LUSolver):
                 self.__global_list_idx__ = len(lu_solvers)
                 lu_solvers.append(self)
                 adj_lu_solvers.append(None)
+                lu_solver_dependencies.append(frozenset())
+
+            if self.__global_list_idx__ is not None:
+                idx = self.__global_list_idx__
+                lu_solver_dependencies[idx] = lu_solver_dependencies[idx].union(caching.form_dependencies([A]))
 
             solving.annotate(A == b, x, eq_bcs, solver_parameters={"linear_solver": "lu"}, matrix_class=make_LUSolverMatrix(self.__global_list_idx__, self.parameters["reuse_factorization"]))
 
-        out = dolfin.LUSolver.solve(self, *args, **kwargs)
+        if to_annotate and tape_files.load_solution(x):
+            out = 0
+        else:
+            out = dolfin.LUSolver.solve(self, *args, **kwargs)
 
         if to_annotate:
             if dolfin.parameters["adjoint"]["record_all"]:
-                adjglobals.adjointer.record_variable(adjglobals.adj_variables[x], libadjoint.MemoryStorage(adjlinalg.Vector(x)))
+                adjglobals.adjointer.record_variable(adjglobals.adj_variables[x], storage.forward_storage(adjlinalg.Vector(x), adjglobals.adj_variables[x]))
 
         return out
@@ -9,6 +9,7 @@ from . import expressions
 from . import adjrhs
 from . import adjlinalg
 from . import adjglobals
+from . import storage
 
 import hashlib
 import copy
@@ -209,7 +210,7 @@ class AdjointPETScKrylovSolver(backend.PETScKrylovSolver):
 
         if annotate:
             if backend.parameters["adjoint"]["record_all"]:
-                adjglobals.adjointer.record_variable(var, libadjoint.MemoryStorage(adjlinalg.Vector(x.function)))
+                adjglobals.adjointer.record_variable(var, storage.forward_storage(adjlinalg.Vector(x.function), var))
 
         timer.stop()
 
@@ -0,0 +1,240 @@
+"""
+Memoization of the evaluations of a :py:class:`ReducedFunctional`.
+
+The functional values, gradients and Hessian actions are keyed by the kind
+of evaluation and the content hash of the control values
+(caching.value_hash). Values are stored packed: floats as they
+are, Functions as the binary array of their local dofs, so that every hit
+hands out fresh objects that the caller is free to modify.
+
+Two stores are provided. :py:class:`InMemoryMemo` keeps a bounded number of
+entries in memory and evicts the least recently used ones.
+:py:class:`SQLiteMemo` additionally appends every entry to an sqlite
+database as it is computed, so that an optimisation can be restarted
+cheaply, and bounds the size of the database in the same way.
+
+The size of a Function is charged as its global size divided by the number
+of processes, so that all processes make the same eviction decisions.
+"""
+import collections
+import os
+import six.moves.cPickle as pickle
+
+import numpy
+import backend
+import libadjoint
+from . import compatibility
+from . import profiling
+
+
+KINDS = ("functional", "derivative", "hessian")
+
+
+def pack(value):
+    '''Return a picklable representation of value, and its size in bytes.'''
+    if isinstance(value, (list, tuple)):
+        packed = [pack(x) for x in value]
+        return (("list", [p for (p, nbytes) in packed]), sum(nbytes for (p, nbytes) in packed))
+    elif isinstance(value, float):
+        return (value, 8)
+    elif isinstance(value, backend.Constant):
+        array = numpy.array(value.values(), dtype=numpy.float64)
+        return (("Constant", array), array.nbytes)
+    elif isinstance(value, backend.Function):
+        array = numpy.array(value.vector().get_local(), dtype=numpy.float64)
+        nprocs = compatibility.size(compatibility.function_comm(value))
+        return (("Function", array), value.vector().size()*8 // nprocs)
+    else:
+        raise Exception("Don't know how to store %s" % value)
+
+
+def unpack(packed, V):
+    '''Rebuild a value from its packed representation. V is the function space
+    (or the list of function spaces) of the Functions in it.'''
+    if isinstance(packed, float):
+        return packed
+
+    (kind, data) = packed
+    if kind == "list":
+        return [unpack(data[i], V[i]) for i in range(len(data))]
+    elif kind == "Constant":
+        if len(data) == 1:
+            return backend.Constant(data[0])
+        return backend.Constant(data)
+    elif kind == "Function":
+        if isinstance(V, (list, tuple)):
+            V = V[0]
+        f = backend.Function(V)
+        vec = f.vector()
+        vec.set_local(data)
+        vec.apply("insert")
+        return f
+
+
+class Memo(object):
+    '''The interface of a memoization store. Subclasses implement get, put
+    and, if they persist entries, close.'''
+
+    def __init__(self):
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.stats = dict((kind, {"hits": 0, "misses": 0}) for kind in KINDS)
+        self.stats["evictions"] = 0
+
+    def statistics(self):
+        '''Return the number of hits and misses per kind of evaluation and the
+        number of evicted entries.'''
+        stats = dict((kind, dict(self.stats[kind])) for kind in KINDS)
+        stats["evictions"] = self.stats["evictions"]
+        return stats
+
+    def lookup(self, kind, key, V=None):
+        '''Return the stored value, or None if there is none.'''
+        packed = self.get(kind, key)
+        if packed is None:
+            self.stats[kind]["misses"] += 1
+            profiling.count("%s memo misses" % kind)
+            return None
+
+        self.stats[kind]["hits"] += 1
+        profiling.count("%s memo hits" % kind)
+        return unpack(packed, V)
+
+    def store(self, kind, key, value):
+        (packed, nbytes) = pack(value)
+        self.put(kind, key, packed, nbytes)
+
+    def get(self, kind, key):
+        raise NotImplementedError
+
+    def put(self, kind, key, packed, nbytes):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InMemoryMemo(Memo):
+    '''Keeps at most max_entries entries of at most max_mb megabytes in
+    total in memory, evicting the least recently used ones. A bound of 0
+    means unbounded.'''
+
+    def __init__(self, max_entries=100, max_mb=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_mb*1024*1024
+
+        # (kind, key) -> (packed, nbytes); least recently used first
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        Memo.__init__(self)
+
+    def get(self, kind, key):
+        entry = self.entries.pop((kind, key), None)
+        if entry is None:
+            return None
+        self.entries[(kind, key)] = entry
+        return entry[0]
+
+    def put(self, kind, key, packed, nbytes):
+        self.discard((kind, key))
+        self.entries[(kind, key)] = (packed, nbytes)
+        self.nbytes += nbytes
+
+        while len(self.entries) > 1 and self.full(len(self.entries), self.nbytes, self.max_entries, self.max_bytes):
+            self.discard(next(iter(self.entries)))
+            self.stats["evictions"] += 1
+
+    def discard(self, entry):
+        (packed, nbytes) = self.entries.pop(entry, (None, 0))
+        self.nbytes -= nbytes
+
+    @staticmethod
+    def full(entries, nbytes, max_entries, max_bytes):
+        return (max_entries > 0 and entries > max_entries) or (max_bytes > 0 and nbytes > max_bytes)
+
+
+class SQLiteMemo(InMemoryMemo):
+    '''Keeps the most recently used entries in memory like InMemoryMemo, and
+    appends every entry to the sqlite database path as soon as it is
+    computed. The database holds at most max_disk_mb megabytes; the least
+    recently used entries are deleted from it first. In parallel, each
+    process writes its own database.'''
+
+    def __init__(self, path, max_entries=16, max_mb=0, max_disk_mb=1024):
+        import sqlite3
+        self.sqlite3 = sqlite3
+
+        InMemoryMemo.__init__(self, max_entries=max_entries, max_mb=max_mb)
+
+        nprocs = compatibility.size(backend.comm_world)
+        if nprocs > 1:
+            path = "%s.p%d" % (path, compatibility.rank(backend.comm_world))
+        self.path = path
+        self.max_disk_bytes = max_disk_mb*1024*1024
+
+        self.db = sqlite3.connect(path)
+        try:
+            self.db.execute("CREATE TABLE IF NOT EXISTS memo (kind TEXT, key TEXT, value BLOB, nbytes INTEGER, PRIMARY KEY (kind, key))")
+            self.db.commit()
+        except sqlite3.DatabaseError:
+            self.db.close()
+            raise libadjoint.exceptions.LibadjointErrorInvalidInputs("The cache file %s is not an sqlite database; it may have been written by an "
+                                                                     "older version of dolfin-adjoint. Remove it, or pass another file name." % path)
+
+        # (kind, key) -> nbytes of the entries on disk; least recently used first
+        self.disk = collections.OrderedDict()
+        for (kind, key, nbytes) in self.db.execute("SELECT kind, key, nbytes FROM memo ORDER BY rowid"):
+            self.disk[(kind, key)] = nbytes
+        self.disk_bytes = sum(self.disk.values())
+
+    def get(self, kind, key):
+        packed = InMemoryMemo.get(self, kind, key)
+
+        nbytes = self.disk.pop((kind, key), None)
+        if nbytes is None:
+            return packed
+        self.disk[(kind, key)] = nbytes
+
+        if packed is None:
+            row = self.db.execute("SELECT value FROM memo WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            if row is None:
+                return None
+            packed = pickle.loads(bytes(row[0]))
+            InMemoryMemo.put(self, kind, key, packed, nbytes)
+        return packed
+
+    def put(self, kind, key, packed, nbytes):
+        InMemoryMemo.put(self, kind, key, packed, nbytes)
+
+        blob = pickle.dumps(packed, protocol=2)
+        self.db.execute("INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?)", (kind, key, self.sqlite3.Binary(blob), nbytes))
+        self.disk_bytes -= self.disk.pop((kind, key), 0)
+        self.disk[(kind, key)] = nbytes
+        self.disk_bytes += nbytes
+
+        while len(self.disk) > 1 and self.full(len(self.disk), self.disk_bytes, 0, self.max_disk_bytes):
+            ((old_kind, old_key), old_nbytes) = self.disk.popitem(last=False)
+            self.db.execute("DELETE FROM memo WHERE kind = ? AND key = ?", (old_kind, old_key))
+            self.disk_bytes -= old_nbytes
+            self.stats["evictions"] += 1
+
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+databases = {}
+
+
+def memo(cache):
+    '''Return the memoization store for the cache argument of ReducedFunctional:
+    None, a Memo, or the path of an sqlite database.'''
+    if cache is None or isinstance(cache, Memo):
+        return cache
+
+    path = os.path.abspath(cache)
+    if path not in databases:
+        databases[path] = SQLiteMemo(cache)
+    return databases[path]
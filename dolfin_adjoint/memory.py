@@ -0,0 +1,215 @@
+"""
+Accounting of the memory held by the tape and the caches.
+
+:py:func:`adj_memory_report` itemises the bytes held on this process by the
+values recorded on the tape (forward, adjoint, tangent linear and
+second-order adjoint values, per variable and per timestep), by the caches
+of assembled operators, factorisations and solvers, and by the checkpoints.
+Vectors are charged by their local size, assembled matrices by their
+nonzeros (values and column indices). The fill-in of a factorisation is
+not known, so the factorisations are charged like their operators, and
+the solvers whose operators are not known are only counted.
+
+The values recorded on the tape are tracked as libadjoint records them
+(see adjglobals.Adjointer.record_variable), and checked against the
+adjointer when a report is made, since libadjoint forgets them on its own.
+
+Inside an :py:func:`adj_memory_high_water` block, the drivers sample the
+report at every timestep of the forward replays and of the adjoint,
+tangent linear and Hessian sweeps, and the largest one is kept.
+"""
+import collections
+import contextlib
+
+import numpy
+import libadjoint
+import backend
+
+# str(variable) -> (variable, bytes, where) for the values recorded on the tape
+recorded = collections.OrderedDict()
+
+KINDS = {"ADJ_FORWARD": "forward", "ADJ_ADJOINT": "adjoint",
+         "ADJ_TLM": "tlm", "ADJ_SOA": "soa"}
+
+
+def nbytes(value):
+    '''The bytes held by the local part of value.'''
+    if isinstance(value, backend.Function):
+        return value.vector().local_size()*8
+    elif isinstance(value, backend.Constant):
+        return len(value.values())*8
+    elif isinstance(value, numpy.ndarray):
+        return value.nbytes
+    elif hasattr(value, "nnz"):
+        try:
+            return value.nnz()*12
+        except (AttributeError, RuntimeError, TypeError):
+            return 0
+    elif hasattr(value, "local_size"):
+        return value.local_size()*8
+    return 0
+
+
+def record(var, storage):
+    '''Called when libadjoint is given the value of var.'''
+    vec = getattr(storage, "vec", None)
+    where = "disk" if isinstance(storage, libadjoint.DiskStorage) else "memory"
+    recorded[str(var)] = (var, nbytes(getattr(vec, "data", None)), where)
+
+
+class MemoryReport(object):
+    '''The bytes held by each store, and by the values recorded on the tape
+    per variable and per timestep. The stores whose names end with "(disk)"
+    are on disk and do not count towards the total.'''
+
+    def __init__(self):
+        # name -> {"bytes": , "entries": }
+        self.stores = collections.OrderedDict()
+        # (variable, kind, timestep, bytes, where) for the values on the tape
+        self.variables = []
+        # timestep -> bytes in memory of the values on the tape
+        self.timesteps = collections.defaultdict(int)
+
+    def add(self, store, nbytes, entries=1):
+        entry = self.stores.setdefault(store, {"bytes": 0, "entries": 0})
+        entry["bytes"] += nbytes
+        entry["entries"] += entries
+
+    def add_variable(self, var, nbytes, where):
+        kind = KINDS.get(var.type, var.type)
+        self.variables.append((str(var), kind, var.timestep, nbytes, where))
+        if where == "disk":
+            self.add("%s values (disk)" % kind, nbytes)
+        else:
+            self.add("%s values" % kind, nbytes)
+            self.timesteps[var.timestep] += nbytes
+
+    @property
+    def total(self):
+        '''The bytes held in memory.'''
+        return sum(entry["bytes"] for (store, entry) in self.stores.items() if not store.endswith("(disk)"))
+
+    def __str__(self):
+        lines = ["%-40s %8s %14s" % ("Store", "Entries", "Bytes")]
+        for (store, entry) in self.stores.items():
+            lines.append("%-40s %8d %14d" % (store, entry["entries"], entry["bytes"]))
+        lines.append("%-40s %8s %14d" % ("Total in memory", "", self.total))
+        return "\n".join(lines)
+
+
+def adj_memory_report():
+    '''Return a :py:class:`MemoryReport` of the bytes held on this process by
+    the values on the tape, the caches and the checkpoints.
+
+    .. code-block:: python
+
+        report = adj_memory_report()
+        print(report)                  # a table of the stores
+        report.timesteps               # the bytes on the tape per timestep
+        report.variables               # the bytes per variable
+    '''
+    from . import adjglobals
+    from . import caching
+    from . import recycling
+    from . import storage
+
+    report = MemoryReport()
+
+    for (name, (var, size, where)) in list(recorded.items()):
+        if not adjglobals.adjointer.variable_known(var):
+            del recorded[name]
+            continue
+
+        if storage.store.by_var.get(name) in storage.store.spilled:
+            where = "disk"
+        report.add_variable(var, size, where)
+
+    for value in dict.values(caching.assembled_adj_forms):
+        report.add("assembled_adj_forms", nbytes(value))
+    if caching.block_operators is not None:
+        for (assembled_lhs, solver) in caching.block_operators.values():
+            report.add("block_operators", nbytes(assembled_lhs))
+    report.add("factorisations", caching.factorisations.nbytes, len(caching.factorisations.entries))
+    caching.forward_operators.purge()
+    report.add("forward operators", caching.forward_operators.nbytes, len(caching.forward_operators.entries))
+    report.add("lu_solvers", 0, len(caching.lu_solvers))
+    report.add("localsolvers", 0, len(caching.localsolvers))
+    report.add("pointintegral solvers", 0, len(caching.pis_fwd_to_tlm) + len(caching.pis_fwd_to_adj))
+    report.add("annotations", 0, len(caching.annotations.entries))
+    report.add("krylov recycling", recycling.nbytes(), sum(len(history) for history in recycling.solutions.values()))
+
+    if backend.__name__ == "dolfin":
+        from . import lusolver, krylov_solver, petsc_krylov_solver
+        solvers = lusolver.lu_solvers + lusolver.adj_lu_solvers \
+            + krylov_solver.krylov_solvers + krylov_solver.adj_krylov_solvers \
+            + petsc_krylov_solver.petsc_krylov_solvers + petsc_krylov_solver.adj_petsc_krylov_solvers
+        report.add("overloaded solvers", 0, len([solver for solver in solvers if solver is not None]))
+
+    checkpointer = adjglobals.checkpointer
+    if checkpointer is not None:
+        for (where, values) in checkpointer.snapshots.values():
+            if where == "disk":
+                report.add("checkpoint snapshots (disk)", 0, len(values))
+            else:
+                report.add("checkpoint snapshots", sum(nbytes(vec.data) for (var, vec) in values), len(values))
+    report.add("libadjoint checkpoints", 0, len(adjglobals.mem_checkpoints))
+    report.add("libadjoint checkpoints (disk)", 0, len(adjglobals.disk_checkpoints))
+
+    return report
+
+
+class HighWaterMark(object):
+    '''The largest total of the reports sampled inside an
+    :py:func:`adj_memory_high_water` block, and that report.'''
+
+    def __init__(self):
+        self.peak = 0
+        self.report = None
+        self.samples = 0
+        self.timestep = None
+
+    def sample(self, report):
+        self.samples += 1
+        if self.report is None or report.total > self.peak:
+            self.peak = report.total
+            self.report = report
+
+
+# The HighWaterMarks of the open adj_memory_high_water blocks
+trackers = []
+
+
+def sample(timestep=None):
+    '''Called by the drivers after every equation: takes a report whenever
+    the timestep changes, if the high-water mark is being tracked.'''
+    if len(trackers) == 0:
+        return
+    if timestep is not None and all(tracker.timestep == timestep for tracker in trackers):
+        return
+
+    report = adj_memory_report()
+    for tracker in trackers:
+        tracker.timestep = timestep
+        tracker.sample(report)
+
+
+@contextlib.contextmanager
+def adj_memory_high_water():
+    '''Track the largest memory report of the computations in the body of
+    the with statement.
+
+    .. code-block:: python
+
+        with adj_memory_high_water() as mark:
+            dJdm = compute_gradient(J, Control(m))
+        print(mark.peak)
+        print(mark.report)
+    '''
+    mark = HighWaterMark()
+    mark.sample(adj_memory_report())
+    trackers.append(mark)
+    try:
+        yield mark
+    finally:
+        trackers.remove(mark)
+        mark.sample(adj_memory_report())
@@ -1,9 +1,10 @@
 import dolfin
 from . import solving
-import libadjoint
 from . import adjglobals
 from . import adjlinalg
 from . import utils
+from . import storage
+from . import tape_files
 
 class NewtonSolver(dolfin.NewtonSolver):
     '''This object is overloaded so that solves using this class are automatically annotated,
@@ -31,10 +32,14 @@ class NewtonSolver(dolfin.NewtonSolver):
 
             solving.annotate(F == 0, u, bcs, solver_parameters={"newton_solver": self.parameters.to_dict()})
 
-        newargs = [self] + list(args)
-        out = dolfin.NewtonSolver.solve(*newargs, **kwargs)
+        if to_annotate and tape_files.load_solution(u):
+            # No Newton iterations were needed
+            out = (0, True)
+        else:
+            newargs = [self] + list(args)
+            out = dolfin.NewtonSolver.solve(*newargs, **kwargs)
 
         if to_annotate and dolfin.parameters["adjoint"]["record_all"]:
-            adjglobals.adjointer.record_variable(adjglobals.adj_variables[u], libadjoint.MemoryStorage(adjlinalg.Vector(u)))
+            adjglobals.adjointer.record_variable(adjglobals.adj_variables[u], storage.forward_storage(adjlinalg.Vector(u), adjglobals.adj_variables[u]))
 
         return out
@@ -1,7 +1,14 @@
 
 from __future__ import print_function
+from ..reduced_functional import value_hash
 __all__ = ["MoolaOptimizationProblem"]
 
+def control_hash(x):
+    """Return the content hash of the control values of the moola vector x."""
+    if hasattr(x, "vector_list"):
+        return value_hash([xi.data for xi in x.vector_list])
+    return value_hash(x.data)
+
 def MoolaOptimizationProblem(rf, memoize=1):
     """Build the moola problem from the OptimizationProblem instance.
        memoize describes the number of the function and derivative
@@ -23,7 +30,7 @@ def MoolaOptimizationProblem(rf, memoize=1):
         def __call__(self, x):
             ''' Evaluates the functional for the given control value. '''
             if memoize > 0:
-                hashx = hash(x)
+                hashx = control_hash(x)
 
                 for hashp in self.latest_eval_hash:
                     if hashp == hashx:
@@ -48,7 +55,7 @@ def MoolaOptimizationProblem(rf, memoize=1):
             ''' Evaluates the gradient for the control values. '''
 
             if memoize > 0:
-                hashx = hash(x)
+                hashx = control_hash(x)
 
                 for hashp in self.latest_deriv_hash:
                     if hashp == hashx:
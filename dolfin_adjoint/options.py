@@ -8,7 +8,22 @@ adj_params.add("fussy_replay", True)
 adj_params.add("stop_annotating", False)
 adj_params.add("cache_factorizations", False)
 adj_params.add("debug_cache", False)
+adj_params.add("factorisation_cache_mb", 0)
+adj_params.add("annotation_cache", True)
+adj_params.add("selective_replay", False)
+adj_params.add("prune_adjoint", False)
 adj_params.add("symmetric_bcs", False)
+adj_params.add("transpose_forward_operators", False)
+adj_params.add("forward_operator_cache_mb", 256)
+adj_params.add("krylov_preconditioner_reuse", "rebuild")
+adj_params.add("krylov_initial_guess", "zero")
+adj_params.add("krylov_recycling", 0)
 adj_params.add("allow_zero_derivatives", False)
+adj_params.add("max_memory_mb", 0)
+adj_params.add("io_threads", 0)
+adj_params.add("prefetch_depth", 2)
+adj_params.add("checkpoint_container", "")
+adj_params.add("checkpoint_container_mb", 1024)
+adj_params.add("checkpoint_compression", 0)
 
 parameters.add(adj_params)
@@ -7,19 +7,26 @@ from . import adjlinalg
 from . import adjglobals
 from . import misc
 from . import utils
+from . import caching
+from . import preconditioners
+from . import recycling
+from . import storage
+from . import tape_files
 
 petsc_krylov_solvers = []
 adj_petsc_krylov_solvers = []
 
-def reset_petsc_krylov_solvers():
-    # For all PETScKrylovSolvers, mark that their operators need to be
-    # reassembled. This is needed for example when the tape is re-evaluated at a
-    # new control value.
+def reset_petsc_krylov_solvers(changes=None):
+    # For the solvers whose operators depend on something affected by
+    # changes (by default, all of them), mark that their operators need to
+    # be reassembled. This is needed for example when the tape is
+    # re-evaluated at a new control value.
 
     for sol in petsc_krylov_solvers + adj_petsc_krylov_solvers:
         if sol is None:
             continue
-        sol._need_to_reset_operator = True
+        if changes is None or sol._dependencies is None or changes.affects(sol._dependencies):
+            sol._need_to_reset_operator = True
 
 class PETScKrylovSolver(dolfin.PETScKrylovSolver):
     '''This object is overloaded so that solves using this class are automatically annotated,
@@ -33,6 +40,11 @@ class PETScKrylovSolver(dolfin.PETScKrylovSolver):
         # This flag indicates that the operators needs to be reassembled,
         # for example when the tape is re-evaluated at a new control value.
         self._need_to_reset_operator = False
+        # The caching.form_dependencies of the operators, set on annotation
+        self._dependencies = None
+        # The preconditioners.operator_key of the equation whose operator the
+        # solver holds, or None if it is not known
+        self._operator_key = None
 
         self.operators = (None, None)
         if len(args) > 0 and isinstance(args[0], dolfin.GenericMatrix):
@@ -41,6 +53,7 @@ class PETScKrylovSolver(dolfin.PETScKrylovSolver):
     def set_operators(self, A, P):
         dolfin.PETScKrylovSolver.set_operators(self, A, P)
         self.operators = (A, P)
+        self._operator_key = None
 
     def set_nullspace(self, nsp):
         A = self.operators[0]
@@ -53,6 +66,7 @@ class PETScKrylovSolver(dolfin.PETScKrylovSolver):
     def set_operator(self, A):
         dolfin.PETScKrylovSolver.set_operator(self, A)
         self.operators = (A, self.operators[1])
+        self._operator_key = None
 
     def solve(self, *args, **kwargs):
         '''To disable the annotation, just pass :py:data:`annotate=False` to this routine, and it acts exactly like the
@@ -94,6 +108,8 @@ class PETScKrylovSolver(dolfin.PETScKrylovSolver):
             parameters = self.parameters.to_dict()
             fn_space = u.function_space()
             has_preconditioner = P is not None
+            self._dependencies = caching.form_dependencies([A, P]).union(self._dependencies or [])
+            operator_key = preconditioners.operator_key(A)
             nsp = self.nsp
             tnsp = self.tnsp
 
@@ -145,20 +161,18 @@ class PETScKrylovSolver(dolfin.PETScKrylovSolver):
                     # Fetch/construct the solver
                     if var.type in ['ADJ_FORWARD', 'ADJ_TLM']:
                         solver = petsc_krylov_solvers[idx]
-                        need_to_set_operator = self._need_to_reset_operator
                     else:
                         if adj_petsc_krylov_solvers[idx] is None:
-                            need_to_set_operator = True
                             adj_petsc_krylov_solvers[idx] = PETScKrylovSolver(*solver_parameters)
+                            adj_petsc_krylov_solvers[idx]._need_to_reset_operator = True
                             adj_ksp = adj_petsc_krylov_solvers[idx].ksp()
                             fwd_ksp = petsc_krylov_solvers[idx].ksp()
                             adj_ksp.setOptionsPrefix(fwd_ksp.getOptionsPrefix())
                             adj_ksp.setType(fwd_ksp.getType())
                             adj_ksp.pc.setType(fwd_ksp.pc.getType())
                             adj_ksp.setFromOptions()
-                        else:
-                            need_to_set_operator = self._need_to_reset_operator
                         solver = adj_petsc_krylov_solvers[idx]
+                        solver._dependencies = self._dependencies
                         # FIXME: work around DOLFIN bug #583
                         try:
                             solver.parameters.convergence_norm_type
@@ -166,7 +180,12 @@ class PETScKrylovSolver(dolfin.PETScKrylovSolver):
                             solver.parameters.convergence_norm_type = "preconditioned"
                         # end FIXME
                     solver.parameters.update(parameters)
-                    self._need_to_reset_operator = False
+
+                    # The forward and adjoint solvers keep track of their
+                    # own operators: replaying the forward equation does not
+                    # bring the adjoint operator up to date
+                    need_to_set_operator = solver._need_to_reset_operator
+                    solver._need_to_reset_operator = False
 
                     if selfmat.adjoint:
                         (nsp_, tnsp_) = (tnsp, nsp)
@@ -233,6 +252,13 @@ class PETScKrylovSolver(dolfin.PETScKrylovSolver):
                     if need_to_set_operator:
                         print("|A|: %.6e" % A.norm("frobenius"))
 
+                    if need_to_set_operator:
+                        solver._operator_key = operator_key
+
+                    # Precondition the adjoint with the forward preconditioner
+                    if var.type in ['ADJ_ADJOINT', 'ADJ_SOA']:
+                        preconditioners.share(self, solver, need_to_set_operator)
+
                     # Set the nullspace for the linear operator
                     if nsp_ is not None and need_to_set_operator:
                         dolfin.as_backend_type(A).set_nullspace(nsp_)
@@ -243,15 +269,33 @@ class PETScKrylovSolver(dolfin.PETScKrylovSolver):
                         tnsp_.orthogonalize(rhs)
 
                     print("%s: |b|: %.6e" % (var, rhs.norm("l2")))
-                    solver.solve(x.vector(), rhs)
+                    # The solves of a sweep can start from the solutions of
+                    # the previous timesteps. The tangent linear solves use
+                    # the user's solver, so only this solve may see the flag.
+                    nonzero_initial_guess = solver.parameters["nonzero_initial_guess"]
+                    if recycling.initial_guess(var, x.vector(), solver.operators[0], rhs):
+                        solver.parameters["nonzero_initial_guess"] = True
+
+                    try:
+                        iterations = solver.solve(x.vector(), rhs)
+                    finally:
+                        solver.parameters["nonzero_initial_guess"] = nonzero_initial_guess
+                    recycling.record(var, x.vector(), iterations)
                     return adjlinalg.Vector(x)
 
             solving.annotate(A == b, u, bcs, matrix_class=PETScKrylovSolverMatrix, initial_guess=parameters['nonzero_initial_guess'], replace_map=True)
 
-        out = dolfin.PETScKrylovSolver.solve(self, *args, **kwargs)
+        if to_annotate and tape_files.load_solution(u):
+            out = 0
+        else:
+            out = dolfin.PETScKrylovSolver.solve(self, *args, **kwargs)
+        if to_annotate:
+            self._operator_key = operator_key
+        elif len(args) == 3:
+            self._operator_key = None
 
         if to_annotate and dolfin.parameters["adjoint"]["record_all"]:
-            adjglobals.adjointer.record_variable(adjglobals.adj_variables[u], libadjoint.MemoryStorage(adjlinalg.Vector(u)))
+            adjglobals.adjointer.record_variable(adjglobals.adj_variables[u], storage.forward_storage(adjlinalg.Vector(u), adjglobals.adj_variables[u]))
 
         return out
 
@@ -9,6 +9,7 @@ from . import utils
 from . import caching
 from . import expressions
 from . import constant
+from . import storage
 
 class PointIntegralSolver(dolfin.PointIntegralSolver):
     def step(self, dt, annotate=None):
@@ -42,7 +43,7 @@ class PointIntegralSolver(dolfin.PointIntegralSolver):
             solving.do_checkpoint(cs, next_var, rhs)
 
             if dolfin.parameters["adjoint"]["record_all"]:
-                adjglobals.adjointer.record_variable(next_var, libadjoint.MemoryStorage(adjlinalg.Vector(var)))
+                adjglobals.adjointer.record_variable(next_var, storage.forward_storage(adjlinalg.Vector(var), next_var))
 
 class PointIntegralRHS(libadjoint.RHS):
     def __init__(self, solver, dt, ic_var, frozen_expressions, frozen_constants):
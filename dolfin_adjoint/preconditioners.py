@@ -0,0 +1,172 @@
+"""
+Sharing of the preconditioners of the forward Krylov solves with the
+adjoint solves.
+
+The adjoint of a solve with the operator A has the operator A^T, and a
+preconditioner of A applied transposed is a preconditioner of A^T. The
+overloaded KrylovSolver and PETScKrylovSolver therefore let their adjoint
+(and second-order adjoint) solvers apply the preconditioner of the forward
+solver transposed, instead of setting up one of their own; their tangent
+linear solves use the forward solver itself. The adjoint solvers still
+assemble their own operators, which the Krylov iterations use, so the
+adjoint solutions are unchanged.
+
+parameters["adjoint"]["krylov_preconditioner_reuse"] decides when the
+preconditioners are set up:
+
+  "rebuild"   the adjoint solvers set up their own preconditioners, every
+              time their operators are reassembled.
+  "operator"  the forward preconditioner is set up again whenever the
+              forward operator changes, and shared by the adjoint solves.
+  "lagged"    as "operator", but the forward preconditioner is kept when
+              the forward operator changes (for example at a new control
+              value), at the price of more Krylov iterations. The other
+              policies leave the forward solver's own reuse setting alone.
+
+A forward preconditioner is only shared if the forward solver holds the
+operator of the equation whose transpose the adjoint solver holds (see
+operator_key), so that a time-dependent operator is not preconditioned
+with that of another timestep, and if PETSc can apply it transposed; the
+latter is checked once per forward solver and preconditioner type.
+"""
+import dolfin
+import libadjoint
+from . import adjglobals
+from . import caching
+from . import profiling
+
+try:
+    from petsc4py import PETSc
+except ImportError:
+    PETSc = None
+
+POLICIES = ("rebuild", "operator", "lagged")
+
+# The number of adjoint solves that shared the forward preconditioner, and
+# the number of times an adjoint solver set up a preconditioner of its own
+statistics = {"shared": 0, "rebuilt": 0}
+
+# (handle of the forward KSP, preconditioner type) -> whether PETSc can
+# apply that preconditioner transposed
+supports_transpose = {}
+
+
+def reset_statistics():
+    for key in statistics:
+        statistics[key] = 0
+
+
+def policy():
+    value = dolfin.parameters["adjoint"]["krylov_preconditioner_reuse"]
+    if value not in POLICIES:
+        raise libadjoint.exceptions.LibadjointErrorInvalidInputs("Unknown krylov_preconditioner_reuse policy %s; use one of %s." % (value, ", ".join(POLICIES)))
+    return value
+
+
+def operator_key(form):
+    '''Identify the operator assembled from form, the operator of an equation
+    being annotated: by the signature of form, the variables of its
+    Functions at this point of the annotation and the values of its
+    Constants. The replays and adjoint solves assemble it from the values of
+    the same variables.'''
+    variables = tuple(str(adjglobals.adj_variables[coeff]) for coeff in form.coefficients()
+                      if isinstance(coeff, dolfin.Function))
+    return (form.signature(), variables, caching.form_constants(form))
+
+
+def petsc_ksp(solver):
+    '''Return the petsc4py KSP of a dolfin Krylov solver, or None.'''
+    if PETSc is None:
+        return None
+    try:
+        return solver.ksp()
+    except AttributeError:
+        pass
+    try:
+        return dolfin.as_backend_type(solver).ksp()
+    except (AttributeError, TypeError, RuntimeError):
+        return None
+
+
+class TransposedPreconditioner(object):
+    '''A petsc4py python preconditioner that applies the preconditioner of
+    the KSP ksp transposed.'''
+
+    def __init__(self, ksp):
+        self.ksp = ksp
+
+    def setUp(self, pc):
+        pass
+
+    def apply(self, pc, x, y):
+        self.ksp.pc.applyTranspose(x, y)
+
+    def applyTranspose(self, pc, x, y):
+        self.ksp.pc.apply(x, y)
+
+
+def transposable(ksp):
+    '''Whether PETSc can apply the (set up) preconditioner of ksp transposed.'''
+    key = (ksp.handle, ksp.pc.getType())
+    if key not in supports_transpose:
+        (A, P) = ksp.getOperators()
+        (x, y) = P.createVecs()
+        x.set(1.0)
+        try:
+            ksp.pc.applyTranspose(x, y)
+            supports_transpose[key] = True
+        except PETSc.Error:
+            supports_transpose[key] = False
+    return supports_transpose[key]
+
+
+def share(fwd_solver, adj_solver, new_operator):
+    '''Called before every solve of adj_solver, the solver of the adjoint
+    equations of fwd_solver, with new_operator True if its operator was
+    just reassembled. Make adj_solver apply the preconditioner of fwd_solver
+    transposed if the policy allows it and fwd_solver holds the operator
+    that adj_solver holds the transpose of, and return whether it does.'''
+    mode = policy()
+    fwd_ksp = petsc_ksp(fwd_solver)
+    adj_ksp = petsc_ksp(adj_solver)
+
+    shared = False
+    if fwd_ksp is not None and adj_ksp is not None:
+        if hasattr(fwd_ksp, "setReusePreconditioner"):
+            # Lag the forward preconditioner under "lagged", and otherwise
+            # leave (or put back) the flag the user set on the forward solver
+            user_reuse = getattr(fwd_solver, "_user_reuse_preconditioner", None)
+            if mode == "lagged":
+                if user_reuse is None:
+                    fwd_solver._user_reuse_preconditioner = fwd_ksp.getReusePreconditioner()
+                fwd_ksp.setReusePreconditioner(True)
+            elif user_reuse is not None:
+                fwd_ksp.setReusePreconditioner(user_reuse)
+                fwd_solver._user_reuse_preconditioner = None
+
+        # The forward operator is out of date until the forward equation is
+        # solved again, and belongs to another equation if that was the last
+        # one solved
+        same_operator = fwd_solver._operator_key is not None \
+            and fwd_solver._operator_key == adj_solver._operator_key
+        if mode != "rebuild" and not fwd_solver._need_to_reset_operator and same_operator:
+            with profiling.region("preconditioner", "factorisation"):
+                fwd_ksp.setUp()
+            shared = transposable(fwd_ksp)
+
+    if shared:
+        if not getattr(adj_solver, "_shares_preconditioner", False):
+            adj_ksp.pc.setType("python")
+            adj_ksp.pc.setPythonContext(TransposedPreconditioner(fwd_ksp))
+            adj_solver._shares_preconditioner = True
+        statistics["shared"] += 1
+        profiling.count("preconditioner shared")
+    else:
+        if getattr(adj_solver, "_shares_preconditioner", False):
+            adj_ksp.pc.setType(fwd_ksp.pc.getType())
+            adj_solver._shares_preconditioner = False
+            new_operator = True
+        if new_operator:
+            statistics["rebuilt"] += 1
+            profiling.count("preconditioner rebuilt")
+    return shared
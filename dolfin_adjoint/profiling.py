@@ -0,0 +1,196 @@
+"""
+Opt-in profiling of the forward replays and of the adjoint, tangent linear
+and Hessian sweeps.
+
+Inside an :py:func:`adj_profile` block, the drivers, the caches and the
+adjlinalg callbacks record nested regions: every region has a name (usually
+the variable being solved for), a phase (forward, adjoint, tlm, hessian,
+assembly, bcs, factorisation, solve, functional, derivative, storage,
+checkpointing), the number of the equation it belongs to, its wall time and
+the net number of bytes it allocated, as seen by tracemalloc (the memory
+allocated by PETSc is not seen). The caches additionally count their hits
+and misses.
+
+The record can be printed as a summary table with
+:py:meth:`Profiler.summary` and written as a Chrome trace (a JSON timeline
+that chrome://tracing and Perfetto can display) with
+:py:meth:`Profiler.write_trace`. Outside an adj_profile block, the regions
+cost a function call each.
+"""
+import collections
+import contextlib
+import json
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+clock = getattr(time, "perf_counter", time.time)
+
+# The Profiler of the innermost adj_profile block, if any
+active = None
+
+
+class Profiler(object):
+    '''The regions and counters recorded inside an adj_profile block.'''
+
+    def __init__(self, memory=True, rank=0):
+        self.rank = rank
+        self.memory = memory and tracemalloc is not None
+        self.started_tracing = False
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+        self.origin = clock()
+        # The finished regions, in the order they finished
+        self.events = []
+        # The open regions, innermost last
+        self.stack = []
+        self.counters = collections.defaultdict(int)
+
+    def allocated(self):
+        if not self.memory:
+            return 0
+        return tracemalloc.get_traced_memory()[0]
+
+    def start(self, name, phase, equation):
+        self.stack.append({"name": name, "phase": phase, "equation": equation,
+                           "start": clock() - self.origin, "bytes": self.allocated(),
+                           "depth": len(self.stack), "children": 0.0})
+
+    def stop(self):
+        event = self.stack.pop()
+        event["duration"] = clock() - self.origin - event["start"]
+        event["self"] = event["duration"] - event.pop("children")
+        event["bytes"] = self.allocated() - event["bytes"]
+        if self.stack:
+            self.stack[-1]["children"] += event["duration"]
+        self.events.append(event)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def finish(self):
+        while self.stack:
+            self.stop()
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def totals(self, key=lambda event: (event["phase"], event["name"])):
+        '''Return a dictionary mapping key(event) to the number of calls, the
+        total and self time and the bytes allocated of the matching regions.'''
+        totals = collections.OrderedDict()
+        for event in self.events:
+            entry = totals.setdefault(key(event), {"calls": 0, "total": 0.0, "self": 0.0, "bytes": 0})
+            entry["calls"] += 1
+            entry["total"] += event["duration"]
+            entry["self"] += event["self"]
+            entry["bytes"] += event["bytes"]
+        return totals
+
+    def summary(self):
+        '''Return a table of the time spent per phase, and per region within
+        each phase, followed by the cache counters.'''
+        lines = ["%-40s %8s %12s %12s %12s" % ("Phase / region", "Calls", "Total (s)", "Self (s)", "Bytes")]
+        by_phase = self.totals(key=lambda event: event["phase"])
+        by_region = self.totals()
+        for phase in sorted(by_phase, key=lambda phase: -by_phase[phase]["self"]):
+            entry = by_phase[phase]
+            lines.append("%-40s %8d %12.4f %12.4f %12d" % (phase, entry["calls"], entry["total"], entry["self"], entry["bytes"]))
+
+            regions = [(name, entry) for ((p, name), entry) in by_region.items() if p == phase and name != phase]
+            for (name, entry) in sorted(regions, key=lambda region: -region[1]["self"]):
+                lines.append("  %-38s %8d %12.4f %12.4f %12d" % (str(name)[:38], entry["calls"], entry["total"], entry["self"], entry["bytes"]))
+
+        if self.counters:
+            lines.append("")
+            lines.append("%-40s %8s" % ("Counter", "Count"))
+            for name in sorted(self.counters):
+                lines.append("%-40s %8d" % (name, self.counters[name]))
+        return "\n".join(lines)
+
+    def trace(self):
+        '''Return the regions as a Chrome trace.'''
+        events = []
+        for event in sorted(self.events, key=lambda event: (event["start"], event["depth"])):
+            args = {"bytes": event["bytes"]}
+            if event["equation"] is not None:
+                args["equation"] = event["equation"]
+            events.append({"name": str(event["name"]), "cat": event["phase"], "ph": "X",
+                           "ts": event["start"]*1.0e6, "dur": event["duration"]*1.0e6,
+                           "pid": self.rank, "tid": 0, "args": args})
+
+        end = max([event["start"] + event["duration"] for event in self.events] or [0.0])
+        for (name, value) in sorted(self.counters.items()):
+            events.append({"name": name, "ph": "C", "ts": end*1.0e6, "pid": self.rank,
+                           "args": {"count": value}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path):
+        '''Write the Chrome trace to path.'''
+        with open(path, "w") as f:
+            json.dump(self.trace(), f)
+
+
+class region(object):
+    '''Record the time spent in the body of the with statement, if a profile
+    is being taken.'''
+
+    __slots__ = ["profiler", "name", "phase", "equation"]
+
+    def __init__(self, name, phase, equation=None):
+        self.profiler = active
+        self.name = name
+        self.phase = phase
+        self.equation = equation
+
+    def __enter__(self):
+        if self.profiler is not None:
+            self.profiler.start(self.name, self.phase, self.equation)
+        return self
+
+    def __exit__(self, *args):
+        if self.profiler is not None:
+            self.profiler.stop()
+        return False
+
+
+def count(name, n=1):
+    '''Increment the counter name of the profile being taken, if any.'''
+    if active is not None:
+        active.count(name, n)
+
+
+@contextlib.contextmanager
+def adj_profile(trace=None, memory=True):
+    '''Profile the dolfin-adjoint computations in the body of the with
+    statement, and write a Chrome trace to the path trace if given. With
+    memory=True, the bytes allocated by every region are recorded with
+    tracemalloc, which slows Python code down.
+
+    .. code-block:: python
+
+        with adj_profile("gradient.json") as profile:
+            dJdm = compute_gradient(J, Control(m))
+        print(profile.summary())
+
+    In parallel, pass a different trace path on each process.'''
+    global active
+
+    import backend
+    from . import compatibility
+    profiler = Profiler(memory=memory, rank=compatibility.rank(backend.comm_world))
+
+    previous = active
+    active = profiler
+    try:
+        yield profiler
+    finally:
+        active = previous
+        profiler.finish()
+        if trace is not None:
+            profiler.write_trace(trace)
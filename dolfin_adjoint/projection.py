@@ -3,10 +3,10 @@ import backend
 if backend.__name__ == "dolfin":
     import backend.fem.projection
 from . import misc
-import libadjoint
 from . import adjglobals
 from . import adjlinalg
 from . import utils
+from . import storage
 
 def project_dolfin(v, V=None, bcs=None, mesh=None, solver_type="lu", preconditioner_type="default", form_compiler_parameters=None, annotate=None, name=None):
     '''The project call performs an equation solve, and so it too must be annotated so that the
@@ -49,7 +49,7 @@ def project_dolfin(v, V=None, bcs=None, mesh=None, solver_type="lu", preconditio
         solving.annotate(a == L, out, bcs, solver_parameters={"linear_solver": solver_type, "preconditioner": preconditioner_type, "symmetric": True})
 
         if backend.parameters["adjoint"]["record_all"]:
-            adjglobals.adjointer.record_variable(adjglobals.adj_variables[out], libadjoint.MemoryStorage(adjlinalg.Vector(out)))
+            adjglobals.adjointer.record_variable(adjglobals.adj_variables[out], storage.forward_storage(adjlinalg.Vector(out), adjglobals.adj_variables[out]))
 
     return out
 
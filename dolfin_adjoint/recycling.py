@@ -0,0 +1,154 @@
+"""
+Initial guesses for the iterative solves of the adjoint, tangent linear
+and second-order adjoint sweeps.
+
+Consecutive timesteps of a sweep solve nearly the same equations, so the
+solution of an equation at the previous step of the sweep is a good
+starting point for the Krylov iterations at the next one.
+parameters["adjoint"]["krylov_initial_guess"] selects the initial guess:
+
+  "zero"         the solves start from zero (the default).
+  "previous"     the solution of the same equation at the previous step.
+  "extrapolate"  the linear extrapolation 2 x_{n-1} - x_{n-2} of the last
+                 two solutions.
+
+With parameters["adjoint"]["krylov_recycling"] set to k > 0, the last k
+solutions of every equation are kept as a recycled subspace U instead, and
+the solves start from the x0 in the span of U that minimises the residual
+|b - A x0|: the images AU under the current operator are orthonormalised
+and b is projected onto them. This costs k actions of the operator per
+solve, and takes the place of a deflated Krylov method such as GCRO-DR,
+which would need a Krylov solver of our own.
+
+The guesses only change the starting point of the iterations, not the
+solutions. The solves and Krylov iterations of every sweep are counted in
+:py:data:`statistics` and, for the last sweeps, in :py:data:`sweeps`.
+"""
+import collections
+
+import backend
+import libadjoint
+from . import profiling
+
+GUESSES = ("zero", "previous", "extrapolate")
+
+KINDS = {"ADJ_FORWARD": "forward", "ADJ_ADJOINT": "adjoint",
+         "ADJ_TLM": "tlm", "ADJ_SOA": "soa"}
+
+# equation key -> the last solutions of the equation in the current sweep,
+# most recent last
+solutions = {}
+
+# sweep kind -> {"solves": , "iterations": } over all sweeps
+statistics = collections.defaultdict(lambda: {"solves": 0, "iterations": 0})
+
+# The solves and iterations of the last sweeps, most recent last
+sweeps = collections.deque(maxlen=100)
+
+
+def reset_statistics():
+    statistics.clear()
+    sweeps.clear()
+
+
+def start_sweep(kind):
+    '''Called by the drivers at the start of a sweep: forget the solutions of
+    the previous one.'''
+    solutions.clear()
+    sweeps.append({"sweep": kind, "solves": 0, "iterations": 0})
+
+
+def depth():
+    '''The number of solutions to keep per equation.'''
+    guess = backend.parameters["adjoint"]["krylov_initial_guess"]
+    if guess not in GUESSES:
+        raise libadjoint.exceptions.LibadjointErrorInvalidInputs("Unknown krylov_initial_guess %s; use one of %s." % (guess, ", ".join(GUESSES)))
+
+    recycled = backend.parameters["adjoint"]["krylov_recycling"]
+    if recycled > 0:
+        return recycled
+    return {"zero": 0, "previous": 1, "extrapolate": 2}[guess]
+
+
+def key(var):
+    '''The equation of var, independent of its timestep and iteration.'''
+    name = str(var)
+    prefix = "%s:%d:%d" % (var.name, var.timestep, var.iteration)
+    if name.startswith(prefix):
+        name = var.name + name[len(prefix):]
+    return name
+
+
+def initial_guess(var, x, A, b):
+    '''Set the vector x to the initial guess for the solve of var with the
+    operator A and right-hand side b, and return whether it is nonzero.'''
+    if var.type == "ADJ_FORWARD" or depth() == 0:
+        return False
+
+    history = solutions.get(key(var))
+    if not history:
+        return False
+
+    if backend.parameters["adjoint"]["krylov_recycling"] > 0:
+        with profiling.region("recycled subspace", "solve"):
+            return project(history, x, A, b)
+
+    x.zero()
+    if backend.parameters["adjoint"]["krylov_initial_guess"] == "extrapolate" and len(history) > 1:
+        x.axpy(2.0, history[-1])
+        x.axpy(-1.0, history[-2])
+    else:
+        x.axpy(1.0, history[-1])
+    return True
+
+
+def project(history, x, A, b):
+    '''Set x to the minimal residual solution of A x = b in the span of
+    history.'''
+    basis = []
+    for u in reversed(history):
+        u = u.copy()
+        w = A*u
+        initial_norm = w.norm("l2")
+        for (u_j, w_j) in basis:
+            h = w.inner(w_j)
+            w.axpy(-h, w_j)
+            u.axpy(-h, u_j)
+
+        # Drop the directions that are (nearly) linearly dependent
+        norm = w.norm("l2")
+        if norm <= 1.0e-10*initial_norm or norm == 0.0:
+            continue
+        w *= 1.0/norm
+        u *= 1.0/norm
+        basis.append((u, w))
+
+    x.zero()
+    for (u, w) in basis:
+        x.axpy(w.inner(b), u)
+    return len(basis) > 0
+
+
+def record(var, x, iterations):
+    '''Called after the iterative solve of var with the solution x and the
+    number of Krylov iterations it took (or None if not known).'''
+    kind = KINDS.get(var.type, var.type)
+    counts = [statistics[kind]]
+    if sweeps:
+        counts.append(sweeps[-1])
+    for count in counts:
+        count["solves"] += 1
+        count["iterations"] += iterations or 0
+    profiling.count("krylov iterations (%s)" % kind, iterations or 0)
+
+    n = depth()
+    if var.type != "ADJ_FORWARD" and n > 0:
+        history = solutions.get(key(var))
+        if history is None or history.maxlen != n:
+            history = solutions[key(var)] = collections.deque(history or [], maxlen=n)
+        history.append(x.copy())
+
+
+def nbytes():
+    '''The bytes held by the kept solutions on this process.'''
+    return sum(u.local_size()*8 for history in solutions.values() for u in history)
@@ -1,15 +1,40 @@
 from __future__ import print_function
-import six.moves.cPickle as pickle
-import hashlib
+import functools
 import libadjoint
+import backend
 from . import utils
-from backend import Function, Constant, info_red, info_green, File
-from dolfin_adjoint import drivers, compatibility
+from backend import Function, info_red, info_green
+from dolfin_adjoint import drivers, compatibility, adjglobals
 from dolfin_adjoint.adjglobals import adjointer, mem_checkpoints, disk_checkpoints, adj_reset_cache
 from .functional import Functional
 from .enlisting import enlist, delist
 from .controls import DolfinAdjointControl, ListControl
 from .misc import noannotations
+from .storage import forward_storage
+from . import memoization
+from . import caching
+from . import profiling
+from . import memory
+from . import recycling
+from .caching import value_hash
+
+
+def reports_memory(kind):
+    '''Decorator for the evaluation methods of ReducedFunctional: if a
+    memory_cb is set, track the memory high-water mark of the evaluation and
+    pass the report to memory_cb.'''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.memory_cb is None:
+                return method(self, *args, **kwargs)
+
+            with memory.adj_memory_high_water() as mark:
+                out = method(self, *args, **kwargs)
+            self.memory_cb(kind, mark)
+            return out
+        return wrapper
+    return decorator
 
 
 class ReducedFunctional(object):
@@ -27,7 +52,8 @@ class ReducedFunctional(object):
                  derivative_cb_post=lambda *args: None,
                  replay_cb=lambda *args: None,
                  hessian_cb=lambda *args: None,
-                 cache=None):
+                 cache=None,
+                 memory_cb=None):
 
         #: The objective functional.
         self.functional = functional
@@ -80,16 +106,21 @@ class ReducedFunctional(object):
         #: evaluated.
         self.replay_cb = replay_cb
 
-        #: If not None, caching (memoization) will be activated. The control->ouput pairs
-        #: are stored on disk in the filename given by cache.
+        #: An optional callback function that is executed after each
+        #: functional, derivative and hessian evaluation with the memory
+        #: held by the tape and the caches. The interface must be
+        #: memory_cb(kind, mark) where kind is "functional", "derivative" or
+        #: "hessian" and mark the :py:class:`memory.HighWaterMark` of the
+        #: evaluation: mark.peak is the largest number of bytes held, and
+        #: mark.report the :py:class:`memory.MemoryReport` at that point.
+        self.memory_cb = memory_cb
+
+        #: If not None, caching (memoization) will be activated. Either a
+        #: :py:class:`memoization.Memo`, or the filename of an sqlite database
+        #: in which the control->output pairs are stored on disk (see
+        #: :py:class:`memoization.SQLiteMemo`).
         self.cache = cache
-        if cache is not None:
-            try:
-                self._cache = pickle.load(open(cache, "r"))
-            except IOError: # didn't exist
-                self._cache = {"functional_cache": {},
-                                "derivative_cache": {},
-                                "hessian_cache": {}}
+        self.memo = memoization.memo(cache)
 
         #: Indicator if the user has overloaded the functional evaluation and
         #: hence re-annotates the forward model at every evaluation.
@@ -100,6 +131,9 @@ class ReducedFunctional(object):
         # Stores the functional value of the latest evaluation
         self.current_func_value = None
 
+        # The content hashes of the control values of the latest evaluation
+        self.control_hashes = None
+
         # Set up the Hessian driver
         # Note: drivers.hessian currently only supports one control
         try:
@@ -124,15 +158,11 @@ class ReducedFunctional(object):
             raise TypeError("scale should be a float")
 
         if cache is not None:
-            if not isinstance(cache, str):
-                raise TypeError("cache should be a filename")
-
-    def __del__(self):
-
-        if hasattr(self, 'cache') and self.cache is not None:
-            pickle.dump(self._cache, open(self.cache, "wb"))
+            if not isinstance(cache, (str, memoization.Memo)):
+                raise TypeError("cache should be a filename or a Memo")
 
     @noannotations
+    @reports_memory("functional")
     def __call__(self, value):
         """ Evaluates the reduced functional for the given control value.
 
@@ -145,12 +175,15 @@ class ReducedFunctional(object):
 
         # Make sure we do not annotate
 
-        # Reset any cached data in dolfin-adjoint
-        adj_reset_cache()
-
         #: The control values at which the reduced functional is to be evaluated.
         value = enlist(value)
 
+        # Reset the cached data in dolfin-adjoint that depends on the
+        # controls that changed
+        changed = self.changed_controls(value)
+        adj_reset_cache(changed)
+        caching.last_evaluation = self
+
         # Call callback
         self.eval_cb_pre(delist(value, list_type=self.controls))
 
@@ -158,17 +191,50 @@ class ReducedFunctional(object):
         ListControl(self.controls).update(value)
 
         # Check if the result is already cached
-        if self.cache:
+        if self.memo is not None:
             hash = value_hash(value)
-            if hash in self._cache["functional_cache"]:
+            cached = self.memo.lookup("functional", hash)
+            if cached is not None:
                 # Found a cache
                 info_green("Got a functional cache hit")
-                return self._cache["functional_cache"][hash]
+                # The tape still holds the values of an earlier evaluation
+                self.control_hashes = None
+                return cached
 
         # Replay the annotation and evaluate the functional
+        checkpointer = adjglobals.checkpointer
+        if checkpointer is not None:
+            checkpointer.start_replay()
+
+        # Only the equations downstream of the controls that changed need to
+        # be solved again; the solutions of the others from the last
+        # evaluation are still on the tape.
+        replay = None
+        if changed is not None and backend.parameters["adjoint"]["selective_replay"] \
+                and checkpointer is None and adjointer.get_checkpoint_strategy() is None:
+            replay = caching.downstream_equations(adjointer, changed)
+
         func_value = 0.
+        recycling.start_sweep("forward")
         for i in range(adjointer.equation_count):
-            (fwd_var, output) = adjointer.get_forward_solution(i)
+            fwd_var = None
+            if replay is not None and i not in replay:
+                fwd_var = adjointer.get_forward_variable(i)
+                if not adjointer.variable_known(fwd_var):
+                    fwd_var = None
+
+            if fwd_var is not None:
+                output = adjointer.get_variable_value(fwd_var)
+                caching.replay_statistics["forward_skipped"] += 1
+                self.replay_cb(fwd_var, output.data, delist(value, list_type=self.controls))
+                if i == adjointer.timestep_end_equation(fwd_var.timestep):
+                    with profiling.region(str(self.functional), "functional", i):
+                        func_value += adjointer.evaluate_functional(self.functional, fwd_var.timestep)
+                continue
+
+            with profiling.region(str(adjointer.get_forward_variable(i)), "forward", i):
+                (fwd_var, output) = adjointer.get_forward_solution(i)
+            caching.replay_statistics["forward_solves"] += 1
             if isinstance(output.data, Function):
                 output.data.rename(str(fwd_var), "a Function from dolfin-adjoint")
 
@@ -196,14 +262,18 @@ class ReducedFunctional(object):
 
             # No checkpointing, so we record everything
             else:
-                storage = libadjoint.MemoryStorage(output)
+                storage = forward_storage(output, fwd_var)
                 storage.set_overwrite(True)
                 adjointer.record_variable(fwd_var, storage)
+            memory.sample(fwd_var.timestep)
 
             if i == adjointer.timestep_end_equation(fwd_var.timestep):
-                func_value += adjointer.evaluate_functional(self.functional, fwd_var.timestep)
+                with profiling.region(str(self.functional), "functional", i):
+                    func_value += adjointer.evaluate_functional(self.functional, fwd_var.timestep)
                 if adjointer.get_checkpoint_strategy() != None:
                     adjointer.forget_forward_equation(i)
+                elif checkpointer is not None:
+                    checkpointer.end_replay_timestep(fwd_var.timestep)
 
         self.current_func_value = func_value
 
@@ -211,13 +281,29 @@ class ReducedFunctional(object):
         self.eval_cb_post(self.scale * func_value, delist(value,
             list_type=self.controls))
 
-        if self.cache:
+        if self.memo is not None:
             # Add result to cache
             info_red("Got a functional cache miss")
-            self._cache["functional_cache"][hash] = self.scale*func_value
+            self.memo.store("functional", hash, self.scale*func_value)
 
         return self.scale*func_value
 
+    def changed_controls(self, value):
+        """ Return the controls whose values differ from those of the latest
+        evaluation, or None if that is not known. """
+        try:
+            hashes = [value_hash(v) for v in value]
+        except TypeError:
+            hashes = None
+
+        (previous, self.control_hashes) = (self.control_hashes, hashes)
+
+        # Another ReducedFunctional may have changed the tape in between
+        if previous is None or hashes is None or caching.last_evaluation is not self:
+            return None
+        return [c for (c, old, new) in zip(self.controls, previous, hashes) if old != new]
+
+    @reports_memory("derivative")
     def derivative(self, forget=True, project=False):
         """ Evaluates the derivative of the reduced functional at the most
             recently evaluated control value.
@@ -238,14 +324,15 @@ class ReducedFunctional(object):
 
         # Check if we have the gradient already in the cash.
         # If so, return the cached value
-        if self.cache is not None:
-            hash = value_hash([x.data() for x in self.controls])
+        if self.memo is not None:
+            hash = "%s:%s" % (value_hash([x.data() for x in self.controls]), bool(project))
             fnspaces = [p.data().function_space() if isinstance(p.data(),
                 Function) else None for p in self.controls]
 
-            if hash in self._cache["derivative_cache"]:
+            cached = self.memo.lookup("derivative", hash, fnspaces)
+            if cached is not None:
                 info_green("Got a derivative cache hit.")
-                return cache_load(self._cache["derivative_cache"][hash], fnspaces)
+                return cached
 
         # Call callback
         values = [p.data() for p in self.controls]
@@ -276,12 +363,13 @@ class ReducedFunctional(object):
                     delist(values, list_type=self.controls))
 
         # Cache the result
-        if self.cache is not None:
+        if self.memo is not None:
             info_red("Got a derivative cache miss")
-            self._cache["derivative_cache"][hash] = cache_store(scaled_dfunc_value, self.cache)
+            self.memo.store("derivative", hash, scaled_dfunc_value)
 
         return scaled_dfunc_value
 
+    @reports_memory("hessian")
     def hessian(self, m_dot, project=False):
         """ Evaluates the Hessian action at the most recently evaluated control
         value in direction m_dot.
@@ -305,14 +393,15 @@ class ReducedFunctional(object):
 
         # Check if we have the gradient already in the cash.
         # If so, return the cached value
-        if self.cache is not None:
-            hash = value_hash([x.data() for x in self.controls] + [m_dot])
+        if self.memo is not None:
+            hash = "%s:%s" % (value_hash([x.data() for x in self.controls] + [m_dot]), bool(project))
             fnspaces = [p.data().function_space() if isinstance(p.data(),
                 Function) else None for p in self.controls]
 
-            if hash in self._cache["hessian_cache"]:
+            cached = self.memo.lookup("hessian", hash, fnspaces)
+            if cached is not None:
                 info_green("Got a Hessian cache hit.")
-                return cache_load(self._cache["hessian_cache"][hash], fnspaces)
+                return cached
             else:
                 info_red("Got a Hessian cache miss")
 
@@ -334,12 +423,12 @@ class ReducedFunctional(object):
                         m_dot, scaled_Hm)
 
         # Cache the result
-        if self.cache is not None:
-            self._cache["hessian_cache"][hash] = cache_store(scaled_Hm, self.cache)
+        if self.memo is not None:
+            self.memo.store("hessian", hash, scaled_Hm)
 
         return scaled_Hm
 
-    def taylor_test(self, value=None, test_hessian=False, seed=None, perturbation_direction=None, size=None):
+    def taylor_test(self, value=None, test_hessian=False, seed=None, perturbation_direction=None, size=None, processes=None):
         """ Run a Taylor test to check that the functional, gradient and
         (optionally) Hessian are consistent by
         running the Taylor test.
@@ -358,6 +447,9 @@ class ReducedFunctional(object):
                 Function, Constant or lists of latter). Defaults to a random
                 direction.
             size (Optional[int]): Number of perturbations for the test
+            processes (Optional[int]): If greater than one, the perturbed
+                evaluations and Hessian actions run concurrently in that many
+                worker processes forked from this one (serial runs only).
 
 	Returns:
 	    float: The minimum (higher-order) convergence rate of all performed tests.
@@ -376,7 +468,8 @@ class ReducedFunctional(object):
             HJm = None
 
         return utils.taylor_test(self.__call__, self.controls, Jm, dJdm, HJm, seed=seed,
-                                 perturbation_direction=perturbation_direction, size=size)
+                                 perturbation_direction=perturbation_direction, size=size,
+                                 processes=processes)
 
     def mpi_comm(self):
         """ Return the MPI communicator associated with this reduced functional."""
@@ -386,47 +479,3 @@ class ReducedFunctional(object):
             return compatibility.form_comm(self.functional.timeform.terms[0].form)
         except AttributeError:
             return compatibility.form_comm(self.controls[0].coeff)
-
-
-
-def value_hash(value):
-    if isinstance(value, Constant):
-        return str(float(value))
-    elif isinstance(value, Function):
-        m = hashlib.md5()
-        m.update('{}{}{}'.format(
-            value.vector().norm("l2"),
-            value.vector().norm("l1"),
-            value.vector().norm("linf"),
-            ).encode('utf8')
-        )
-        return m.hexdigest()
-    elif isinstance (value, list):
-        return "".join(map(value_hash, value))
-    else:
-        raise Exception("Don't know how to take a hash of %s" % value)
-
-
-def cache_load(value, V):
-    if isinstance(value, (list, tuple)):
-        return [cache_load(value[i], V[i]) for i in range(len(value))]
-    elif isinstance(value, float):
-        return Constant(value)
-    elif isinstance(value, str):
-        return Function(V, value)
-    return
-
-
-def cache_store(value, cache):
-    if isinstance(value, (list, tuple)):
-        return tuple(cache_store(x, cache) for x in value)
-    elif isinstance(value, Constant):
-        return float(value)
-    elif isinstance(value, Function):
-        hash = value_hash(value)
-        filename = "%s_dir/%s.xml.gz" % (cache, hash)
-        File(filename) << value
-        return filename
-    else:
-        raise Exception("Don't know how to store %s" % value)
-    return
@@ -2,11 +2,12 @@ from __future__ import print_function
 import numpy as np
 from backend import info, info_red, Constant, Function, TestFunction, TrialFunction, assemble, inner, dx, info_red
 from dolfin_adjoint import constant, utils
-from dolfin_adjoint.adjglobals import adjointer, adj_reset_cache
+from dolfin_adjoint.adjglobals import adjointer
 from .reduced_functional import ReducedFunctional
 from .utils import gather
 from functools import partial
 from . import misc
+from . import buffers
 
 class ReducedFunctionalNumPy(ReducedFunctional):
     ''' This class implements the reduced functional for given functional and
@@ -26,7 +27,8 @@ class ReducedFunctionalNumPy(ReducedFunctional):
                 derivative_cb_post=rf.derivative_cb_post,
                 replay_cb=rf.replay_cb,
                 hessian_cb=rf.hessian_cb,
-                cache=rf.cache)
+                cache=rf.cache,
+                memory_cb=rf.memory_cb)
         self.current_func_value = rf.current_func_value
 
         self.__base_call__ = rf.__call__
@@ -44,9 +46,6 @@ class ReducedFunctionalNumPy(ReducedFunctional):
         if not self.replays_annotation:
             solving.adj_reset()
 
-        # We move in control space, so we also need to reset the factorisation cache
-        adj_reset_cache()
-
         # Now its time to update the control values using the given array
         m = self.rf.controls.__class__([p.data() for p in self.controls])
         self.set_local(m, m_array)
@@ -224,42 +223,64 @@ def copy_data(m):
     else:
         raise TypeError('Unknown control type %s.' % str(type(m)))
 
+def control_vector(m):
+    ''' Returns the vector of a Function control, or None for other controls. '''
+    if hasattr(m, "gather"):
+        return m
+    elif hasattr(m, "vector"):
+        return m.vector()
+    return None
+
+def global_size(m):
+    ''' Returns the number of values m contributes to the global array. '''
+    if m is None or type(m) == float:
+        return 1
+    elif hasattr(m, "tolist"):
+        return np.size(m)
+    elif control_vector(m) is not None:
+        return control_vector(m).size()
+    elif hasattr(m, "value_size"):
+        return m.value_size()
+    else:
+        raise TypeError('Unknown control type %s.' % str(type(m)))
+
 def get_global(m_list):
     ''' Takes a list of distributed objects and returns one np array containing their (serialised) values '''
     if not isinstance(m_list, (list, tuple)):
         m_list = [m_list]
 
-    m_global = []
+    # The array is allocated once, and the values are copied into it
+    m_global = np.empty(sum(global_size(m) for m in m_list), dtype='d')
+    offset = 0
     for m in m_list:
+        m_a = m_global[offset:offset + global_size(m)]
+        offset += len(m_a)
 
         # Parameters of type float
         if m is None or type(m) == float:
-            m_global.append(m)
+            m_a[0] = np.nan if m is None else m
 
         elif hasattr(m, "tolist"):
-            m_global += m.tolist()
+            m_a[:] = np.ravel(m)
 
         # Control of type Function
-        elif hasattr(m, "vector") or hasattr(m, "gather"):
-            if not hasattr(m, "gather"):
-                m_v = m.vector()
+        elif control_vector(m) is not None:
+            m_v = control_vector(m)
+            if m_v.local_size() == m_v.size():
+                # In serial, the local values are the global ones
+                with buffers.local_array(m_v, write=False) as values:
+                    m_a[:] = values
             else:
-                m_v = m
-            m_a = gather(m_v)
-
-            m_global += m_a.tolist()
+                m_a[:] = gather(m_v)
 
         # Parameters of type Constant
-        elif hasattr(m, "value_size"):
+        else:
             a = np.zeros(m.value_size())
             p = np.zeros(m.value_size())
             m.eval(a, p)
-            m_global += a.tolist()
+            m_a[:] = a
 
-        else:
-            raise TypeError('Unknown control type %s.' % str(type(m)))
-
-    return np.array(m_global, dtype='d')
+    return m_global
 
 def set_local(coeffs, global_array):
     ''' Updates the values of coeffs (a list of dolfin.Coefficients) from a
@@ -273,12 +294,11 @@ def set_local(coeffs, global_array):
     for m in coeffs:
         # Control of type dolfin.Function
         if hasattr(m, "vector"):
-
-            range_begin, range_end = m.vector().local_range()
-            m_a_local = global_array[offset + range_begin:offset + range_end]
-            m.vector().set_local(m_a_local)
-            m.vector().apply('insert')
-            offset += m.vector().size()
+            vec = m.vector()
+            range_begin, range_end = vec.local_range()
+            with buffers.local_array(vec) as values:
+                values[:] = global_array[offset + range_begin:offset + range_end]
+            offset += vec.size()
         # Parameters of type dolfin.Constant
         elif hasattr(m, "value_size"):
             m.assign(constant.Constant(np.reshape(global_array[offset:offset+m.value_size()], m.ufl_shape)))
@@ -0,0 +1,154 @@
+"""
+Versioned snapshots of the parameters of Expressions and Constants.
+
+The annotated equations need the parameters as they were at annotation
+time. Instead of copying all of them for every equation, a
+:py:class:`ParameterLog` records the changes as they are made: every
+parameter has a list of (version, value) pairs, and a snapshot is just the
+current version number. Restoring a snapshot only sets the parameters that
+changed between the current state and the snapshot.
+
+The parameters must be set through the overloaded setters (Expression
+attributes, Constant.__init__ and Constant.assign); values modified in
+place are not seen.
+"""
+import bisect
+import copy
+import numbers
+
+import six
+
+
+class ParameterLog(object):
+    '''A log of the changes of a set of parameters, keyed by any hashable
+    key. apply(key, value) sets a parameter without recording the change,
+    read(key) returns its current value, and skip(key) tells whether a
+    parameter must be left alone on restore.'''
+
+    def __init__(self, apply, read, skip=None):
+        self.apply = apply
+        self.read = read
+        self.skip = skip or (lambda key: False)
+        self.clear()
+
+    def clear(self):
+        # key -> ([versions], [values]), in increasing order of version
+        self.history = {}
+        # The version and key of every change, in increasing order of version
+        self.change_versions = []
+        self.change_keys = []
+
+        # The version the next snapshot gets, and the version the current
+        # values of the parameters belong to
+        self.version = 0
+        self.state = 0
+        self.frozen = False
+
+    def __len__(self):
+        '''The number of recorded values.'''
+        return len(self.change_keys)
+
+    def known(self, key):
+        return key in self.history
+
+    def value(self, key, version):
+        '''Return (True, value of key at version), or (False, None) if key
+        had no recorded value then.'''
+        (versions, values) = self.history.get(key, ((), ()))
+        i = bisect.bisect_right(versions, version) - 1
+        if i < 0:
+            return (False, None)
+        return (True, values[i])
+
+    def append(self, key, value):
+        (versions, values) = self.history.setdefault(key, ([], []))
+        if len(versions) > 0 and versions[-1] == self.version:
+            values[-1] = value
+        else:
+            versions.append(self.version)
+            values.append(value)
+            self.change_versions.append(self.version)
+            self.change_keys.append(key)
+
+    def changed(self, a, b):
+        '''The keys that changed between the versions a and b.'''
+        (lo, hi) = (min(a, b), max(a, b))
+        start = bisect.bisect_right(self.change_versions, lo)
+        end = bisect.bisect_right(self.change_versions, hi)
+        return set(self.change_keys[start:end])
+
+    def bump(self):
+        '''Start a new version if the current one has been handed out.'''
+        self.sync()
+        if self.frozen:
+            self.version += 1
+            self.state = self.version
+            self.frozen = False
+
+    def sync(self):
+        '''After a restore, the current values are those of an older
+        version; record them as the newest one.'''
+        if self.state == self.version:
+            return
+
+        keys = self.changed(self.state, self.version)
+        old_state = self.state
+        self.version += 1
+        self.state = self.version
+        self.frozen = False
+        for key in keys:
+            (found, value) = self.value(key, old_state)
+            if not found or self.skip(key):
+                value = copy.copy(self.read(key))
+            self.append(key, value)
+
+    def baseline(self, key, value):
+        '''Record the value a parameter had before it was first set. As far as
+        the snapshots are concerned, it always had it.'''
+        if key not in self.history:
+            # No version is older, so this is not a change
+            self.history[key] = ([0], [copy.copy(value)])
+
+    def record(self, key, value):
+        '''Called when the parameter key is set to value.'''
+        self.sync()
+        (found, last) = self.value(key, self.version)
+        if found and unchanged(last, value):
+            return
+
+        self.bump()
+        self.append(key, copy.copy(value))
+
+    def freeze(self):
+        '''Return the snapshot of the current values.'''
+        self.sync()
+        self.frozen = True
+        return self.version
+
+    def restore(self, version):
+        '''Set the parameters to their values in the snapshot version.
+        Parameters that did not exist then are left alone.'''
+        if version == self.state:
+            return
+
+        for key in self.changed(version, self.state):
+            if self.skip(key):
+                continue
+            (found, value) = self.value(key, version)
+            if found:
+                self.apply(key, value)
+        self.state = version
+
+    def compact(self):
+        '''Forget all snapshots but the current values.'''
+        self.sync()
+        current = [(key, values[-1]) for (key, (versions, values)) in self.history.items()]
+        self.clear()
+        for (key, value) in current:
+            self.append(key, value)
+
+
+def unchanged(old, new):
+    '''Whether setting a parameter from old to new certainly changes nothing.'''
+    scalars = (numbers.Number,) + six.string_types
+    return isinstance(old, scalars) and isinstance(new, scalars) and type(old) == type(new) and old == new
@@ -24,6 +24,9 @@ from . import adjlinalg
 from . import misc
 from . import utils
 from . import caching
+from . import checkpointing
+from . import storage
+from . import tape_files
 
 def annotate(*args, **kwargs):
     '''This routine handles all of the annotation, recording the solves as they
@@ -55,23 +58,20 @@ def annotate(*args, **kwargs):
         u  = unpacked_args[1]
         bcs = unpacked_args[2]
         J = unpacked_args[3]
-        # create a deep copy of the parameters. They can be of type
-        # backend.Parameters or just a list
-        if type(unpacked_args[7]) == backend.Parameters:
-            solver_parameters = backend.Parameters(unpacked_args[7])
-        else:
-            solver_parameters = copy.deepcopy(unpacked_args[7])
+        solver_parameters = unpacked_args[7]
 
         if isinstance(eq.lhs, ufl.Form) and isinstance(eq.rhs, ufl.Form):
             eq_lhs = eq.lhs
             eq_rhs = eq.rhs
             eq_bcs = bcs
             linear = True
+            objects = [eq_lhs, eq_rhs]
         else:
-            eq_lhs, eq_rhs = define_nonlinear_equation(eq.lhs, u)
             F = eq.lhs
             eq_bcs = []
             linear = False
+            objects = [F, J]
+        objects += [u] + list(bcs or [])
 
     elif isinstance(args[0], compatibility.matrix_types()):
         linear = True
@@ -105,6 +105,7 @@ def annotate(*args, **kwargs):
         except AttributeError:
             assert not hasattr(args[0], 'bcs') and not hasattr(args[2], 'bcs')
             eq_bcs = []
+        objects = [eq_lhs, eq_rhs, u] + eq_bcs
     else:
         print("args[0].__class__: ", args[0].__class__)
         raise libadjoint.exceptions.LibadjointErrorNotImplemented("Don't know how to annotate your equation, sorry!")
@@ -127,26 +128,90 @@ def annotate(*args, **kwargs):
     else:
         var = None
 
+    # A solve inside a time loop is annotated over and over again with the
+    # same forms. Look up what we derived from them the last time.
+    use_cache = backend.parameters["adjoint"]["annotation_cache"] and not initial_guess
+    objects += [matrix_class, bool(replace_map)]
+    annotation = caching.annotations.lookup(objects) if use_cache else None
+    if annotation is None:
+        if linear:
+            annotation = caching.Annotation(eq_lhs, eq_rhs)
+        else:
+            (nonlinear_lhs, nonlinear_rhs) = define_nonlinear_equation(F, u)
+            annotation = caching.Annotation(nonlinear_lhs, nonlinear_rhs, J or backend.derivative(F, u))
+        if use_cache:
+            caching.annotations.insert(objects, annotation)
+    eq_lhs = annotation.eq_lhs
+    eq_rhs = annotation.eq_rhs
+
     # Set up the data associated with the matrix on the left-hand side. This goes on the diagonal
     # of the 'large' system that incorporates all of the timelevels, which is why it is prefixed
     # with diag.
-    key = '{}{}{}{}'.format(hash(eq_lhs), hash(eq_rhs), u, random.random()).encode('utf8')
-    diag_name = hashlib.md5(key).hexdigest() # we don't have a useful human-readable name, so take the md5sum of the string representation of the forms
-    diag_deps = [adjglobals.adj_variables[coeff] for coeff in ufl.algorithms.extract_coefficients(eq_lhs) if isinstance(coeff, compatibility.function_type)]
-    diag_coeffs = [coeff for coeff in ufl.algorithms.extract_coefficients(eq_lhs) if isinstance(coeff, compatibility.function_type)]
+    diag_coeffs = list(annotation.diag_coeffs)
+    diag_deps = [adjglobals.adj_variables[coeff] for coeff in diag_coeffs]
 
+    initial_guess_var = None
     if initial_guess and linear: # if the initial guess matters, we're going to have to add this in as a dependency of the system
         initial_guess_var = adjglobals.adj_variables[u]
         diag_deps.append(initial_guess_var)
         diag_coeffs.append(u)
 
-    diag_block = libadjoint.Block(diag_name, dependencies=diag_deps, test_hermitian=backend.parameters["adjoint"]["test_hermitian"], test_derivative=backend.parameters["adjoint"]["test_derivative"])
+    # Our equation may depend on Expressions, and those Expressions may have parameters
+    # (e.g. for time-dependent boundary conditions).
+    # In order to successfully replay the forward solve, we need to keep those parameters around.
+    # In expressions.py, we overloaded the Expression class to record all of the parameters
+    # as they are set. We're now going to copy that dictionary as it is at the annotation time,
+    # so that we can get back to this exact state:
+    frozen_expressions = expressions.freeze_dict()
+    frozen_constants = constant.freeze_dict()
+
+    # If nothing the callbacks depend on has changed since the last time, the
+    # block can reuse the callbacks (and therefore the name) registered then.
+    try:
+        parameters_key = caching.parameters_key(solver_parameters)
+    except TypeError:
+        parameters_key = None
+
+    if (annotation.callbacks is not None and parameters_key is not None and parameters_key == annotation.parameters_key
+            and frozen_expressions == annotation.frozen_expressions
+            and frozen_constants == annotation.frozen_constants):
+        caching.annotations.stats["reused_callbacks"] += 1
+        solver_parameters = annotation.solver_parameters
+    else:
+        # create a deep copy of the parameters. They can be of type
+        # backend.Parameters or just a list
+        if type(solver_parameters) == backend.Parameters:
+            solver_parameters = backend.Parameters(solver_parameters)
+        else:
+            solver_parameters = copy.deepcopy(solver_parameters)
+
+        # A self-adjoint operator shares its factorisation between the
+        # forward, tangent linear and adjoint solves
+        if annotation.self_adjoint is None:
+            annotation.self_adjoint = linear and caching.is_self_adjoint(eq_lhs)
+        self_adjoint = annotation.self_adjoint or (linear and isinstance(solver_parameters, dict) and solver_parameters.get("symmetric", False))
+
+        key = '{}{}{}{}'.format(hash(eq_lhs), hash(eq_rhs), u, random.random()).encode('utf8')
+        annotation.diag_name = hashlib.md5(key).hexdigest() # we don't have a useful human-readable name, so take the md5sum of the string representation of the forms
+        annotation.callbacks = diag_block_callbacks(eq_lhs, eq_bcs, u, diag_coeffs, solver_parameters,
+                                                    matrix_class, initial_guess_var, replace_map,
+                                                    frozen_expressions, frozen_constants, nonlinear=len(diag_deps) > 0,
+                                                    self_adjoint=self_adjoint)
+        annotation.solver_parameters = solver_parameters
+        annotation.parameters_key = parameters_key
+        annotation.frozen_expressions = frozen_expressions
+        annotation.frozen_constants = frozen_constants
+
+    # The dependencies differ from timestep to timestep, so the block itself is always new.
+    diag_block = libadjoint.Block(annotation.diag_name, dependencies=diag_deps, test_hermitian=backend.parameters["adjoint"]["test_hermitian"], test_derivative=backend.parameters["adjoint"]["test_derivative"])
+    for (name, callback) in annotation.callbacks.items():
+        setattr(diag_block, name, callback)
 
     # Similarly, create the object associated with the right-hand side data.
     if linear:
         rhs = adjrhs.RHS(eq_rhs)
     else:
-        rhs = adjrhs.NonlinearRHS(eq_rhs, F, u, bcs, mass=eq_lhs, solver_parameters=solver_parameters, J=J)
+        rhs = adjrhs.NonlinearRHS(eq_rhs, F, u, bcs, mass=eq_lhs, solver_parameters=solver_parameters, J=annotation.J)
 
 
     # We need to check if this is the first equation,
@@ -164,17 +229,23 @@ def annotate(*args, **kwargs):
     if linear:
         var = adjglobals.adj_variables.next(u)
 
-    # With the initial conditions out of the way, let us now define the callbacks that
-    # define the actions of the operator the user has passed in on the lhs of this equation.
+    eqn = libadjoint.Equation(var, blocks=[diag_block], targets=[var], rhs=rhs)
 
-    # Our equation may depend on Expressions, and those Expressions may have parameters
-    # (e.g. for time-dependent boundary conditions).
-    # In order to successfully replay the forward solve, we need to keep those parameters around.
-    # In expressions.py, we overloaded the Expression class to record all of the parameters
-    # as they are set. We're now going to copy that dictionary as it is at the annotation time,
-    # so that we can get back to this exact state:
-    frozen_expressions = expressions.freeze_dict()
-    frozen_constants = constant.freeze_dict()
+    cs = adjglobals.adjointer.register_equation(eqn)
+    do_checkpoint(cs, var, rhs)
+
+    return linear
+
+def diag_block_callbacks(eq_lhs, eq_bcs, u, diag_coeffs, solver_parameters, matrix_class,
+                         initial_guess_var, replace_map, frozen_expressions, frozen_constants, nonlinear,
+                         self_adjoint=False):
+    '''Return the callbacks of the block on the diagonal of an annotated solve,
+    keyed by the name of the libadjoint.Block attribute they are assigned to.
+    The derivative callbacks are only needed if the operator is nonlinear;
+    self_adjoint says whether eq_lhs is known to be its own adjoint.'''
+
+    initial_guess = initial_guess_var is not None
+    callbacks = {}
 
     def diag_assembly_cb(dependencies, values, hermitian, coefficient, context):
         '''This callback must conform to the libadjoint Python block assembly
@@ -184,6 +255,7 @@ def annotate(*args, **kwargs):
         assert coefficient == 1
 
         value_coeffs=[v.data for v in values]
+        caching.record_values(dependencies, values)
         expressions.update_expressions(frozen_expressions)
         constant.update_constants(frozen_constants)
         eq_l = backend.replace(eq_lhs, dict(zip(diag_coeffs, value_coeffs)))
@@ -209,7 +281,12 @@ def annotate(*args, **kwargs):
             if replace_map:
                 kwargs['replace_map'] = dict(zip(diag_coeffs, value_coeffs))
 
-            return (matrix_class(backend.adjoint(eq_l, reordered_arguments=ufl.algorithms.extract_arguments(eq_l)), **kwargs), adjlinalg.Vector(None, fn_space=u.function_space()))
+            A = matrix_class(backend.adjoint(eq_l, reordered_arguments=ufl.algorithms.extract_arguments(eq_l)), **kwargs)
+            # The adjoint operator is the transpose of the forward one
+            A.forward_form = eq_l
+            A.forward_bcs = misc.uniq(eq_bcs)
+            A.self_adjoint = self_adjoint
+            return (A, adjlinalg.Vector(None, fn_space=u.function_space()))
         else:
 
             kwargs['bcs'] = misc.uniq(eq_bcs)
@@ -222,8 +299,12 @@ def annotate(*args, **kwargs):
             if replace_map:
                 kwargs['replace_map'] = dict(zip(diag_coeffs, value_coeffs))
 
-            return (matrix_class(eq_l, **kwargs), adjlinalg.Vector(None, fn_space=u.function_space()))
-    diag_block.assemble = diag_assembly_cb
+            A = matrix_class(eq_l, **kwargs)
+            A.forward_form = eq_l
+            A.forward_bcs = kwargs['bcs']
+            A.self_adjoint = self_adjoint
+            return (A, adjlinalg.Vector(None, fn_space=u.function_space()))
+    callbacks["assemble"] = diag_assembly_cb
 
     def diag_action_cb(dependencies, values, hermitian, coefficient, input, context):
         value_coeffs = [v.data for v in values]
@@ -238,9 +319,9 @@ def annotate(*args, **kwargs):
 
         return adjlinalg.Vector(output)
 
-    diag_block.action = diag_action_cb
+    callbacks["action"] = diag_action_cb
 
-    if len(diag_deps) > 0:
+    if nonlinear:
         # If this block is nonlinear (the entries of the matrix on the LHS
         # depend on any variable previously computed), then that will induce
         # derivative terms in the adjoint equations. Here, we define the
@@ -269,7 +350,7 @@ def annotate(*args, **kwargs):
                 output = backend.action(G, input.data)
 
             return adjlinalg.Vector(output)
-        diag_block.derivative_action = derivative_action
+        callbacks["derivative_action"] = derivative_action
 
         def derivative_outer_action(dependencies, values, variable, contraction_vector, hermitian, input, coefficient, context):
             dolfin_variable = values[dependencies.index(variable)].data
@@ -295,7 +376,7 @@ def annotate(*args, **kwargs):
                 output = backend.action(G, input.data)
 
             return adjlinalg.Vector(output)
-        diag_block.derivative_outer_action = derivative_outer_action
+        callbacks["derivative_outer_action"] = derivative_outer_action
 
         def second_derivative_action(dependencies, values, inner_variable, inner_contraction_vector, outer_variable, outer_contraction_vector, hermitian, input, coefficient, context):
             dolfin_inner_variable = values[dependencies.index(inner_variable)].data
@@ -326,14 +407,9 @@ def annotate(*args, **kwargs):
                 output = backend.action(G, input.data)
 
             return adjlinalg.Vector(output)
-        diag_block.second_derivative_action = second_derivative_action
-
-    eqn = libadjoint.Equation(var, blocks=[diag_block], targets=[var], rhs=rhs)
+        callbacks["second_derivative_action"] = second_derivative_action
 
-    cs = adjglobals.adjointer.register_equation(eqn)
-    do_checkpoint(cs, var, rhs)
-
-    return linear
+    return callbacks
 
 def solve(*args, **kwargs):
     '''This solve routine wraps the real Dolfin solve call. Its purpose is to annotate the model,
@@ -347,33 +423,44 @@ def solve(*args, **kwargs):
 
     # First, decide if we should annotate or not.
     to_annotate = utils.to_annotate(kwargs.pop("annotate", None))
+    loaded = False
     if to_annotate:
         linear = annotate(*args, **kwargs)
 
-    # Avoid recursive annotation
-    flag = misc.pause_annotation()
-    try:
-        ret = backend.solve(*args, **kwargs)
-    except:
-        raise
-    finally:
-        misc.continue_annotation(flag)
+        if isinstance(args[0], ufl.classes.Equation):
+            unpacked_args = compatibility._extract_args(*args, **kwargs)
+            u  = unpacked_args[1]
+        elif isinstance(args[0], compatibility.matrix_types()):
+            u = args[1].function
+        else:
+            u = None
+
+        # If a saved tape is being loaded, the solution is read from disk
+        if u is not None:
+            loaded = tape_files.load_solution(u)
+
+    ret = None
+    if not loaded:
+        # Avoid recursive annotation
+        flag = misc.pause_annotation()
+        try:
+            ret = backend.solve(*args, **kwargs)
+        except:
+            raise
+        finally:
+            misc.continue_annotation(flag)
 
     if to_annotate:
         # Finally, if we want to record all of the solutions of the real forward model
         # (for comparison with a libadjoint replay later),
         # then we should record the value of the variable we just solved for.
         if backend.parameters["adjoint"]["record_all"]:
-            if isinstance(args[0], ufl.classes.Equation):
-                unpacked_args = compatibility._extract_args(*args, **kwargs)
-                u  = unpacked_args[1]
-                adjglobals.adjointer.record_variable(adjglobals.adj_variables[u], libadjoint.MemoryStorage(adjlinalg.Vector(u)))
-            elif isinstance(args[0], compatibility.matrix_types()):
-                u = args[1].function
-                adjglobals.adjointer.record_variable(adjglobals.adj_variables[u], libadjoint.MemoryStorage(adjlinalg.Vector(u)))
-            else:
+            if u is None:
                 raise libadjoint.exceptions.LibadjointErrorInvalidInputs("Don't know how to record, sorry")
 
+            var = adjglobals.adj_variables[u]
+            adjglobals.adjointer.record_variable(var, storage.forward_storage(adjlinalg.Vector(u), var))
+
     return ret
 
 def define_nonlinear_equation(F, u):
@@ -392,7 +479,18 @@ def define_nonlinear_equation(F, u):
 
 def adj_checkpointing(strategy, steps, snaps_on_disk,
         snaps_in_ram, verbose=False, replay = False, replay_comparison_tolerance = 1e-10):
+    '''Activate checkpointing. This must be called before the forward model is annotated.
+
+    The strategies "offline", "multistage" and "online" are handled by revolve inside libadjoint.
+    The strategy "binomial" is scheduled by dolfin-adjoint itself: it also drives the replay in
+    :py:class:`ReducedFunctional`, and the returned scheduler reports the recomputation counts and
+    the peak snapshot memory through its statistics() method.'''
     backend.parameters["adjoint"]["record_all"] = replay
+
+    if strategy == "binomial":
+        adjglobals.checkpointer = checkpointing.BinomialCheckpointer(steps, snaps_on_disk, snaps_in_ram, verbose=verbose)
+        return adjglobals.checkpointer
+
     adjglobals.adjointer.set_checkpoint_strategy(strategy)
     adjglobals.adjointer.set_revolve_options(steps, snaps_on_disk, snaps_in_ram, verbose)
     adjglobals.adjointer.set_revolve_debug_options(replay, replay_comparison_tolerance)
@@ -429,7 +527,7 @@ def register_initial_condition(coeff, dep):
     identity_block = utils.get_identity_block(fn_space)
 
     if backend.parameters["adjoint"]["record_all"]:
-        adjglobals.adjointer.record_variable(dep, libadjoint.MemoryStorage(adjlinalg.Vector(coeff)))
+        adjglobals.adjointer.record_variable(dep, storage.forward_storage(adjlinalg.Vector(coeff), dep))
 
     init_rhs=adjlinalg.Vector(coeff).duplicate()
     init_rhs.axpy(1.0,adjlinalg.Vector(coeff))
@@ -485,4 +583,5 @@ def do_checkpoint(cs, var, rhs):
 
 
 def record(val):
-    adjglobals.adjointer.record_variable(adjglobals.adj_variables[val], libadjoint.MemoryStorage(adjlinalg.Vector(val)))
+    var = adjglobals.adj_variables[val]
+    adjglobals.adjointer.record_variable(var, storage.forward_storage(adjlinalg.Vector(val), var))
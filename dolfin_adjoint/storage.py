@@ -0,0 +1,222 @@
+"""
+Memory-bounded storage of the forward values recorded on the tape.
+
+If parameters["adjoint"]["max_memory_mb"] is positive, the forward values
+are recorded as adjlinalg.Vector objects owned by the ForwardStore. Once
+the stored values exceed the budget, the least recently used ones are
+written to HDF5 with adjlinalg.Vector.write and dropped from memory. They
+are transparently read back the next time their data is accessed. The
+adjoint sweep prefetches the values that the next adjoint equations depend
+on, in the background if parameters["adjoint"]["io_threads"] is positive
+and the values are stored in checkpoint containers (see
+dolfin_adjoint.diskio).
+
+The budget is per process. Each vector is charged its average share
+(global size / number of processes), so that all processes make the same
+eviction decisions and the collective HDF5 calls stay matched.
+"""
+import collections
+import weakref
+
+import libadjoint
+import backend
+from . import compatibility
+from . import profiling
+
+
+def _nbytes(vec):
+    if not isinstance(vec.data, backend.Function):
+        return 0
+    nprocs = compatibility.size(backend.comm_world)
+    return vec.data.vector().size()*8 // nprocs
+
+
+class ForwardStore(object):
+    '''An LRU store of the forward values recorded on the tape that spills
+    to disk once parameters["adjoint"]["max_memory_mb"] is exceeded.'''
+
+    def __init__(self):
+        # key -> [weakref to the vector, variable, bytes]; least recently used first
+        self.entries = collections.OrderedDict()
+        self.by_var = {}
+        self.spilled = set()
+        self.resident_bytes = 0
+
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.stats = {"evictions": 0,
+                      "loads": 0,
+                      "prefetches": 0,
+                      "peak_resident_bytes": self.resident_bytes}
+
+    def statistics(self):
+        '''Return a dictionary with the number of evictions, loads and
+        prefetches and the peak number of bytes held in memory.'''
+        stats = dict(self.stats)
+        stats["resident_bytes"] = self.resident_bytes
+        stats["spilled_variables"] = len(self.spilled)
+        return stats
+
+    def budget(self):
+        return backend.parameters["adjoint"]["max_memory_mb"]*1024*1024
+
+    def active(self):
+        return self.budget() > 0
+
+    def storage(self, vec, var):
+        '''Return the libadjoint storage object with which to record the value
+        vec of the forward variable var.'''
+        if not self.active() or not isinstance(vec.data, backend.Function):
+            return libadjoint.MemoryStorage(vec)
+
+        copy = vec.duplicate()
+        copy.axpy(1.0, vec)
+        self.track(copy, var)
+
+        # libadjoint holds on to our copy rather than making its own, so
+        # that we can spill it to disk behind its back.
+        return libadjoint.MemoryStorage(copy, copy=False)
+
+    def track(self, vec, var):
+        key = id(vec)
+        nbytes = _nbytes(vec)
+        self.entries[key] = [weakref.ref(vec, lambda ref, key=key: self.untrack(key)), var, nbytes]
+        self.by_var[str(var)] = key
+        self.resident_bytes += nbytes
+        vec._store = self
+
+        self.enforce(keep=key)
+
+    def untrack(self, key):
+        # The vector was forgotten by libadjoint
+        (ref, var, nbytes) = self.entries.pop(key)
+        if key in self.spilled:
+            self.spilled.remove(key)
+            from .adjlinalg import Vector
+            Vector.delete(var)
+        else:
+            self.resident_bytes -= nbytes
+
+        if self.by_var.get(str(var)) == key:
+            del self.by_var[str(var)]
+
+    def touch(self, vec):
+        '''Mark vec as the most recently used value, reading it back from disk if necessary.'''
+        key = id(vec)
+        if key not in self.entries:
+            return
+
+        self.entries[key] = self.entries.pop(key)
+        if key in self.spilled:
+            self.load(key, vec)
+            self.enforce(keep=key)
+
+    def load(self, key, vec):
+        from .adjlinalg import Vector
+        (ref, var, nbytes) = self.entries[key]
+
+        with profiling.region(str(var), "storage"):
+            vec._data = Vector.read(var).data
+        Vector.delete(var)
+
+        self.spilled.remove(key)
+        self.resident_bytes += nbytes
+        self.stats["loads"] += 1
+        self.stats["peak_resident_bytes"] = max(self.stats["peak_resident_bytes"], self.resident_bytes)
+
+    def spill(self, key):
+        (ref, var, nbytes) = self.entries[key]
+        vec = ref()
+
+        # Write the data without touching the entry
+        vec._store = None
+        with profiling.region(str(var), "storage"):
+            vec.write(var)
+        vec._store = self
+        vec._data = None
+
+        self.spilled.add(key)
+        self.resident_bytes -= nbytes
+        self.stats["evictions"] += 1
+
+    def enforce(self, keep=None):
+        '''Spill the least recently used values until the budget is met.'''
+        budget = self.budget()
+        for key in list(self.entries.keys()):
+            if self.resident_bytes <= budget:
+                break
+            if key == keep or key in self.spilled:
+                continue
+            self.spill(key)
+
+        self.stats["peak_resident_bytes"] = max(self.stats["peak_resident_bytes"], self.resident_bytes)
+
+    def prefetch(self, variables):
+        '''Mark the forward values of variables, in the order in which the
+        adjoint sweep needs them, as recently used and start reading the
+        spilled ones back from disk.'''
+        if len(self.spilled) == 0:
+            return
+
+        from .adjlinalg import Vector
+        # The value needed first ends up as the most recently used one
+        for var in reversed(variables):
+            key = self.by_var.get(str(var))
+            if key is None:
+                continue
+            self.entries[key] = self.entries.pop(key)
+            if key in self.spilled and Vector.prefetch(var):
+                self.stats["prefetches"] += 1
+
+
+store = ForwardStore()
+
+
+def forward_storage(vec, var):
+    '''Return the libadjoint storage object with which to record the value
+    vec of the forward variable var. Subject to the memory budget in
+    parameters["adjoint"]["max_memory_mb"].'''
+    return store.storage(vec, var)
+
+
+# str(forward variable) -> the forward variables whose values its adjoint equation needs
+dependencies = {}
+
+
+def record_dependencies(equation):
+    '''Called when equation is registered with the adjointer. The adjoint
+    equation of a variable needs the dependencies of every forward equation
+    in which the variable occurs, either as a target of one of the blocks or
+    as a dependency of the right-hand side.'''
+    blocks = getattr(equation, "blocks", None) or []
+    targets = getattr(equation, "targets", None) or []
+    rhs = getattr(equation, "rhs", None)
+    rhs_deps = list(rhs.dependencies()) if hasattr(rhs, "dependencies") else []
+
+    needed = list(rhs_deps)
+    for block in blocks:
+        needed += getattr(block, "dependencies", None) or []
+
+    for var in list(targets) + rhs_deps:
+        deps = dependencies.setdefault(str(var), [])
+        for dep in needed:
+            if dep not in deps:
+                deps.append(dep)
+
+
+def prefetch(adjointer, equation):
+    '''Start reading back the spilled forward values that the adjoint
+    equations equation, equation - 1, ..., equation - k need, where k is
+    parameters["adjoint"]["prefetch_depth"].'''
+    if len(store.spilled) == 0:
+        return
+
+    depth = backend.parameters["adjoint"]["prefetch_depth"]
+    variables = []
+    for i in range(equation, max(equation - depth, 0) - 1, -1):
+        for var in dependencies.get(str(adjointer.get_forward_variable(i)), []):
+            if var not in variables:
+                variables.append(var)
+
+    store.prefetch(variables)
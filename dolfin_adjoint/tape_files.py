@@ -0,0 +1,168 @@
+"""
+Saving the annotated tape to disk and loading it into a later process.
+
+The equations on the tape are Python callbacks around UFL forms, which
+cannot be serialised. :py:func:`adj_save_tape` therefore writes the forward
+values of all variables on the tape to a checkpoint container (see
+checkpoint_files.py), together with the sequence of variables the
+equations solve for. The later process rebuilds the equations, with their
+forms, boundary conditions, solver parameters and Expression and Constant
+values, by running the same model code after :py:func:`adj_load_tape`.
+Every annotated equation is then checked against the saved sequence, and
+solve() and the variational solvers take their solution from the file
+instead of solving. Other solves are performed as usual. Once the model
+has annotated all the saved equations, the tape can be used exactly as
+after the original run.
+"""
+import json
+
+import backend
+import libadjoint
+from . import adjglobals
+from . import adjlinalg
+from . import checkpoint_files
+from . import compatibility
+from . import diskio
+from . import storage
+
+
+def file_name(var):
+    return str(var).replace(":", "-")
+
+
+def metadata_path(path):
+    return path + ".tape.json"
+
+
+class LoadedTape(object):
+    '''The tape saved under path, as it is being rebuilt. spaces is a list of
+    the function spaces of the saved variables.'''
+
+    def __init__(self, path, spaces):
+        self.container = checkpoint_files.CheckpointContainer(path)
+        self.container.load(spaces)
+
+        with open(metadata_path(path), "r") as f:
+            self.variables = json.load(f)["variables"]
+        self.position = 0
+
+    def finished(self):
+        return self.position == len(self.variables)
+
+    def check(self, equation):
+        '''Called when equation is registered with the adjointer.'''
+        var = str(equation.var)
+        if self.variables[self.position] != var:
+            raise libadjoint.exceptions.LibadjointErrorInvalidInputs("Equation %d of the model solves for %s, but the saved tape solves for %s. "
+                                                                     "The model must be run exactly as when the tape was saved." % (self.position, var, self.variables[self.position]))
+        self.position += 1
+
+        # Read the saved value now, so that the container can be closed and
+        # the tape dropped as soon as its last equation has been annotated
+        adjglobals.tape_value = (equation.var, self.value(equation.var))
+        if self.finished():
+            self.container.close_all()
+            adjglobals.tape_loading = None
+
+    def value(self, var):
+        '''Return the saved value of var, or None if there is none.'''
+        name = file_name(var)
+        if not self.container.contains(name):
+            return None
+        return self.container.read(name, adjglobals.checkpoint_fs[name])
+
+
+def adj_save_tape(path):
+    '''Save the annotated tape under path (a prefix for the files written),
+    so that the adjoint, tangent linear and Hessian computations can be
+    carried out by a later process with :py:func:`adj_load_tape`, without
+    running the forward model again. Requires h5py.
+
+    The forward values that are no longer on the tape (e.g. because of
+    checkpointing) are recomputed, written and forgotten again timestep by
+    timestep.'''
+    diskio.pool.wait_all()
+    container = checkpoint_files.CheckpointContainer(path,
+                                                     max_size_mb=backend.parameters["adjoint"]["checkpoint_container_mb"],
+                                                     compression=backend.parameters["adjoint"]["checkpoint_compression"])
+
+    variables = []
+    recomputed = False
+    timestep = 0
+    for i in range(adjglobals.adjointer.equation_count):
+        var = adjglobals.adjointer.get_forward_variable(i)
+
+        # Once a new timestep is reached, the recomputed values of the one
+        # before the last are written and no longer needed for recomputing
+        if recomputed and var.timestep > timestep and var.timestep >= 2:
+            adjglobals.adjointer.forget_forward_equation(adjglobals.adjointer.timestep_end_equation(var.timestep - 2))
+        timestep = var.timestep
+
+        if adjglobals.adjointer.variable_known(var):
+            value = adjglobals.adjointer.get_variable_value(var).data
+        else:
+            # The value is only recorded until the following equations that
+            # depend on it have been recomputed
+            (var, output) = adjglobals.adjointer.get_forward_solution(i)
+            vec_storage = storage.forward_storage(output, var)
+            vec_storage.set_overwrite(True)
+            adjglobals.adjointer.record_variable(var, vec_storage)
+            value = output.data
+            recomputed = True
+
+        variables.append(str(var))
+        if value is not None:
+            name = file_name(var)
+            adjglobals.checkpoint_fs[name] = value.function_space()
+            container.write(name, value)
+
+    container.save()
+    if compatibility.rank(backend.comm_world) == 0:
+        with open(metadata_path(path), "w") as f:
+            json.dump({"variables": variables}, f)
+
+
+def adj_load_tape(path, spaces):
+    '''Start loading the tape saved with :py:func:`adj_save_tape` under path.
+    spaces is a list of the function spaces of the saved variables.
+
+    The model has to be run again, as in the original run, to rebuild the
+    equations; solves through solve(), the variational solvers and the
+    overloaded LU, Krylov, PETSc Krylov, Newton, linear and local solvers
+    then read their solutions from disk instead of solving. The tape must be
+    loaded with the same number of processes and mesh partitioning as when
+    it was saved.
+
+    .. code-block:: python
+
+        adj_load_tape("forward", [V])
+        u = main(ic)          # the model code, run with annotation
+        dJdic = compute_gradient(J, Control(ic))
+    '''
+    if adjglobals.adjointer.equation_count > 0:
+        raise libadjoint.exceptions.LibadjointErrorInvalidInputs("adj_load_tape must be called before the model is annotated. Call adj_reset() first.")
+
+    adjglobals.tape_loading = LoadedTape(path, spaces)
+
+
+def load_solution(u):
+    '''While a tape is loaded, set u to the saved value of the variable just
+    annotated for it instead of solving, and return whether that was done.'''
+    if adjglobals.tape_value is None:
+        return False
+
+    var = adjglobals.adj_variables[u]
+    (loaded_var, value) = adjglobals.tape_value
+    adjglobals.tape_value = None
+    if value is None or loaded_var != var:
+        return False
+
+    vec = u.vector()
+    vec.zero()
+    vec.axpy(1.0, value.vector())
+
+    # Without record_all the value would not be put on the tape, and the
+    # adjoint would have to replay the solve
+    if not backend.parameters["adjoint"]["record_all"]:
+        adjglobals.adjointer.record_variable(var, storage.forward_storage(adjlinalg.Vector(u), var))
+    return True
@@ -11,11 +11,15 @@ from .controls import ConstantControls
 
 from .solving import solve, adj_checkpointing, annotate, record
 from .adjglobals import adj_start_timestep, adj_inc_timestep, adjointer, adj_check_checkpoints, adj_html, adj_reset
+from .checkpoint_files import adj_save_checkpoints, adj_open_checkpoints
+from .tape_files import adj_save_tape, adj_load_tape
+from .profiling import adj_profile
+from .memory import adj_memory_report, adj_memory_high_water
 from .gst import compute_gst, compute_propagator_matrix, perturbed_replay
 from .utils import convergence_order, DolfinAdjointVariable
 from .utils import taylor_test
 from .utils import taylor_test_expression
-from .drivers import replay_dolfin, compute_adjoint, compute_tlm, compute_gradient, hessian, compute_gradient_tlm
+from .drivers import replay_dolfin, compute_adjoint, compute_tlm, compute_gradient, compute_gradients, hessian, compute_gradient_tlm
 from .misc import annotations
 
 from .variational_solver import NonlinearVariationalSolver, NonlinearVariationalProblem, LinearVariationalSolver, LinearVariationalProblem
@@ -34,6 +38,8 @@ from .optimization.optizelle_solver import *
 from .optimization.riesz_maps import *
 
 from .reduced_functional import ReducedFunctional
+from .ensemble import Ensemble, EnsembleReducedFunctional
+from .memoization import InMemoryMemo, SQLiteMemo
 from .reduced_functional_numpy import ReducedFunctionalNumPy, ReducedFunctionalNumpy
 from .optimization.constraints import InequalityConstraint, EqualityConstraint
 from .optimization.optimization import minimize, maximize, print_optimization_methods, minimise, maximise
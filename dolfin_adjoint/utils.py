@@ -1,5 +1,7 @@
 from __future__ import print_function
 import math
+import multiprocessing
+import os
 import numpy
 
 import libadjoint
@@ -432,7 +434,7 @@ def taylor_remainder_with_gradient(m, Jm, dJdm, functional_value, perturbation,
     return remainder
 
 @noannotations
-def taylor_test(J, m, Jm, dJdm, HJm=None, seed=None, perturbation_direction=None, value=None, size=None):
+def taylor_test(J, m, Jm, dJdm, HJm=None, seed=None, perturbation_direction=None, value=None, size=None, processes=None):
     '''J must be a function that takes in a parameter value m and returns the value
        of the functional:
 
@@ -450,7 +452,14 @@ def taylor_test(J, m, Jm, dJdm, HJm=None, seed=None, perturbation_direction=None
        direction and returns the Hessian of the functional in that direction
        (i.e., takes in a vector and returns a vector). In that case, an additional
        Taylor remainder is computed, which should converge at order 3 if the Hessian
-       is correct.'''
+       is correct.
+
+       If processes is greater than one, the perturbed evaluations (and the
+       Hessian actions) are dispatched to that many worker processes. The
+       workers are forked from this process, one per perturbation, so they
+       start from the tape as it is and J need not be picklable; J must
+       return a float. The worker processes are only used in serial runs, and
+       this process's tape is left at the unperturbed control.'''
 
     from . import controls
     from .controls import ListControl
@@ -463,12 +472,12 @@ def taylor_test(J, m, Jm, dJdm, HJm=None, seed=None, perturbation_direction=None
     # Handle the multi-control case
     # We do this by performing a separate Taylor test for each control.
     if isinstance(m, controls.ListControl):
-        return _taylor_test_multi_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction, value, size=size)
+        return _taylor_test_multi_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction, value, size=size, processes=processes)
     else:
-        return _taylor_test_single_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction, value, size=size)
+        return _taylor_test_single_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction, value, size=size, processes=processes)
 
 
-def _taylor_test_multi_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction, value, size=None):
+def _taylor_test_multi_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction, value, size=None, processes=None):
     if perturbation_direction is None:
         perturbation_direction = [None] * len(m.controls)
     perturbation_direction = enlist(perturbation_direction)
@@ -495,8 +504,11 @@ def _taylor_test_multi_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction
             return J(m_values)
         return out
 
-    # A Hessian version restricted to the i'th control
-    if HJm is not None:
+    # A Hessian version restricted to the i'th control (HJm itself if there
+    # is only one, which keeps wrappers such as EnsembleHessian)
+    if HJm is not None and len(m.controls) == 1:
+        HJm_cmp = lambda i: HJm
+    elif HJm is not None:
         HJm_cmp = lambda i: lambda x: HJm.__class__(HJm.J, m[i])(x)
     else:
         HJm_cmp = lambda i: None
@@ -506,13 +518,13 @@ def _taylor_test_multi_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction
     for i in range(len(m.controls)):
         print("\nRunning Taylor test for control {}".format(i))
         conv = _taylor_test_single_control(J_cmp(J, i), m[i], Jm, dJdm[i],
-                                           HJm_cmp(i), seed, perturbation_direction[i], value[i], size)
+                                           HJm_cmp(i), seed, perturbation_direction[i], value[i], size, processes)
         min_conv = min(min_conv, conv)
 
     return min_conv
 
 
-def _taylor_test_single_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction, value, size=None):
+def _taylor_test_single_control(J, m, Jm, dJdm, HJm, seed, perturbation_direction, value, size=None, processes=None):
     from . import function, controls
 
     # Default to five runs/perturbations is none given
@@ -611,19 +623,8 @@ def _taylor_test_single_control(J, m, Jm, dJdm, HJm, seed, perturbation_directio
             vec += ic.vector()
             pinputs.append(pinput)
 
-    # Issue 34: We must evaluate HJm before we evaluate the tape at the
-    # perturbed controls below.
-    if HJm is not None:
-        HJm_values = []
-        for perturbation in perturbations:
-            HJmp = HJm(perturbation)
-            HJm_values.append(HJmp)
-
     # At last: the common bit!
-    functional_values = []
-    for pinput in pinputs:
-        Jp = J(pinput)
-        functional_values.append(Jp)
+    (functional_values, hessian_terms) = _perturbed_values(J, m, HJm, perturbations, pinputs, processes)
 
     # First-order Taylor remainders (not using adjoint)
     no_gradient = [abs(perturbed_J - Jm) for perturbed_J in functional_values]
@@ -647,18 +648,15 @@ def _taylor_test_single_control(J, m, Jm, dJdm, HJm, seed, perturbation_directio
 
     if HJm is not None:
         with_hessian = []
-        if isinstance(m, controls.ConstantControl):
-            for i in range(len(perturbations)):
-                remainder = abs(functional_values[i] - Jm - float(dJdm)*perturbations[i] - 0.5*perturbations[i]*HJm_values[i])
-                with_hessian.append(remainder)
-        elif isinstance(m, controls.ConstantControls):
-            for i in range(len(perturbations)):
-                remainder = abs(functional_values[i] - Jm - numpy.dot(dJdm, perturbations[i]) - 0.5*numpy.dot(perturbations[i], HJm_values[i]))
-                with_hessian.append(remainder)
-        elif isinstance(m, controls.FunctionControl):
-            for i in range(len(perturbations)):
-                remainder = abs(functional_values[i] - Jm - dJdm.vector().inner(perturbations[i].vector()) - 0.5*perturbations[i].vector().inner(HJm_values[i].vector()))
-                with_hessian.append(remainder)
+        for i in range(len(perturbations)):
+            if isinstance(m, controls.ConstantControl):
+                first_order = float(dJdm)*perturbations[i]
+            elif isinstance(m, controls.ConstantControls):
+                first_order = numpy.dot(dJdm, perturbations[i])
+            elif isinstance(m, controls.FunctionControl):
+                first_order = dJdm.vector().inner(perturbations[i].vector())
+            remainder = abs(functional_values[i] - Jm - first_order - 0.5*hessian_terms[i])
+            with_hessian.append(remainder)
 
         info("Taylor remainder with Hessian information: " + str(with_hessian))
         info("Convergence orders for Taylor remainder with Hessian information (should all be 3): " + str(convergence_order(with_hessian)))
@@ -667,6 +665,66 @@ def _taylor_test_single_control(J, m, Jm, dJdm, HJm, seed, perturbation_directio
         return min(convergence_order(with_gradient))
 
 
+# The evaluation of the i'th perturbation of a parallel Taylor test. It is
+# set before the worker processes are forked, and they inherit it.
+_perturbed_evaluation = None
+
+
+def _evaluate_perturbation(i):
+    return _perturbed_evaluation(i)
+
+
+def _perturbed_values(J, m, HJm, perturbations, pinputs, processes):
+    """ Return the functional values at the perturbed inputs, and the terms
+    <perturbation, HJm(perturbation)> of the Hessian remainders if HJm is
+    not None. """
+    from . import controls
+    global _perturbed_evaluation
+
+    def hessian_term(perturbation):
+        HJmp = HJm(perturbation)
+        if isinstance(m, controls.ConstantControl):
+            return perturbation*float(HJmp)
+        elif isinstance(m, controls.ConstantControls):
+            return numpy.dot(perturbation, HJmp)
+        else:
+            return perturbation.vector().inner(HJmp.vector())
+
+    parallel = processes is not None and processes > 1 and len(pinputs) > 1
+    if parallel and (compatibility.size(backend.comm_world) > 1 or not hasattr(os, "fork")):
+        warning("The Taylor test can only use worker processes in serial runs; evaluating the perturbations one by one.")
+        parallel = False
+
+    if not parallel:
+        # Issue 34: We must evaluate HJm before we evaluate the tape at the
+        # perturbed controls below.
+        hessian_terms = None
+        if HJm is not None:
+            hessian_terms = [hessian_term(perturbation) for perturbation in perturbations]
+        return ([J(pinput) for pinput in pinputs], hessian_terms)
+
+    # Every worker is forked for a single perturbation, so that it evaluates
+    # the Hessian action on the unperturbed tape (Issue 34).
+    def evaluate(i):
+        term = hessian_term(perturbations[i]) if HJm is not None else None
+        return (float(J(pinputs[i])), term)
+
+    _perturbed_evaluation = evaluate
+    if hasattr(multiprocessing, "get_context"):
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing
+    pool = context.Pool(min(processes, len(pinputs)), maxtasksperchild=1)
+    try:
+        results = pool.map(_evaluate_perturbation, range(len(pinputs)), chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        _perturbed_evaluation = None
+
+    return ([value for (value, term) in results], [term for (value, term) in results])
+
+
 def taylor_test_expression(exp, V, seed=None):
     """
     Performs a Taylor test of an Expression with dependencies.
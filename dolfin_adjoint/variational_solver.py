@@ -1,10 +1,11 @@
 import backend
 from . import solving
-import libadjoint
 from . import adjglobals
 from . import adjlinalg
+from . import tape_files
 from . import utils
 from . import compatibility
+from . import storage
 
 class NonlinearVariationalProblem(backend.NonlinearVariationalProblem):
     '''This object is overloaded so that solves using this class are automatically annotated,
@@ -35,10 +36,14 @@ class NonlinearVariationalSolver(backend.NonlinearVariationalSolver):
             problem = self.problem
             solving.annotate(problem.F == 0, problem.u, problem.bcs, J=problem.J, solver_parameters=compatibility.to_dict(self.parameters))
 
-        out = backend.NonlinearVariationalSolver.solve(self)
+        if annotate and tape_files.load_solution(self.problem.u):
+            # No Newton iterations were needed
+            out = (0, True)
+        else:
+            out = backend.NonlinearVariationalSolver.solve(self)
 
         if annotate and backend.parameters["adjoint"]["record_all"]:
-            adjglobals.adjointer.record_variable(adjglobals.adj_variables[self.problem.u], libadjoint.MemoryStorage(adjlinalg.Vector(self.problem.u)))
+            adjglobals.adjointer.record_variable(adjglobals.adj_variables[self.problem.u], storage.forward_storage(adjlinalg.Vector(self.problem.u), adjglobals.adj_variables[self.problem.u]))
 
         return out
 
@@ -71,9 +76,12 @@ class LinearVariationalSolver(backend.LinearVariationalSolver):
             problem = self.problem
             solving.annotate(problem.a == problem.L, problem.u, problem.bcs, solver_parameters=compatibility.to_dict(self.parameters))
 
-        out = backend.LinearVariationalSolver.solve(self)
+        if annotate and tape_files.load_solution(self.problem.u):
+            out = None
+        else:
+            out = backend.LinearVariationalSolver.solve(self)
 
         if annotate and backend.parameters["adjoint"]["record_all"]:
-            adjglobals.adjointer.record_variable(adjglobals.adj_variables[self.problem.u], libadjoint.MemoryStorage(adjlinalg.Vector(self.problem.u)))
+            adjglobals.adjointer.record_variable(adjglobals.adj_variables[self.problem.u], storage.forward_storage(adjlinalg.Vector(self.problem.u), adjglobals.adj_variables[self.problem.u]))
 
         return out
@@ -0,0 +1,72 @@
+"""
+Check that the adjoint equations of a diagnostic projection, which never
+feeds the functional, are not solved, and that the gradient is unchanged.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import caching
+
+mesh = UnitIntervalMesh(20)
+V = FunctionSpace(mesh, "CG", 1)
+W = FunctionSpace(mesh, "DG", 0)
+steps = 5
+
+def main(ic):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_new = Function(V, name="StateNext")
+
+    timestep = Constant(0.1)
+    a = u*v*dx + timestep*inner(grad(u), grad(v))*dx
+    L = u_*v*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(steps):
+        solve(a == L, u_new, bc)
+        u_.assign(u_new)
+
+        # Output only
+        project(u_.dx(0), W, name="Diagnostic")
+        adj_inc_timestep()
+
+    return u_
+
+if __name__ == "__main__":
+    ic = interpolate(Expression("sin(pi*x[0])", degree=1), V, name="InitialState")
+    u = main(ic)
+
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+
+    parameters["adjoint"]["prune_adjoint"] = False
+    full = compute_gradient(J, Control(ic), forget=False)
+
+    parameters["adjoint"]["prune_adjoint"] = True
+    caching.reset_replay_statistics()
+    pruned = compute_gradient(J, Control(ic), forget=False)
+    assert caching.replay_statistics["adjoint_skipped"] >= steps
+    assert (full.vector() - pruned.vector()).norm("linf") < 1.0e-14
+
+    for (adjoint, var) in compute_adjoint(J, forget=False):
+        if var.name == "Diagnostic":
+            assert adjoint.vector().norm("linf") == 0.0
+
+    assert replay_dolfin(tol=0.0, stop=True)
+
+    # The pruned equations forget the values they no longer need like the
+    # others, so that the same values are left on the tape
+    held = {}
+    for prune in (False, True):
+        adj_reset()
+        u = main(ic)
+        J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+
+        parameters["adjoint"]["prune_adjoint"] = prune
+        dJdic = compute_gradient(J, Control(ic), forget=True)
+        assert (full.vector() - dJdic.vector()).norm("linf") < 1.0e-14
+
+        report = adj_memory_report()
+        held[prune] = sorted(var for (var, kind, timestep, nbytes, where) in report.variables if kind == "forward")
+    assert held[True] == held[False]
+    parameters["adjoint"]["prune_adjoint"] = False
@@ -0,0 +1,83 @@
+"""
+Check that the adjoint solves that use the transposes of the forward
+operators kept during a replay give the same gradient as those that
+assemble their own operators, also when the operator only changes between
+timesteps through the parameters of an Expression, and that the kept
+operators are dropped once the values of the tape they were assembled from
+are forgotten.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import caching
+
+mesh = UnitSquareMesh(16, 16)
+V = FunctionSpace(mesh, "CG", 1)
+steps = 5
+
+# The replays must solve the forward equations for their operators to be kept
+parameters["adjoint"]["selective_replay"] = False
+
+def main(ic, expression=False):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_new = Function(V, name="StateNext")
+
+    # The advection makes the operator nonsymmetric, and the diffusivity
+    # makes it depend on the values of the tape
+    velocity = Constant((1.0, 0.5))
+    timestep = Constant(0.01)
+    if expression:
+        diffusivity = Expression("0.1*(1.0 + t)", t=0.0, degree=0)
+    else:
+        diffusivity = 0.1*(1 + u_**2)
+    F = ((u - u_)/timestep*v + diffusivity*inner(grad(u), grad(v)) + inner(velocity, grad(u))*v)*dx
+    bc = DirichletBC(V, 1.0, "on_boundary")
+
+    for i in range(steps):
+        if expression:
+            diffusivity.t = float(i)
+        solve(lhs(F) == rhs(F), u_new, bc)
+        u_.assign(u_new)
+        adj_inc_timestep()
+    return u_
+
+def gradient(rf, ic, transpose):
+    parameters["adjoint"]["transpose_forward_operators"] = transpose
+    rf(ic)
+    caching.forward_operators.reset_statistics()
+    dJdic = rf.derivative(forget=False)[0]
+    return (dJdic, caching.forward_operators.statistics())
+
+if __name__ == "__main__":
+    ic = interpolate(Expression("sin(pi*x[0])*sin(pi*x[1])", degree=2), V, name="InitialState")
+    u = main(ic)
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+    rf = ReducedFunctional(J, Control(ic))
+
+    (reference, stats) = gradient(rf, ic, False)
+    assert stats["hits"] == 0
+
+    (dJdic, stats) = gradient(rf, ic, True)
+    assert stats["hits"] > 0
+    assert (dJdic.vector() - reference.vector()).norm("linf") < 1.0e-10*reference.vector().norm("linf")
+    assert stats["entries"] > 0
+
+    # Forgetting the values of the tape drops the operators assembled from them
+    rf(ic)
+    rf.derivative(forget=True)
+    assert caching.forward_operators.statistics()["entries"] == 0
+
+    # Each timestep keeps its own operator
+    adj_reset()
+    u = main(ic, expression=True)
+    rf = ReducedFunctional(Functional(inner(u, u)*dx*dt[FINISH_TIME]), Control(ic))
+
+    (reference, stats) = gradient(rf, ic, False)
+    (dJdic, stats) = gradient(rf, ic, True)
+    assert stats["hits"] > 0
+    assert stats["entries"] == steps
+    assert (dJdic.vector() - reference.vector()).norm("linf") < 1.0e-10*reference.vector().norm("linf")
+
+    parameters["adjoint"]["transpose_forward_operators"] = False
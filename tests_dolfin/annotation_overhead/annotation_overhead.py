@@ -0,0 +1,97 @@
+"""
+Measure the time spent annotating each solve of a time loop with and
+without the annotation cache, for a heat equation and for Burgers' equation
+with a nonlinear solve in each timestep, and check that the cache does not
+change the gradients.
+"""
+
+from __future__ import print_function
+import time
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import caching
+
+n = 30
+steps = 20
+mesh = UnitIntervalMesh(n)
+V = FunctionSpace(mesh, "CG", 2)
+
+def heat(ic, annotate=False):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u_new = Function(V, name="StateNext")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+
+    timestep = Constant(1.0/n)
+    f = Expression("sin(pi*x[0])", degree=2)
+
+    a = u*v*dx + timestep*inner(grad(u), grad(v))*dx
+    L = (u_ + timestep*f)*v*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(steps):
+        solve(a == L, u_new, bc, annotate=annotate)
+        u_.assign(u_new, annotate=annotate)
+        adj_inc_timestep()
+
+    return u_
+
+def burgers_newton(ic, annotate=False):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = Function(V, name="StateNext")
+    v = TestFunction(V)
+
+    nu = Constant(0.0001)
+    timestep = Constant(1.0/n)
+
+    F = ((u - u_)/timestep*v
+         + u*u.dx(0)*v + nu*u.dx(0)*v.dx(0))*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(steps):
+        solve(F == 0, u, bc, annotate=annotate)
+        u_.assign(u, annotate=annotate)
+        adj_inc_timestep()
+
+    return u_
+
+def run(main, ic, cache):
+    parameters["adjoint"]["annotation_cache"] = cache
+    adj_reset()
+
+    start = time.time()
+    main(ic, annotate=False)
+    unannotated = time.time() - start
+
+    # The unannotated run advanced the timestep counter, so that the tape
+    # would not start at the first timestep
+    adj_reset()
+    caching.annotations.reset_statistics()
+
+    start = time.time()
+    u = main(ic, annotate=True)
+    annotated = time.time() - start
+
+    stats = caching.annotations.statistics()
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+    dJ = compute_gradient(J, FunctionControl("State"), forget=False)
+    return ((annotated - unannotated)/steps, stats, dJ)
+
+if __name__ == "__main__":
+    ic = project(Expression("sin(2*pi*x[0])", degree=1), V, annotate=False)
+
+    for main in [heat, burgers_newton]:
+        # Compile the forms before timing anything
+        main(ic, annotate=False)
+
+        (overhead, stats, dJ) = run(main, ic, cache=False)
+        (cached_overhead, cached_stats, cached_dJ) = run(main, ic, cache=True)
+
+        print("%s: annotation overhead per solve %.2e s without the annotation cache, %.2e s with it (%s)"
+              % (main.__name__, overhead, cached_overhead, cached_stats))
+
+        assert stats["hits"] == 0
+        assert cached_stats["hits"] == steps - 1
+        assert cached_stats["reused_callbacks"] == steps - 1
+        assert (dJ.vector() - cached_dJ.vector()).norm("linf") < 1.0e-14
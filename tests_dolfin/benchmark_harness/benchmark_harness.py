@@ -0,0 +1,27 @@
+"""
+Check that the benchmark harness runs, and that a run compared with its own
+results reports no regression, while a slower one does.
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "benchmarks"))
+
+import run_benchmarks
+
+if __name__ == "__main__":
+    assert run_benchmarks.main(["heat", "--quick", "--repeat", "1", "--save", "baseline.json"]) == 0
+
+    with open("baseline.json", "r") as f:
+        results = json.load(f)["results"]
+    os.remove("baseline.json")
+
+    (name, metrics) = list(results.items())[0]
+    assert metrics["gradient"] > 0.0 and metrics["peak_memory"] > 0
+    assert run_benchmarks.compare(results, results, 1.25) == []
+
+    slower = dict((key, dict(value)) for (key, value) in results.items())
+    slower[name]["gradient"] = 2*metrics["gradient"]
+    assert len(run_benchmarks.compare(slower, results, 1.25)) == 1
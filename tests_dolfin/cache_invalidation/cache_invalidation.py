@@ -0,0 +1,91 @@
+"""
+Check that a new value of a control that only enters the right-hand side
+keeps the factorisations of the operator, that a new value of a control in
+the operator (also through a parameter of an Expression) discards them,
+and that the gradients are unaffected.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import lusolver
+from dolfin_adjoint.adjglobals import adj_reset_cache
+
+mesh = UnitSquareMesh(16, 16)
+V = FunctionSpace(mesh, "CG", 1)
+
+def main(f, nu, expression=False):
+    u = TrialFunction(V)
+    v = TestFunction(V)
+
+    u_0 = Function(V, name="Solution")
+    dt = Constant(0.1)
+    if expression:
+        nu = Expression("nu*(1.0 + x[0])", nu=nu, degree=1)
+
+    a = u*v*dx + dt*nu*inner(grad(u), grad(v))*dx
+    L = (u_0 + dt*f)*v*dx
+
+    A = assemble(a)
+    solver = LUSolver(A)
+    solver.parameters["reuse_factorization"] = True
+
+    for i in range(5):
+        b = assemble(L)
+        solver.solve(u_0.vector(), b)
+        adj_inc_timestep()
+
+    return u_0
+
+if __name__ == "__main__":
+    f = interpolate(Expression("sin(pi*x[0])", degree=2), V, name="Source")
+    nu = Constant(1.0)
+    u = main(f, nu)
+
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+    rf = ReducedFunctional(J, [Control(f), Control(nu)])
+
+    rf([f, Constant(1.0)])
+    rf.derivative(forget=False)
+    fwd = lusolver.lu_solvers[0]
+    adj = lusolver.adj_lu_solvers[0]
+    assert fwd is not None and adj is not None
+
+    # Only the source changes: the factorisations are kept
+    f2 = interpolate(Expression("x[1]", degree=1), V)
+    rf([f2, Constant(1.0)])
+    assert lusolver.lu_solvers[0] is fwd
+    assert lusolver.adj_lu_solvers[0] is adj
+    dJ = rf.derivative(forget=False)
+
+    # Compare with a computation from scratch
+    adj_reset_cache()
+    rf([f2, Constant(1.0)])
+    assert lusolver.lu_solvers[0] is not fwd
+    dJ_fresh = rf.derivative(forget=False)
+    assert (dJ[0].vector() - dJ_fresh[0].vector()).norm("linf") < 1.0e-12
+    assert abs(float(dJ[1]) - float(dJ_fresh[1])) < 1.0e-12
+
+    # The diffusivity enters the operator: the factorisations are discarded
+    fwd = lusolver.lu_solvers[0]
+    rf([f2, Constant(2.0)])
+    assert lusolver.lu_solvers[0] is not fwd
+    assert lusolver.adj_lu_solvers[0] is None
+
+    # The same holds if the diffusivity is a parameter of an Expression
+    adj_reset()
+    idx = len(lusolver.lu_solvers)
+    u = main(f, nu, expression=True)
+    rf = ReducedFunctional(Functional(inner(u, u)*dx*dt[FINISH_TIME]), [Control(f), Control(nu)])
+    rf([f, Constant(1.0)])
+    rf.derivative(forget=False)
+
+    fwd = lusolver.lu_solvers[idx]
+    rf([f, Constant(2.0)])
+    assert lusolver.lu_solvers[idx] is not fwd
+    assert lusolver.adj_lu_solvers[idx] is None
+    dJ = rf.derivative(forget=False)
+
+    adj_reset_cache()
+    rf([f, Constant(2.0)])
+    dJ_fresh = rf.derivative(forget=False)
+    assert abs(float(dJ[1]) - float(dJ_fresh[1])) < 1.0e-12
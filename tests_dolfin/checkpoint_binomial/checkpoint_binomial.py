@@ -0,0 +1,99 @@
+"""
+Burgers' equation with the binomial checkpointing schedule of dolfin-adjoint.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint.checkpointing import binomial_schedule, reverse_cost
+from math import ceil
+
+n = 100
+mesh = UnitIntervalMesh(n)
+V = FunctionSpace(mesh, "CG", 2)
+
+def Dt(u, u_, timestep):
+    return (u - u_)/timestep
+
+def main(ic, annotate=False):
+    timestep = Constant(1.0/n)
+    t = 0.0
+    end = 0.5
+
+    u_ = ic.copy(deepcopy=True, annotate=annotate)
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    nu = Constant(0.0001)
+
+    F = (Dt(u, u_, timestep)*v
+         + u_*u.dx(0)*v + nu*u.dx(0)*v.dx(0))*dx
+
+    (a, L) = system(F)
+
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    u = Function(V)
+    j = 0
+    j += 0.5*float(timestep)*assemble(u_*u_*dx)
+    if annotate:
+        adjointer.time.start(t)
+
+    while (t <= end):
+        solve(a == L, u, bc, annotate=annotate)
+
+        u_.assign(u, annotate=annotate)
+
+        t += float(timestep)
+
+        if t>end:
+            quad_weight = 0.5
+        else:
+            quad_weight = 1.0
+        j += quad_weight*float(timestep)*assemble(u_*u_*dx)
+
+        if annotate:
+            adj_inc_timestep(time=t, finished=t>end)
+
+    return j, u_
+
+if __name__ == "__main__":
+
+    # The schedule alone: every timestep is turned exactly once, in reverse order,
+    # and the number of recomputed timesteps is optimal
+    actions = binomial_schedule(50, 3)
+    assert [a[1] for a in actions if a[0] == "turn"] == list(range(50))[::-1]
+    first_turn = [a[0] for a in actions].index("turn")
+    cost = sum(a[2] - a[1] for a in actions[first_turn:] if a[0] == "advance") + 50
+    assert cost <= reverse_cost(50, 3)
+
+    steps = int(ceil(0.5*n)) + 1
+    checkpointer = adj_checkpointing('binomial', steps, snaps_on_disk=1, snaps_in_ram=3, verbose=True)
+
+    ic = project(Expression("sin(2*pi*x[0])", degree=1),  V, name="InitialCondition")
+    j, forward = main(ic, annotate=True)
+
+    # The annotated forward run only keeps the values of the last timesteps
+    report = adj_memory_report()
+    assert len(report.timesteps) <= 3
+    assert report.stores["forward values"]["bytes"] <= 10*V.dim()*8
+
+    J = Functional(forward*forward*dx*dt)
+    m = Control(ic, value=ic)
+    dJdm = compute_gradient(J, m)
+
+    stats = checkpointer.statistics()
+    assert stats["recomputed_timesteps"] > 0
+    assert stats["peak_snapshots_in_ram"] <= 3
+    assert stats["peak_snapshots_on_disk"] <= 1
+
+    def Jhat(ic):
+        j, forward = main(ic, annotate=False)
+        return j
+
+    minconv = taylor_test(Jhat, m, j, dJdm, seed=1.0e-3)
+    assert minconv > 1.8
+
+    # The schedule also drives the replay of the ReducedFunctional
+    rf = ReducedFunctional(J, m)
+    assert abs(rf(ic) - j) < 1.0e-10
+    dJdm_rf = rf.derivative()[0]
+    assert (dJdm_rf.vector() - dJdm.vector()).norm("linf") < 1.0e-10
@@ -0,0 +1,79 @@
+"""
+Check that the values spilled to disk can be stored in a single compressed
+container, and that a saved container can be reopened.
+"""
+
+import glob
+import os
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import adjglobals, adjlinalg, checkpoint_files
+import libadjoint
+
+mesh = UnitSquareMesh(128, 128)
+V = FunctionSpace(mesh, "CG", 1)
+
+def main(ic, annotate=True):
+    u = TrialFunction(V)
+    v = TestFunction(V)
+
+    u_0 = ic.copy(deepcopy=True, name="Solution")
+    dt = Constant(0.01)
+
+    F = ((u - u_0)/dt*v + inner(grad(u), grad(v)) + u_0**2*v)*dx
+    a, L = lhs(F), rhs(F)
+    bc = DirichletBC(V, 1.0, "on_boundary")
+
+    for i in range(20):
+        solve(a == L, u_0, bc, annotate=annotate)
+        adj_inc_timestep()
+
+    return u_0
+
+def gradient():
+    adj_reset()
+    ic = interpolate(Expression("sin(pi*x[0])*sin(pi*x[1])", degree=2), V, name="InitialCondition")
+    u = main(ic)
+
+    J = Functional(u*u*dx*dt[FINISH_TIME])
+    return compute_gradient(J, Control(u))
+
+if __name__ == "__main__":
+    unbounded = gradient()
+
+    parameters["adjoint"]["max_memory_mb"] = 1
+    parameters["adjoint"]["checkpoint_container"] = "checkpoints"
+    parameters["adjoint"]["checkpoint_container_mb"] = 1
+    parameters["adjoint"]["checkpoint_compression"] = 4
+    bounded = gradient()
+
+    assert (bounded.vector() - unbounded.vector()).norm("linf") < 1.0e-12
+    assert [f for f in glob.glob("*.h5") if not f.startswith("checkpoints.")] == []
+    # The containers that hold no more values have been removed
+    assert len(glob.glob("checkpoints.*.h5")) <= 1
+
+    # Save a value, and read it back through a fresh index
+    var = libadjoint.Variable("Saved", 0, 0)
+    adjlinalg.Vector(unbounded).write(var)
+    adj_save_checkpoints()
+
+    checkpoint_files.containers.clear()
+    adjglobals.checkpoint_fs.clear()
+    adj_open_checkpoints("checkpoints", [V])
+
+    saved = adjlinalg.Vector.read(var).data
+    assert (saved.vector() - unbounded.vector()).norm("linf") == 0.0
+    adjlinalg.Vector.delete(var)
+
+    # Closing the container removes the files that hold no more values,
+    # the current one included
+    container = checkpoint_files.containers["checkpoints"]
+    live = dict(container.live)
+    container.close_all()
+    for f in glob.glob("checkpoints.*.h5"):
+        assert live.get(int(f.split(".")[1]), 0) > 0
+    assert os.path.exists(container.path(container.current)) == (live.get(container.current, 0) > 0)
+
+    for f in glob.glob("checkpoints.*"):
+        os.remove(f)
@@ -0,0 +1,56 @@
+"""
+Check the gradients of several functionals computed in one reverse sweep
+against the gradients of an unpruned sweep per functional, and against a
+Taylor test of each functional.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+
+mesh = UnitSquareMesh(16, 16)
+V = FunctionSpace(mesh, "CG", 1)
+
+def main(ic, annotate=False):
+    u = TrialFunction(V)
+    v = TestFunction(V)
+
+    u_0 = ic.copy(deepcopy=True, name="Solution", annotate=annotate)
+    dt = Constant(0.01)
+
+    F = ((u - u_0)/dt*v + inner(grad(u), grad(v)) + u_0**2*v)*dx
+    a, L = lhs(F), rhs(F)
+    bc = DirichletBC(V, 1.0, "on_boundary")
+
+    for i in range(5):
+        solve(a == L, u_0, bc, annotate=annotate)
+        if annotate:
+            adj_inc_timestep()
+
+    return u_0
+
+if __name__ == "__main__":
+    ic = interpolate(Expression("sin(pi*x[0])*sin(pi*x[1])", degree=2), V, name="InitialCondition")
+    u = main(ic, annotate=True)
+
+    observations = [Expression("x[0]", degree=1), Expression("x[1]*x[1]", degree=2), Constant(0.5)]
+    Js = [Functional((u - obs)**2*dx*dt[FINISH_TIME]) for obs in observations]
+
+    # One unpruned sweep per functional, which does not share the adjoint operators
+    parameters["adjoint"]["prune_adjoint"] = False
+    separate = [compute_gradient(J, Control(ic), forget=False) for J in Js]
+
+    parameters["adjoint"]["prune_adjoint"] = True
+    together = compute_gradients(Js, Control(ic), forget=False)
+    parameters["adjoint"]["prune_adjoint"] = False
+
+    assert len(together) == len(Js)
+    for (a, b) in zip(separate, together):
+        assert (a.vector() - b.vector()).norm("linf") < 1.0e-12
+
+    for (obs, dJdic) in zip(observations, together):
+        def Jhat(ic):
+            u = main(ic)
+            return assemble((u - obs)**2*dx)
+
+        minconv = taylor_test(Jhat, Control(ic), Jhat(ic), dJdic)
+        assert minconv > 1.9
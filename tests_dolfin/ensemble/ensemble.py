@@ -0,0 +1,54 @@
+"""
+Check that an EnsembleReducedFunctional over groups of one process agrees
+with a ReducedFunctional of all the scenarios on one tape.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+
+ensemble = Ensemble(M=1)
+mesh = UnitSquareMesh(ensemble.comm, 8, 8)
+V = FunctionSpace(mesh, "CG", 1)
+n = 4
+
+def forcing(i):
+    return Expression("sin((i + 1)*pi*x[0])*x[1]", i=i, degree=2)
+
+def main(m, scenarios):
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    j = 0
+    for i in scenarios:
+        state = Function(V, name="State%d" % i)
+        solve(inner(grad(u), grad(v))*dx == m*forcing(i)*v*dx, state, bc)
+        j += inner(state, state)*dx
+    return Functional(j*dt[FINISH_TIME])
+
+if __name__ == "__main__":
+    m = interpolate(Constant(1.0), V, name="Control")
+    J = main(m, range(n))
+    rf = ReducedFunctional(J, Control(m))
+    Jm = rf(m)
+    dJdm = rf.derivative(forget=False)[0]
+
+    # The same direction on every group
+    direction = interpolate(Expression("x[0]*(1.0 - x[1])", degree=2), V)
+    orders = rf.taylor_test(m, test_hessian=True, seed=1.0e-2, perturbation_direction=direction)
+
+    adj_reset()
+    m = interpolate(Constant(1.0), V, name="Control")
+    J = main(m, ensemble.scenarios(n))
+    erf = EnsembleReducedFunctional(J, Control(m), ensemble)
+
+    assert abs(erf(m) - Jm) < 1.0e-12*abs(Jm)
+    edJdm = erf.derivative(forget=False)[0]
+    assert (edJdm.vector() - dJdm.vector()).norm("linf") < 1.0e-12*dJdm.vector().norm("linf")
+
+    # The random direction is broadcast from the first group
+    assert erf.taylor_test(m, test_hessian=True, seed=1.0e-2) > 1.9
+
+    eorders = erf.taylor_test(m, test_hessian=True, seed=1.0e-2, perturbation_direction=direction)
+    assert eorders > 1.9
+    assert abs(eorders - orders) < 1.0e-2
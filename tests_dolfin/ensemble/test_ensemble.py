@@ -0,0 +1,10 @@
+from os import path
+import subprocess
+
+def test(request):
+    test_file = path.split(path.dirname(str(request.fspath)))[1] + ".py"
+    test_dir = path.split(str(request.fspath))[0]
+    test_cmd = ["mpirun", "-n", "2", "python", path.join(test_dir, test_file)]
+
+    handle = subprocess.Popen(test_cmd, cwd=test_dir)
+    assert handle.wait() == 0
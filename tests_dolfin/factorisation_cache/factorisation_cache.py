@@ -0,0 +1,96 @@
+"""
+Check that the factorisations of the adjoint operators are shared between
+timesteps and functional evaluations while the operator is unchanged, and
+that they are not reused once it changes, also if it only changes through a
+Constant parameter of an Expression.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import caching
+
+parameters["adjoint"]["cache_factorizations"] = True
+
+mesh = UnitSquareMesh(16, 16)
+V = FunctionSpace(mesh, "CG", 1)
+steps = 10
+
+def main(nu, expression=False):
+    u = TrialFunction(V)
+    v = TestFunction(V)
+
+    u_0 = interpolate(Expression("sin(pi*x[0])*sin(pi*x[1])", degree=2), V, name="Solution")
+    dt = Constant(0.01)
+    if expression:
+        nu = Expression("nu*(1.0 + x[0])", nu=nu, degree=1)
+
+    F = ((u - u_0)/dt*v + nu*inner(grad(u), grad(v)) - v)*dx
+    a, L = lhs(F), rhs(F)
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(steps):
+        solve(a == L, u_0, bc)
+        adj_inc_timestep()
+
+    return u_0
+
+if __name__ == "__main__":
+    nu = Constant(1.0, name="Diffusivity")
+    u = main(nu)
+
+    J = Functional(u*u*dx*dt[FINISH_TIME])
+    rf = ReducedFunctional(J, Control(nu))
+
+    # All timesteps share one factorisation
+    rf.derivative()
+    stats = caching.factorisations.statistics()
+    assert stats["misses"] == 1
+    assert stats["hits"] == steps - 1
+
+    # ... which survives the next evaluation at the same point
+    rf(Constant(1.0))
+    dJ = rf.derivative(forget=False)[0]
+    stats = caching.factorisations.statistics()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2*steps - 1
+
+    # A different diffusivity gives a different operator
+    rf(Constant(2.0))
+    dJ2 = rf.derivative(forget=False)[0]
+    stats = caching.factorisations.statistics()
+    assert stats["misses"] == 2
+    assert stats["hits"] == 3*steps - 2
+    assert float(dJ2) != float(dJ)
+
+    # The old factorisation was not used in the last evaluation
+    rf(Constant(2.0))
+    assert caching.factorisations.statistics()["entries"] == 1
+
+    # Check the gradient against a computation without the cache
+    parameters["adjoint"]["cache_factorizations"] = False
+    rf(Constant(2.0))
+    dJ2_uncached = rf.derivative(forget=False)[0]
+    assert abs(float(dJ2) - float(dJ2_uncached)) < 1.0e-12
+
+    print("Factorisation cache statistics: %s" % stats)
+    assert stats["hit_rate"] > 0.9
+
+    # The operator depends on the control only through the Expression
+    adj_reset()
+    parameters["adjoint"]["cache_factorizations"] = True
+    nu = Constant(1.0, name="Diffusivity")
+    u = main(nu, expression=True)
+
+    J = Functional(u*u*dx*dt[FINISH_TIME])
+    rf = ReducedFunctional(J, Control(nu))
+    rf(Constant(1.0))
+    rf.derivative(forget=False)
+    caching.factorisations.reset_statistics()
+    rf(Constant(2.0))
+    dJ2 = rf.derivative(forget=False)[0]
+    assert caching.factorisations.statistics()["misses"] == 1
+
+    parameters["adjoint"]["cache_factorizations"] = False
+    rf(Constant(2.0))
+    dJ2_uncached = rf.derivative(forget=False)[0]
+    assert abs(float(dJ2) - float(dJ2_uncached)) < 1.0e-12
@@ -0,0 +1,71 @@
+"""
+Check that the block Hessian action agrees with the Hessian actions in the
+individual directions computed without the shared operators, that it
+passes the Taylor test, and that it reuses the operators, factorisations
+and pinned adjoint solutions it is meant to.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+
+mesh = UnitSquareMesh(8, 8)
+V = FunctionSpace(mesh, "CG", 1)
+
+def main(m, annotate=True):
+    u = Function(V, name="Solution")
+    v = TestFunction(V)
+
+    F = inner(grad(u), grad(v))*dx + u**3*v*dx - m*v*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+    solve(F == 0, u, bc, annotate=annotate)
+
+    return u
+
+def Jhat(m):
+    u = main(m, annotate=False)
+    return assemble(u**4*dx + inner(m, m)*dx)
+
+if __name__ == "__main__":
+    m = interpolate(Expression("x[0]*x[1]", degree=2), V, name="Parameter")
+    u = main(m)
+
+    J = Functional(u**4*dx + inner(m, m)*dx)
+    H = hessian(J, Control(m), warn=False, pin_adjoint=True)
+
+    directions = [interpolate(Expression(e, degree=2), V)
+                  for e in ("sin(pi*x[0])", "x[1]*x[1]", "1.0")]
+
+    with adj_profile(memory=False) as profile:
+        block = H.apply_block(directions)
+    assert len(block) == len(directions)
+
+    # Each operator is assembled and factorised once for all the directions
+    assert profile.counters["block operator hits"] > 0
+    assert profile.counters["block factorisation hits"] > 0
+
+    # The Hessian actions in the single directions, from a separate Hessian
+    # that neither shares the operators nor pins the adjoint
+    single = hessian(J, Control(m), warn=False)
+    for (m_dot, Hm) in zip(directions, block):
+        assert (single(m_dot).vector() - Hm.vector()).norm("linf") < 1.0e-10*max(Hm.vector().norm("linf"), 1.0)
+
+    # The pinned adjoint solutions are used, rather than solved for again,
+    # even once the adjoint values are forgotten from the tape
+    for i in range(adjointer.equation_count):
+        adjointer.forget_adjoint_values(i)
+    with adj_profile(memory=False) as profile:
+        again = H.apply_block(directions)
+    assert profile.counters["pinned adjoint hits"] > 0
+    assert profile.totals(key=lambda event: event["name"]).get("Hessian action (ADM)") is None
+    for (Hm, Hm_again) in zip(block, again):
+        assert (Hm.vector() - Hm_again.vector()).norm("linf") < 1.0e-12*max(Hm.vector().norm("linf"), 1.0)
+
+    H.release()
+    assert len(H.pinned) == 0
+
+    # The Taylor test of the block action
+    dJdm = compute_gradient(J, Control(m), forget=False)
+    Jm = Jhat(m)
+    HJm = lambda m_dot: H.apply_block([m_dot])[0]
+    minconv = taylor_test(Jhat, Control(m), Jm, dJdm, HJm=HJm, seed=1.0e-2, perturbation_direction=directions[0])
+    assert minconv > 2.8
@@ -0,0 +1,91 @@
+"""
+Check that the adjoint solves of a PETScKrylovSolver precondition with the
+forward preconditioner, and that the gradient is the same as with
+preconditioners of their own, also after the control changed, and that an
+operator that changes from timestep to timestep is not preconditioned with
+the forward preconditioner of another timestep.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import preconditioners
+
+mesh = UnitSquareMesh(8, 8)
+V = FunctionSpace(mesh, "CG", 1)
+
+def main(kappa, varying=False):
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_ = Function(V, name="State")
+    u_new = Function(V, name="StateNext")
+
+    # Advection makes the operator nonsymmetric
+    velocity = Constant((1.0, 0.5))
+    timestep = Constant(0.05)
+    diffusivity = kappa*(1 + u_**2) if varying else kappa
+    a = u*v*dx + timestep*(diffusivity*inner(grad(u), grad(v)) + inner(velocity, grad(u))*v)*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    A = assemble(a)
+    bc.apply(A)
+    solver = PETScKrylovSolver("gmres", "ilu")
+    solver.parameters["relative_tolerance"] = 1.0e-12
+    solver.parameters["absolute_tolerance"] = 1.0e-14
+    solver.set_operator(A)
+
+    for i in range(3):
+        if varying:
+            A = assemble(a)
+            bc.apply(A)
+            solver.set_operator(A)
+        b = assemble((u_ + timestep)*v*dx)
+        bc.apply(b)
+        solver.solve(u_new.vector(), b)
+        u_.assign(u_new)
+        adj_inc_timestep()
+    return u_
+
+def gradient(rf, kappa, policy):
+    parameters["adjoint"]["krylov_preconditioner_reuse"] = policy
+    rf(kappa)
+    return rf.derivative(forget=False)[0]
+
+if __name__ == "__main__":
+    kappa = interpolate(Constant(0.1), V, name="Diffusivity")
+    u = main(kappa)
+
+    rf = ReducedFunctional(Functional(inner(u, u)*dx*dt[FINISH_TIME]), Control(kappa))
+
+    preconditioners.reset_statistics()
+    own = gradient(rf, kappa, "rebuild")
+    assert preconditioners.statistics["shared"] == 0
+    assert preconditioners.statistics["rebuilt"] > 0
+
+    preconditioners.reset_statistics()
+    shared = gradient(rf, kappa, "operator")
+    assert preconditioners.statistics["shared"] > 0
+    assert preconditioners.statistics["rebuilt"] == 0
+    assert (own.vector() - shared.vector()).norm("linf") < 1.0e-8*own.vector().norm("linf")
+
+    # At a new control value, the adjoint operator must be reassembled
+    kappa_new = interpolate(Constant(0.2), V, name="Diffusivity")
+    own = gradient(rf, kappa_new, "rebuild")
+    for policy in ["operator", "lagged"]:
+        shared = gradient(rf, kappa_new, policy)
+        assert (own.vector() - shared.vector()).norm("linf") < 1.0e-8*own.vector().norm("linf")
+
+    parameters["adjoint"]["krylov_preconditioner_reuse"] = "operator"
+    assert rf.taylor_test(kappa_new) > 1.9
+
+    # After a replay, the forward solver holds the operator of the first
+    # timestep and the adjoint solver that of the last one
+    adj_reset()
+    u = main(kappa, varying=True)
+    rf = ReducedFunctional(Functional(inner(u, u)*dx*dt[FINISH_TIME]), Control(kappa))
+
+    own = gradient(rf, kappa_new, "rebuild")
+    preconditioners.reset_statistics()
+    shared = gradient(rf, kappa_new, "operator")
+    assert preconditioners.statistics["shared"] == 0
+    assert (own.vector() - shared.vector()).norm("linf") < 1.0e-8*own.vector().norm("linf")
+    parameters["adjoint"]["krylov_preconditioner_reuse"] = "rebuild"
@@ -0,0 +1,56 @@
+"""
+Check that seeding the adjoint Krylov solves with the solutions of the
+previous timesteps, or with a recycled subspace, reduces the number of
+iterations and leaves the gradient unchanged.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import recycling
+
+mesh = UnitSquareMesh(16, 16)
+V = FunctionSpace(mesh, "CG", 1)
+steps = 10
+solver_parameters = {"linear_solver": "gmres", "preconditioner": "jacobi",
+                     "krylov_solver": {"relative_tolerance": 1.0e-10,
+                                       "absolute_tolerance": 1.0e-14}}
+
+def main(ic):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_new = Function(V, name="StateNext")
+
+    velocity = Constant((1.0, 0.5))
+    timestep = Constant(0.01)
+    F = ((u - u_)/timestep*v + 0.1*inner(grad(u), grad(v)) + inner(velocity, grad(u))*v)*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(steps):
+        solve(lhs(F) == rhs(F), u_new, bc, solver_parameters=solver_parameters)
+        u_.assign(u_new)
+        adj_inc_timestep()
+    return u_
+
+def gradient(J, ic, guess, recycled=0):
+    parameters["adjoint"]["krylov_initial_guess"] = guess
+    parameters["adjoint"]["krylov_recycling"] = recycled
+    recycling.reset_statistics()
+    dJdic = compute_gradient(J, Control(ic), forget=False)
+    return (dJdic, recycling.sweeps[-1]["iterations"])
+
+if __name__ == "__main__":
+    ic = interpolate(Expression("sin(pi*x[0])*sin(pi*x[1])", degree=2), V, name="InitialState")
+    u = main(ic)
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+
+    (reference, zero_iterations) = gradient(J, ic, "zero")
+    assert zero_iterations > 0
+
+    for (guess, recycled) in [("previous", 0), ("extrapolate", 0), ("zero", 3)]:
+        (dJdic, iterations) = gradient(J, ic, guess, recycled)
+        assert iterations < zero_iterations
+        assert (dJdic.vector() - reference.vector()).norm("linf") < 1.0e-7*reference.vector().norm("linf")
+
+    parameters["adjoint"]["krylov_initial_guess"] = "zero"
+    parameters["adjoint"]["krylov_recycling"] = 0
@@ -0,0 +1,52 @@
+"""
+Check the vector operations that work on NumPy arrays of the local values:
+the values set and read back through adjlinalg.Vector and the global
+arrays of ReducedFunctionalNumPy.
+"""
+
+import numpy
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import adjlinalg, buffers
+from dolfin_adjoint.reduced_functional_numpy import get_global, set_local
+
+mesh = UnitSquareMesh(8, 8)
+V = FunctionSpace(mesh, "CG", 1)
+
+if __name__ == "__main__":
+    f = interpolate(Expression("x[0] + 2*x[1]", degree=1), V)
+    with buffers.local_array(f.vector(), write=False) as values:
+        assert numpy.allclose(values, f.vector().get_local())
+
+    # Writes through the array end up in the vector
+    with buffers.local_array(f.vector()) as values:
+        values[:] = 3.0
+    assert numpy.allclose(f.vector().get_local(), 3.0)
+
+    x = adjlinalg.Vector(Function(V))
+    x.set_random()
+    values = x.data.vector().get_local()
+    assert values.min() >= 0.0 and values.max() <= 1.0 and values.std() > 0.0
+
+    array = numpy.arange(x.size(), dtype=float)
+    x.set_values(array)
+    out = numpy.empty(x.size())
+    x.get_values(out)
+    assert (out == array).all()
+
+    # The first add copies the scaled values, and leaves x alone
+    y = adjlinalg.Vector(None)
+    y.axpy(2.0, x)
+    assert numpy.allclose(y.data.vector().get_local(), 2.0*array)
+    assert (x.data.vector().get_local() == array).all()
+
+    # The global arrays of a Function and a Constant control
+    c = Constant((1.0, 2.0))
+    m_global = get_global([f, c, 4.0])
+    assert len(m_global) == V.dim() + 3
+    assert numpy.allclose(m_global[:V.dim()], 3.0)
+    assert (m_global[V.dim():] == [1.0, 2.0, 4.0]).all()
+
+    new = numpy.random.random(V.dim() + 2)
+    set_local([f, c], new)
+    assert (get_global([f, c]) == new).all()
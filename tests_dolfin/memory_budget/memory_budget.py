@@ -0,0 +1,62 @@
+"""
+Check that a memory budget for the tape spills forward values to disk
+without changing the gradient.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import storage, diskio
+
+mesh = UnitSquareMesh(128, 128)
+V = FunctionSpace(mesh, "CG", 1)
+
+def main(ic, annotate=True):
+    u = TrialFunction(V)
+    v = TestFunction(V)
+
+    u_0 = ic.copy(deepcopy=True, name="Solution")
+    dt = Constant(0.01)
+
+    F = ((u - u_0)/dt*v + inner(grad(u), grad(v)) + u_0**2*v)*dx
+    a, L = lhs(F), rhs(F)
+    bc = DirichletBC(V, 1.0, "on_boundary")
+
+    for i in range(20):
+        solve(a == L, u_0, bc, annotate=annotate)
+        adj_inc_timestep()
+
+    return u_0
+
+def gradient():
+    adj_reset()
+    ic = interpolate(Expression("sin(pi*x[0])*sin(pi*x[1])", degree=2), V, name="InitialCondition")
+    u = main(ic)
+
+    J = Functional(u*u*dx*dt[FINISH_TIME])
+    return compute_gradient(J, Control(u))
+
+if __name__ == "__main__":
+    unbounded = gradient()
+
+    # Each forward value takes about 130 kB
+    parameters["adjoint"]["max_memory_mb"] = 1
+    storage.store.reset_statistics()
+    bounded = gradient()
+
+    stats = storage.store.statistics()
+    assert stats["evictions"] > 0
+    assert stats["loads"] > 0
+    assert stats["peak_resident_bytes"] <= 1024*1024 + V.dim()*8
+
+    assert (bounded.vector() - unbounded.vector()).norm("linf") < 1.0e-12
+
+    # Spill and prefetch in the background, which needs the containers
+    parameters["adjoint"]["io_threads"] = 2
+    parameters["adjoint"]["checkpoint_container"] = "memory_budget"
+    diskio.pool.reset_statistics()
+    storage.store.reset_statistics()
+    threaded = gradient()
+
+    assert storage.store.statistics()["prefetches"] > 0
+    assert diskio.pool.statistics()["prefetch_hits"] > 0
+    assert (threaded.vector() - unbounded.vector()).norm("linf") < 1.0e-12
@@ -0,0 +1,56 @@
+"""
+Check that adj_memory_report accounts for the forward and adjoint values
+on the tape, that the high-water mark of a gradient computation with
+forget=True lies above the memory held afterwards, and that the
+ReducedFunctional memory callback is called.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+
+mesh = UnitIntervalMesh(20)
+V = FunctionSpace(mesh, "CG", 1)
+steps = 3
+
+def main(ic):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_new = Function(V, name="StateNext")
+
+    timestep = Constant(0.1)
+    a = u*v*dx + timestep*inner(grad(u), grad(v))*dx
+    L = u_*v*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(steps):
+        solve(a == L, u_new, bc)
+        u_.assign(u_new)
+        adj_inc_timestep()
+
+    return u_
+
+if __name__ == "__main__":
+    ic = interpolate(Expression("sin(pi*x[0])", degree=1), V, name="InitialState")
+    u = main(ic)
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+
+    report = adj_memory_report()
+    forward = [var for var in report.variables if var[1] == "forward"]
+    assert len(forward) > 0
+    assert report.stores["forward values"]["bytes"] == sum(var[3] for var in forward)
+    assert sum(report.timesteps.values()) <= report.total
+    print(report)
+
+    reports = []
+    rf = ReducedFunctional(J, Control(ic), memory_cb=lambda kind, mark: reports.append((kind, mark)))
+    rf(ic)
+    with adj_memory_high_water() as mark:
+        rf.derivative(forget=False)
+    assert mark.samples > 2
+    assert "adjoint values" in mark.report.stores
+    assert [kind for (kind, m) in reports] == ["functional", "derivative"]
+
+    with adj_memory_high_water() as mark:
+        compute_gradient(J, Control(ic), forget=True)
+    assert mark.peak >= adj_memory_report().total
@@ -0,0 +1,68 @@
+"""
+Check that the tape only logs the Expression and Constant parameters that
+change, and that the replay and the adjoint see the parameters as they were
+when each equation was annotated.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import expressions, constant
+
+mesh = UnitIntervalMesh(20)
+V = FunctionSpace(mesh, "CG", 1)
+steps = 10
+
+# Many unrelated Expressions and Constants that never change
+unused = [Expression("x[0]*c", c=float(i), degree=1) for i in range(100)]
+unused_constants = [Constant(float(i)) for i in range(100)]
+
+def main(ic, annotate=False):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_new = Function(V, name="StateNext")
+
+    timestep = Constant(0.1)
+    amplitude = Constant(1.0)
+    source = Expression("t*sin(pi*x[0])", t=0.0, degree=1)
+
+    a = u*v*dx + timestep*inner(grad(u), grad(v))*dx
+    L = (u_ + timestep*amplitude*source)*v*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    t = 0.0
+    for i in range(steps):
+        t += float(timestep)
+        source.t = t
+        if i % 2 == 0:
+            amplitude.assign(1.0 + t)
+
+        solve(a == L, u_new, bc, annotate=annotate)
+        u_.assign(u_new, annotate=annotate)
+        adj_inc_timestep()
+
+    return u_
+
+if __name__ == "__main__":
+    ic = interpolate(Expression("sin(pi*x[0])", degree=1), V, name="InitialState")
+    expressions_before = len(expressions.log)
+    constants_before = len(constant.log)
+    u = main(ic, annotate=True)
+
+    # One value per change (and per attribute set by the constructors), not
+    # one copy of every parameter of the 200 unused objects per equation
+    assert len(expressions.log) - expressions_before <= steps + 10
+    assert len(constant.log) - constants_before <= steps//2 + 2
+
+    assert replay_dolfin(tol=0.0, stop=True)
+
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+    dJdic = compute_gradient(J, FunctionControl("State"), forget=False)
+    Jic = assemble(inner(u, u)*dx)
+
+    def Jfunc(ic):
+        u = main(ic, annotate=False)
+        return assemble(inner(u, u)*dx)
+
+    minconv = taylor_test(Jfunc, FunctionControl("State"), Jic, dJdic)
+    assert minconv > 1.9
@@ -0,0 +1,66 @@
+"""
+Check that adj_profile records the forward replay and the adjoint solves
+per equation and phase, and writes a Chrome trace.
+"""
+
+import json
+import os
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import profiling
+
+mesh = UnitIntervalMesh(20)
+V = FunctionSpace(mesh, "CG", 1)
+steps = 3
+
+def main(ic):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_new = Function(V, name="StateNext")
+
+    timestep = Constant(0.1)
+    a = u*v*dx + timestep*inner(grad(u), grad(v))*dx
+    L = u_*v*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(steps):
+        solve(a == L, u_new, bc)
+        u_.assign(u_new)
+        adj_inc_timestep()
+
+    return u_
+
+if __name__ == "__main__":
+    ic = interpolate(Expression("sin(pi*x[0])", degree=1), V, name="InitialState")
+    u = main(ic)
+
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+    rf = ReducedFunctional(J, Control(ic))
+
+    with adj_profile("profile.json") as profile:
+        rf(ic)
+        rf.derivative()
+    assert profiling.active is None
+
+    phases = set(event["phase"] for event in profile.events)
+    assert set(["forward", "adjoint", "functional", "solve"]).issubset(phases)
+    adjoint = [event for event in profile.events if event["phase"] == "adjoint"]
+    assert len(adjoint) == adjointer.equation_count
+    for event in profile.events:
+        assert event["self"] <= event["duration"] + 1.0e-12
+
+    summary = profile.summary()
+    assert "adjoint" in summary and "forward" in summary
+    print(summary)
+
+    with open("profile.json") as f:
+        trace = json.load(f)
+    assert len([event for event in trace["traceEvents"] if event["ph"] == "X"]) == len(profile.events)
+    os.remove("profile.json")
+
+    # Nothing is recorded outside adj_profile
+    events = len(profile.events)
+    compute_gradient(J, Control(ic), forget=False)
+    assert len(profile.events) == events
@@ -1,7 +1,10 @@
 from dolfin import *
 from dolfin_adjoint import *
+from dolfin_adjoint.reduced_functional import value_hash
 import os
 import os.path
+import pickle
+import libadjoint
 
 dolfin.parameters["adjoint"]["cache_factorizations"] = True
 if dolfin.__version__ > '1.2.0':
@@ -68,6 +71,7 @@ if __name__ == "__main__":
 
     assert a == b
     assert time_a/time_b > 50 # Check that speed-up is significant
+    j = a
 
     # Now let's test the caching of the functional gradient
     t = dolfin.Timer("")
@@ -82,6 +86,27 @@ if __name__ == "__main__":
     assert float(a[1]) == float(b[1])
     assert time_a/time_b > 100 # Check that speed-up is significant
 
+    stats = rf.memo.statistics()
+    assert stats["functional"] == {"hits": 1, "misses": 1}
+    assert stats["derivative"] == {"hits": 1, "misses": 1}
+
+    # A restarted optimisation finds the evaluations in the database
+    restarted = ReducedFunctional(J, [m1, m2], cache=SQLiteMemo(cache_file))
+    assert restarted([interpolate(Constant(2), V), Constant(4)]) == j
+    c = restarted.derivative(forget=False)
+    assert max(abs(a[0].vector().array() - c[0].vector().array())) == 0
+    assert restarted.memo.statistics()["derivative"]["hits"] == 1
+
+    # A permutation of the dofs has the same norms, but must not hit the cache
+    m = interpolate(Expression("x[0]", degree=1), V)
+    m_reversed = Function(V)
+    m_reversed.vector().set_local(m.vector().get_local()[::-1].copy())
+    m_reversed.vector().apply("insert")
+    norm = m.vector().norm("l2")
+    assert abs(norm - m_reversed.vector().norm("l2")) <= 1.0e-14*norm
+    assert value_hash([m, Constant(4)]) != value_hash([m_reversed, Constant(4)])
+    assert value_hash([m, Constant(4)]) == value_hash([m.copy(deepcopy=True), Constant(4)])
+
     # Finally, let's check caching of the Hessian
     # TODO
 
@@ -89,4 +114,16 @@ if __name__ == "__main__":
     del rf
     assert os.path.isfile(cache_file)
 
+    # A cache file that is not an sqlite database is reported
+    old_cache_file = "old_cache.pck"
+    with open(old_cache_file, "wb") as f:
+        pickle.dump({}, f)
+    raised_exception = False
+    try:
+        ReducedFunctional(J, [m1, m2], cache=old_cache_file)
+    except libadjoint.exceptions.LibadjointErrorInvalidInputs:
+        raised_exception = True
+    os.remove(old_cache_file)
+    assert raised_exception
+
     info_green("Test passed")
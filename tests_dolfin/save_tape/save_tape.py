@@ -0,0 +1,90 @@
+"""
+Save the tape of Burgers' equation, load it in a second process and check
+that the gradient computed there matches the one of the original run.
+"""
+
+from __future__ import print_function
+import json
+import subprocess
+import sys
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import adjglobals
+import libadjoint
+import numpy
+
+n = 30
+mesh = UnitIntervalMesh(n)
+V = FunctionSpace(mesh, "CG", 2)
+
+def main(ic):
+    u_ = ic.copy(deepcopy=True, name="Velocity")
+    u = Function(V, name="VelocityNext")
+    v = TestFunction(V)
+
+    nu = Constant(0.0001)
+    timestep = Constant(1.0/n)
+
+    F = ((u - u_)/timestep*v
+         + u*u.dx(0)*v + nu*u.dx(0)*v.dx(0))*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    # The velocity is passed on through an L2 projection with an LU solver,
+    # so that the overloaded solver classes are read from the tape as well
+    w = Function(V, name="VelocityProjected")
+    M = assemble(inner(TrialFunction(V), v)*dx)
+    solver = LUSolver(M)
+
+    for i in range(5):
+        solve(F == 0, u, bc)
+        solver.solve(w.vector(), assemble(inner(u, v)*dx))
+        u_.assign(w)
+        adj_inc_timestep()
+
+    return u_
+
+def gradient(u):
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+    dJdic = compute_gradient(J, FunctionControl("Velocity"), forget=False)
+    return dJdic.vector().get_local()
+
+if __name__ == "__main__":
+    ic = project(Expression("sin(2*pi*x[0])", degree=1), V, annotate=False)
+
+    if len(sys.argv) == 1:
+        u = main(ic)
+        adj_save_tape("burgers_tape")
+        numpy.save("burgers_tape_gradient.npy", gradient(u))
+        numpy.save("burgers_tape_solution.npy", u.vector().get_local())
+
+        assert subprocess.call([sys.executable, __file__, "load"]) == 0
+    else:
+        adj_load_tape("burgers_tape", [V])
+        u = main(ic)
+
+        # The saved tape is dropped as soon as its last equation is annotated
+        assert adjglobals.tape_loading is None
+
+        assert numpy.allclose(u.vector().get_local(), numpy.load("burgers_tape_solution.npy"), rtol=0.0, atol=1.0e-14)
+        assert numpy.allclose(gradient(u), numpy.load("burgers_tape_gradient.npy"), rtol=0.0, atol=1.0e-12)
+
+        # The loaded tape can be extended like any other
+        adj_inc_timestep()
+        solve(inner(TrialFunction(V), TestFunction(V))*dx == inner(u, TestFunction(V))*dx, u)
+
+        # The containers hold the values of each process, so a tape saved
+        # with a different number of processes is rejected
+        with open("burgers_tape.p0.json", "r") as f:
+            index = json.load(f)
+        index["nprocs"] += 1
+        with open("burgers_tape.p0.json", "w") as f:
+            json.dump(index, f)
+
+        adj_reset()
+        raised_exception = False
+        try:
+            adj_load_tape("burgers_tape", [V])
+        except libadjoint.exceptions.LibadjointErrorInvalidInputs:
+            raised_exception = True
+        assert raised_exception
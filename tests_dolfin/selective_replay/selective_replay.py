@@ -0,0 +1,65 @@
+"""
+Check that a change of a control that only enters the last timesteps only
+replays the equations downstream of it, and that the tangent linear model
+skips the equations that do not depend on the control, without changing
+the results.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import caching
+
+mesh = UnitIntervalMesh(20)
+V = FunctionSpace(mesh, "CG", 1)
+steps = 10
+
+def main(ic, late):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_new = Function(V, name="StateNext")
+
+    timestep = Constant(0.1)
+    a = u*v*dx + timestep*inner(grad(u), grad(v))*dx
+    L_early = u_*v*dx
+    L_late = (u_ + timestep*late)*v*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(steps):
+        solve(a == (L_late if i >= steps - 2 else L_early), u_new, bc)
+        u_.assign(u_new)
+        adj_inc_timestep()
+
+    return u_
+
+if __name__ == "__main__":
+    ic = interpolate(Expression("sin(pi*x[0])", degree=1), V, name="InitialState")
+    late = interpolate(Expression("x[0]", degree=1), V, name="LateSource")
+    u = main(ic, late)
+
+    parameters["adjoint"]["selective_replay"] = True
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+    rf = ReducedFunctional(J, [Control(ic), Control(late)])
+
+    late2 = interpolate(Expression("x[0]*x[0]", degree=2), V)
+    rf([ic, late])
+
+    # Only the late source changes
+    caching.reset_replay_statistics()
+    j = rf([ic, late2])
+    stats = caching.replay_statistics
+    assert stats["forward_skipped"] > 0
+    assert stats["forward_solves"] < stats["forward_skipped"]
+
+    parameters["adjoint"]["selective_replay"] = False
+    assert abs(rf([ic, late2]) - j) < 1.0e-14
+
+    tlm_control = FunctionControl("LateSource", perturbation=interpolate(Expression("1.0", degree=0), V))
+    full = [output.vector().copy() for (output, var) in compute_tlm(tlm_control, forget=False)]
+
+    parameters["adjoint"]["selective_replay"] = True
+    caching.reset_replay_statistics()
+    selective = [output.vector().copy() for (output, var) in compute_tlm(tlm_control, forget=False)]
+    assert caching.replay_statistics["tlm_skipped"] > 0
+    for (x, y) in zip(full, selective):
+        assert (x - y).norm("linf") < 1.0e-14
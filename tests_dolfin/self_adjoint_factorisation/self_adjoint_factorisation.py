@@ -0,0 +1,61 @@
+"""
+Check that the self-adjoint operators are detected, and that the forward
+replay and the adjoint solves of the heat equation share one cached
+factorisation without changing the gradient.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+from dolfin_adjoint import caching
+
+mesh = UnitSquareMesh(16, 16)
+V = FunctionSpace(mesh, "CG", 1)
+steps = 5
+
+# The replays must solve the forward equations to factorise their operators
+parameters["adjoint"]["selective_replay"] = False
+
+def main(ic):
+    u_ = ic.copy(deepcopy=True, name="State")
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    u_new = Function(V, name="StateNext")
+
+    timestep = Constant(0.01)
+    F = ((u - u_)/timestep*v + inner(grad(u), grad(v)))*dx
+    bc = DirichletBC(V, 1.0, "on_boundary")
+
+    for i in range(steps):
+        solve(lhs(F) == rhs(F), u_new, bc)
+        u_.assign(u_new)
+        adj_inc_timestep()
+    return u_
+
+def gradient(rf, ic, cache):
+    parameters["adjoint"]["cache_factorizations"] = cache
+    caching.factorisations.clear()
+    caching.factorisations.reset_statistics()
+    rf(ic)
+    dJdic = rf.derivative(forget=False)[0]
+    return (dJdic, caching.factorisations.statistics())
+
+if __name__ == "__main__":
+    u = TrialFunction(V)
+    v = TestFunction(V)
+    assert caching.is_self_adjoint(u*v*dx + inner(grad(u), grad(v))*dx) is True
+    assert caching.is_self_adjoint(u.dx(0)*v*dx) is False
+
+    ic = interpolate(Expression("sin(pi*x[0])*sin(pi*x[1])", degree=2), V, name="InitialState")
+    u = main(ic)
+    J = Functional(inner(u, u)*dx*dt[FINISH_TIME])
+    rf = ReducedFunctional(J, Control(ic))
+
+    (reference, stats) = gradient(rf, ic, False)
+
+    # One factorisation for all the forward and adjoint solves
+    (dJdic, stats) = gradient(rf, ic, True)
+    assert stats["misses"] == 1
+    assert stats["hits"] > steps
+    assert (dJdic.vector() - reference.vector()).norm("linf") < 1.0e-10*reference.vector().norm("linf")
+
+    parameters["adjoint"]["cache_factorizations"] = False
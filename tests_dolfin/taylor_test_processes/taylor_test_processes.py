@@ -0,0 +1,44 @@
+"""
+Check that the Taylor test gives the same remainders when the perturbed
+evaluations run in worker processes, and that the tape of the main process
+is left at the unperturbed control.
+"""
+
+from dolfin import *
+from dolfin_adjoint import *
+
+mesh = UnitIntervalMesh(20)
+V = FunctionSpace(mesh, "CG", 2)
+
+def main(ic):
+    u_ = ic.copy(deepcopy=True, name="Velocity")
+    u = Function(V, name="VelocityNext")
+    v = TestFunction(V)
+
+    nu = Constant(0.0001)
+    timestep = Constant(0.05)
+    F = ((u - u_)/timestep*v + u*u.dx(0)*v + nu*u.dx(0)*v.dx(0))*dx
+    bc = DirichletBC(V, 0.0, "on_boundary")
+
+    for i in range(4):
+        solve(F == 0, u, bc)
+        u_.assign(u)
+        adj_inc_timestep()
+    return u_
+
+if __name__ == "__main__":
+    ic = project(Expression("sin(2*pi*x[0])", degree=1), V, name="InitialCondition")
+    u = main(ic)
+
+    rf = ReducedFunctional(Functional(inner(u, u)*dx*dt[FINISH_TIME]), Control(ic))
+    direction = interpolate(Expression("cos(x[0])", degree=1), V)
+
+    serial = rf.taylor_test(ic, test_hessian=True, seed=1.0e-3, perturbation_direction=direction)
+    Jm = rf(ic)
+    parallel = rf.taylor_test(ic, test_hessian=True, seed=1.0e-3, perturbation_direction=direction, processes=3)
+    assert abs(serial - parallel) < 1.0e-8
+    assert parallel > 2.9
+
+    # The workers replayed the perturbations on their own copies of the tape
+    u_final = DolfinAdjointVariable(u).tape_value()
+    assert abs(assemble(inner(u_final, u_final)*dx) - Jm) < 1.0e-12*Jm